@@ -0,0 +1,221 @@
+"""Modo de respuesta adaptativo.
+
+Los resultados simples (un valor, una fila o una tabla corta de una
+dimensión y una métrica) se responden con plantillas deterministas en el
+formato 📊/📝, sin segunda llamada al LLM. Los demás se interpretan con un
+prompt compacto que resume cada columna con su tipo y rango, en lugar de
+enviar el repr de la lista de filas.
+"""
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from agent.tokens import message_tokens
+from data.results import QueryResult, column_unit, format_table
+
+# Filas máximas de una tabla dimensión × métrica que se responden con plantilla
+TEMPLATE_MAX_ROWS = int(os.getenv("ANSWER_TEMPLATE_MAX_ROWS", "5"))
+# Columnas máximas de una sola fila que se responden con plantilla
+TEMPLATE_MAX_COLUMNS = 4
+# Filas máximas que se leen para el resumen tipado del prompt compacto
+SUMMARY_MAX_ROWS = int(os.getenv("ANSWER_SUMMARY_MAX_ROWS", "10000"))
+
+# Palabras de la pregunta que piden el mínimo o el máximo (sin tildes); "más bajo" se revisa antes que "más"
+_MIN_WORDS = re.compile(r"\b(menor(es)?|minim[oa]s?|menos|mas baj[oa]s?|mas barat[oa]s?|peor(es)?)\b")
+_MAX_WORDS = re.compile(r"\b(mayor(es)?|maxim[oa]s?|mas|top|mejor(es)?|pico)\b")
+# Último ORDER BY de la consulta (el externo; los de OVER(...) suelen ir antes) y su primera clave
+_ORDER_BY = re.compile(r"\bORDER\s+BY\s+(.+?)(?:,|\bLIMIT\b|\)|;|$)", re.IGNORECASE | re.DOTALL)
+
+
+@dataclass
+class AnswerPlan:
+    """Cómo se responde una pregunta: plantilla (``answer``) o prompt para el LLM (``messages``)"""
+    mode: str  # "template", "compact" o "full"
+    answer: Optional[str] = None
+    messages: Optional[List[Dict[str, str]]] = None
+    prompt_tokens: int = 0
+    tokens_saved: int = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"answer_mode": self.mode, "prompt_tokens": self.prompt_tokens, "tokens_saved": self.tokens_saved}
+
+
+def _label(name: str) -> str:
+    return name.replace("_", " ").strip().capitalize()
+
+
+def _value(value: Any) -> str:
+    """Texto de un valor ya formateado por format_table"""
+    if value is None:
+        return "sin dato"
+    if isinstance(value, bool):
+        return "sí" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, (float, Decimal)):
+        return f"{float(value):,.2f}"
+    return str(value)
+
+
+def _is_numeric(field: pa.Field) -> bool:
+    return pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type)
+
+
+def _context(notes: List[str]) -> str:
+    if notes:
+        return "; ".join(notes)
+    return "Calculado directamente sobre los viajes de taxi de NY."
+
+
+def _question_direction(question: str) -> Optional[str]:
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    wants_min = bool(_MIN_WORDS.search(text))
+    wants_max = bool(_MAX_WORDS.search(_MIN_WORDS.sub(" ", text)))
+    if wants_min != wants_max:
+        return "min" if wants_min else "max"
+    return None
+
+
+def _sql_direction(sql: str, metric: str) -> Optional[str]:
+    matches = _ORDER_BY.findall(sql or "")
+    if not matches:
+        return None
+    key = matches[-1].strip()
+    expression = re.sub(r"\s+(ASC|DESC)\s*$", "", key, flags=re.IGNORECASE).strip("` ")
+    # Solo cuenta si se ordena por la métrica (por nombre o por posición), no por la dimensión
+    if expression != "2" and metric.lower() not in expression.lower():
+        return None
+    return "max" if re.search(r"\bDESC\s*$", key, re.IGNORECASE) else "min"
+
+
+def ranking_direction(question: str, sql: str, metric: str) -> Optional[str]:
+    """"min" o "max" según lo que pide la pregunta o, si no lo dice, el ORDER BY del SQL; None si no está claro"""
+    return _question_direction(question) or _sql_direction(sql, metric)
+
+
+def render_template(result: QueryResult, notes: Optional[List[str]] = None,
+                    question: str = "", sql: str = "") -> Optional[str]:
+    """Respuesta determinista para resultados simples; None si hace falta el LLM"""
+    notes = notes or []
+    fields = list(result.schema)
+    # Esquema y filas según los metadatos antes de leer lotes: la mayoría de los resultados no aplica
+    if result.total_rows is not None and not 0 < result.total_rows <= TEMPLATE_MAX_ROWS:
+        return None
+    ranked = len(fields) == 2 and _is_numeric(fields[1])
+    if len(fields) > TEMPLATE_MAX_COLUMNS or not (ranked or result.within(1)):
+        return None
+    head = result.head(TEMPLATE_MAX_ROWS + 1)
+    if head.num_rows == 0 or head.num_rows > TEMPLATE_MAX_ROWS:
+        return None
+    rows = format_table(head)
+
+    # Un solo registro: cada columna como "Etiqueta: valor"
+    if head.num_rows == 1:
+        values = [f"{_label(f.name)}: {_value(rows[0][f.name])}" for f in fields]
+        detail = "; ".join(values[1:])
+        context = f"{detail}. {_context(notes)}" if detail else _context(notes)
+        return f"📊 {values[0]}\n📝 {context}"
+
+    # Tabla corta de una dimensión y una métrica: el máximo o el mínimo pedido y el detalle completo
+    if ranked:
+        dimension, metric = fields[0].name, fields[1].name
+        direction = ranking_direction(question, sql, metric)
+        if direction is None:
+            return None
+        ranked = head.column(1).to_pylist()
+        present = [i for i, value in enumerate(ranked) if value is not None]
+        if not present:
+            return None
+        pick = min if direction == "min" else max
+        top = pick(present, key=lambda i: ranked[i])
+        detail = "; ".join(f"{_value(row[dimension])}: {_value(row[metric])}" for row in rows)
+        wording = "menor" if direction == "min" else "mayor"
+        return (f"📊 {_label(dimension)} con {wording} {metric.replace('_', ' ')}: {_value(rows[top][dimension])} "
+                f"({_value(rows[top][metric])})\n📝 {detail}. {_context(notes)}")
+    return None
+
+
+def _describe_column(field: pa.Field, column: pa.ChunkedArray) -> str:
+    # Los enteros (conteos) no llevan unidad aunque el nombre diga "total"
+    fractional = pa.types.is_floating(field.type) or pa.types.is_decimal(field.type)
+    unit = column_unit(field.name) if fractional else None
+    parts = [f"- {field.name} ({field.type}{', ' + unit if unit else ''})"]
+    if column.null_count == len(column):
+        return parts[0] + ": sin datos"
+    if _is_numeric(field) or pa.types.is_temporal(field.type):
+        bounds = pc.min_max(column)
+        parts.append(f": mín {_value(bounds['min'].as_py())}, máx {_value(bounds['max'].as_py())}")
+        if fractional:
+            parts.append(f", promedio {_value(pc.mean(column).as_py())}")
+    else:
+        parts.append(f": {pc.count_distinct(column).as_py()} valores distintos")
+    return "".join(parts)
+
+
+def summarize_result(result: QueryResult, notes: Optional[List[str]] = None, sample_rows: int = 5,
+                     max_rows: Optional[int] = None) -> str:
+    """Resumen tipado por columna más unas pocas filas de muestra.
+
+    Lee a lo más ``max_rows`` filas (SUMMARY_MAX_ROWS); si el resultado es más
+    grande, los rangos se calculan sobre esas filas y se indica en el resumen.
+    """
+    max_rows = SUMMARY_MAX_ROWS if max_rows is None else max_rows
+    table = result.head(max_rows)
+    # Con metadatos el total se conoce sin leer; si no, leer una fila más dice si hay más
+    total = result.row_count if result.within(max_rows) else result.total_rows
+    if total is None:
+        lines = [f"Filas: más de {max_rows:,} (rangos sobre las primeras {table.num_rows:,})", "Columnas:"]
+    elif total > table.num_rows:
+        lines = [f"Filas: {total:,} (rangos sobre las primeras {table.num_rows:,})", "Columnas:"]
+    else:
+        lines = [f"Filas: {total}", "Columnas:"]
+    lines.extend(_describe_column(f, table.column(i)) for i, f in enumerate(table.schema))
+
+    rows = format_table(table.slice(0, sample_rows))
+    lines.append(f"Primeras {len(rows)} filas:")
+    lines.append(" | ".join(table.column_names))
+    lines.extend(" | ".join(_value(value) for value in row.values()) for row in rows)
+    if notes:
+        lines.append(f"Nota: {'; '.join(notes)}")
+    return "\n".join(lines)
+
+
+def compact_interpretation_messages(question: str, summary: str) -> List[Dict[str, str]]:
+    """Prompt corto de interpretación sobre el resumen tipado"""
+    return [
+        {"role": "system", "content": "Eres un analista de datos de taxis de NY. Respondes en dos líneas, en español."},
+        {"role": "user", "content": (
+            f"Pregunta: {question}\nResultados:\n{summary}\n\n"
+            "Responde EXACTAMENTE así:\n📊 [dato principal con números y unidades: millas, USD, viajes]\n"
+            "📝 [contexto breve]"
+        )}
+    ]
+
+
+def plan_answer(question: str, result: QueryResult, notes: List[str],
+                full_messages: Optional[List[Dict[str, str]]] = None, mode: str = "adaptive",
+                sql: str = "") -> AnswerPlan:
+    """Elige plantilla, prompt compacto o prompt completo.
+
+    ``full_messages`` (el prompt completo) se usa en modo "llm"; en modo
+    adaptativo solo sirve para medir ``tokens_saved`` (0 si no se entrega).
+    """
+    full_tokens = message_tokens(full_messages) if full_messages else 0
+    if mode != "adaptive":
+        return AnswerPlan("full", messages=full_messages, prompt_tokens=full_tokens)
+
+    answer = render_template(result, notes, question, sql)
+    if answer is not None:
+        return AnswerPlan("template", answer=answer, tokens_saved=full_tokens)
+
+    messages = compact_interpretation_messages(question, summarize_result(result, notes))
+    tokens = message_tokens(messages)
+    saved = full_tokens - tokens if full_messages else 0
+    return AnswerPlan("compact", messages=messages, prompt_tokens=tokens, tokens_saved=saved)
@@ -0,0 +1,168 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from agent.chat_agent import GeminiAgent
+from agent.rate_limiter import PRIORITY_FOLLOWUP, RateLimitTimeout, is_rate_limited
+from observability.tracing import record_error, request_trace, span
+
+
+class AsyncScheduler:
+    """Limita cuántas conversaciones se procesan a la vez y ejecuta el trabajo bloqueante.
+
+    Las llamadas a BigQuery y Chroma son síncronas, así que se ejecutan en un
+    pool de hilos propio para no bloquear el event loop ni agotar el executor
+    por defecto de asyncio.
+    """
+
+    def __init__(self, max_concurrency: int = 200, max_workers: int = 64):
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-io")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def run_blocking(self, fn: Callable, *args, **kwargs) -> "asyncio.Future":
+        """Ejecuta una función bloqueante en el pool de hilos, con el contexto (traza) de quien la llama.
+
+        El trabajo se envía al pool en el momento de la llamada y se retorna un
+        future para ``await``: quien llama puede seguir con otra cosa mientras corre.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return loop.run_in_executor(self.executor, lambda: context.run(fn, *args, **kwargs))
+
+
+_default_scheduler: Optional[AsyncScheduler] = None
+
+
+def get_scheduler() -> AsyncScheduler:
+    """Scheduler compartido por todo el proceso"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = AsyncScheduler(
+            max_concurrency=int(os.getenv("AGENT_MAX_CONCURRENCY", "200")),
+            max_workers=int(os.getenv("AGENT_IO_WORKERS", "64"))
+        )
+    return _default_scheduler
+
+
+class AsyncGeminiAgent(GeminiAgent):
+    """Versión asíncrona del agente que atiende muchas sesiones en un solo proceso.
+
+    Cada sesión (``session_id``) tiene su propio historial de corto plazo; los
+    clientes de LLM, BigQuery y Chroma se comparten entre sesiones. Como una
+    instancia atiende varias sesiones a la vez, la traza y las métricas de cada
+    respuesta quedan en ``session_metrics[session_id]`` (``trace``, ``context``
+    y ``answer``) en lugar de ``last_trace`` y ``last_*_metrics``. En un proceso
+    de larga duración las sesiones se descartan tras ``session_ttl`` segundos
+    sin actividad o, si hay más de ``max_sessions``, la menos reciente.
+    """
+
+    def __init__(self, *args, scheduler: Optional[AsyncScheduler] = None,
+                 max_sessions: Optional[int] = None, session_ttl: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or get_scheduler()
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("AGENT_MAX_SESSIONS", "10000"))
+        self.session_ttl = session_ttl if session_ttl is not None else float(os.getenv("SESSION_TTL", str(24 * 3600)))
+        # Orden de uso (la más reciente al final) y momento del último uso de cada sesión
+        self.sessions: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self.session_metrics: Dict[Optional[str], Dict[str, Any]] = {}
+        self._session_seen: Dict[str, float] = {}
+
+    def _session_history(self, session_id: Optional[str]) -> List[Dict[str, str]]:
+        if session_id is None:
+            return self.conversation_history
+        now = time.monotonic()
+        history = self.sessions.setdefault(session_id, [])
+        self.sessions.move_to_end(session_id)
+        self._session_seen[session_id] = now
+        self._evict_sessions(now)
+        return history
+
+    def _evict_sessions(self, now: float) -> None:
+        """Descarta las sesiones vencidas y las menos recientes por sobre ``max_sessions``"""
+        while self.sessions:
+            oldest = next(iter(self.sessions))
+            if len(self.sessions) <= self.max_sessions and now - self._session_seen[oldest] <= self.session_ttl:
+                break
+            self.clear_session(oldest)
+
+    async def aget_response(self, query: str, session_id: Optional[str] = None,
+                            bypass_cache: bool = False) -> str:
+        with request_trace("aget_response", user_id=self.user_id, session_id=session_id) as trace:
+            call: Dict[str, Any] = {"trace": trace, "context": {}, "answer": {}}
+            with span("queue"):
+                await self.scheduler.semaphore.acquire()
+            try:
+                history = self._session_history(session_id)
+                self.session_metrics[session_id] = call
+                return await self._aget_response(query, history, bypass_cache, call)
+            finally:
+                self.scheduler.semaphore.release()
+
+    async def _aget_response(self, query: str, history: List[Dict[str, str]], bypass_cache: bool,
+                             call: Dict[str, Any]) -> str:
+        try:
+            with span("cache_lookup"):
+                cached = await self.scheduler.run_blocking(self._cached_answer, query, history, bypass_cache)
+            if cached is not None:
+                return cached
+
+            # Agregar la pregunta al historial
+            history.append({"role": "user", "content": query})
+            recent_history = self._recent_history(history)
+
+            # La búsqueda en Chroma corre en un hilo mientras se arma la parte fija y reciente del prompt
+            with span("history"):
+                persistent_future = self.scheduler.run_blocking(self._persistent_items, query)
+                prepared = self._prepare_context(recent_history)
+                messages, call["context"] = self._context_messages(await persistent_future, recent_history, prepared)
+
+            with span("sql_generation"):
+                response = await self.llm.ainvoke(messages)
+            sql_query = response.content
+
+            # Ejecutar la consulta SQL fuera del event loop
+            outcome = await self.scheduler.run_blocking(self._run_query, sql_query, query)
+
+            if isinstance(outcome, str):
+                return self._query_error_response(outcome)
+
+            # Plantilla determinista o interpretación del LLM según el resultado; puede leer lotes
+            # pendientes del resultado (resumen tipado), así que corre fuera del event loop
+            with span("answer_plan"):
+                plan = await self.scheduler.run_blocking(self._make_plan, query, *outcome, sql_query)
+            call["answer"] = plan.metrics()
+            if plan.answer is not None:
+                final_response = plan.answer
+            else:
+                with span("interpretation"):
+                    interpretation = await self.llm.ainvoke(plan.messages, priority=PRIORITY_FOLLOWUP)
+                final_response = self._format_answer(interpretation.content)
+
+            # Historial, memoria y caché se escriben en el pool de hilos
+            with span("memory_write"):
+                await self.scheduler.run_blocking(self._remember, query, sql_query, final_response, history)
+
+            return final_response
+
+        except Exception as e:
+            record_error("aget_response", e)
+            # Los 429 ya se reintentaron con backoff en el limitador compartido
+            if is_rate_limited(e) or isinstance(e, RateLimitTimeout):
+                return "Servicio ocupado, intenta de nuevo."
+            return self._exception_response(e)
+
+    def clear_session(self, session_id: str) -> None:
+        """Elimina el historial de corto plazo y las métricas de una sesión"""
+        self.sessions.pop(session_id, None)
+        self.session_metrics.pop(session_id, None)
+        self._session_seen.pop(session_id, None)
@@ -0,0 +1,53 @@
+"""Credenciales de la API y de los usuarios de la UI.
+
+``AGENT_API_KEY`` es la clave de servicio: quien la presenta (cabecera
+``X-API-Key``, p. ej. la UI de Streamlit) puede actuar por cualquier usuario.
+Cada usuario final recibe un token firmado con esa clave (``user_token``) que
+solo da acceso a su propio espacio de nombres (cabecera ``X-User-Token`` o
+``?user=...&token=...`` en la UI).
+Uso (desde ``src``) para emitir el token de un usuario::
+
+    python -m agent.auth <user_id>
+"""
+import hashlib
+import hmac
+import os
+import sys
+from typing import Optional
+
+
+def api_key() -> Optional[str]:
+    """Clave de servicio configurada (None si no hay)"""
+    return os.getenv("AGENT_API_KEY") or None
+
+
+def user_token(user_id: str, key: Optional[str] = None) -> str:
+    """Token de un usuario: HMAC-SHA256 de su ``user_id`` con la clave de servicio"""
+    key = key or api_key()
+    if not key:
+        raise ValueError("AGENT_API_KEY no está configurada")
+    return hmac.new(key.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _same(candidate: str, expected: str) -> bool:
+    # compare_digest solo acepta str ASCII: las cabeceras se comparan como bytes
+    return hmac.compare_digest(candidate.encode("utf-8"), expected.encode("utf-8"))
+
+
+def verify_api_key(candidate: Optional[str]) -> bool:
+    key = api_key()
+    return bool(key and candidate) and _same(candidate, key)
+
+
+def verify_user_token(user_id: Optional[str], token: Optional[str]) -> bool:
+    """True si ``token`` fue emitido para ``user_id`` con la clave de servicio actual"""
+    if not (api_key() and user_id and token):
+        return False
+    return _same(token, user_token(user_id))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python -m agent.auth <user_id>")
+        sys.exit(1)
+    print(user_token(sys.argv[1]))
@@ -1,272 +1,570 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+import hashlib
+import json
 import os
-from time import sleep
-from tenacity import retry, stop_after_attempt, wait_exponential
+from time import perf_counter
 from functools import lru_cache
-from typing import List, Dict
-from data.bigquery_client import BigQueryClient
-from memory.chroma_memory import ChromaMemory
+from typing import List, Dict, Optional, Iterator, Any, Tuple, Union
+from agent.answers import AnswerPlan, plan_answer
+from agent.context import PreparedContext
+from agent.rate_limiter import PRIORITY_FOLLOWUP, RateLimitTimeout, is_rate_limited
+from agent.resources import AgentResources, ConversationState
+from agent.response_cache import ResponseCache
+from data.results import QueryResult
+from observability.metrics import metrics as process_metrics
+from observability.tracing import RequestTrace, annotate, record_error, record_stage, request_trace, span
 from datetime import datetime
 
+# Ejemplos de consultas correctas; se incluyen solo los relevantes para la pregunta
+SQL_EXAMPLES = {
+    "hora": """Para tarifas por hora:
+```sql
+SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    COUNT(*) as total_viajes,
+    ROUND(AVG(fare_amount), 2) as tarifa_promedio,
+    ROUND(AVG(tip_amount), 2) as propina_promedio
+FROM {table_ref}
+WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)
+GROUP BY hora
+ORDER BY hora
+```""",
+    "dia": """Para análisis por día:
+```sql
+SELECT
+    CASE EXTRACT(DAYOFWEEK FROM pickup_datetime)
+        WHEN 1 THEN 'Domingo'
+        WHEN 2 THEN 'Lunes'
+        WHEN 3 THEN 'Martes'
+        WHEN 4 THEN 'Miércoles'
+        WHEN 5 THEN 'Jueves'
+        WHEN 6 THEN 'Viernes'
+        WHEN 7 THEN 'Sábado'
+    END as dia_semana,
+    COUNT(*) as total_viajes,
+    ROUND(AVG(trip_distance), 2) as distancia_promedio,
+    ROUND(AVG(total_amount), 2) as ingreso_promedio
+FROM {table_ref}
+GROUP BY dia_semana
+ORDER BY MIN(EXTRACT(DAYOFWEEK FROM pickup_datetime))
+```""",
+    "distancia": """Para distancias máximas:
+```sql
+SELECT
+    ROUND(trip_distance, 2) as distancia_millas,
+    ROUND(fare_amount, 2) as tarifa_usd,
+    pickup_datetime,
+    EXTRACT(HOUR FROM pickup_datetime) as hora
+FROM {table_ref}
+WHERE trip_distance > 0 AND trip_distance < 100
+ORDER BY trip_distance DESC
+LIMIT 5
+```""",
+}
+
+EXAMPLE_KEYWORDS = {
+    "hora": ["hora", "pico", "ocupad"],
+    "dia": ["dia", "semana"],
+    "distancia": ["distancia", "milla", "lejos", "largo"],
+}
+
+# Sección de campos usada cuando no hay catálogo de esquema disponible
+DEFAULT_SCHEMA_SECTION = """- trip_distance: distancia en MILLAS; filtrar > 0 y < 100
+- fare_amount: tarifa base en USD
+- tip_amount: propina en USD
+- total_amount: pago total en USD
+- pickup_datetime: fecha y hora de inicio
+- dropoff_datetime: fecha y hora de fin"""
+
+
+def select_examples(question: str) -> Tuple[str, ...]:
+    """Claves de los ejemplos relevantes para la pregunta (al menos uno)"""
+    text = ResponseCache.normalize(question)
+    keys = tuple(key for key, words in EXAMPLE_KEYWORDS.items() if any(word in text for word in words))
+    return keys or ("hora",)
+
+
+@lru_cache(maxsize=256)
+def build_system_prompt(table_ref: str, schema_section: str = DEFAULT_SCHEMA_SECTION,
+                        examples: Tuple[str, ...] = tuple(SQL_EXAMPLES)) -> str:
+    """System prompt para generar SQL; se arma por pregunta y se reutiliza entre sesiones"""
+    example_text = "\n\n".join(
+        f"{i}. {SQL_EXAMPLES[key].format(table_ref=table_ref)}" for i, key in enumerate(examples, 1)
+    )
+    return f"""Eres un analista especializado en datos de taxis de Nueva York que responde de manera rápida y precisa.
+
+Base de datos disponible: {table_ref}
+
+COLUMNAS RELEVANTES:
+{schema_section}
+- EXTRACT(HOUR FROM pickup_datetime) para hora del día
+- EXTRACT(DAYOFWEEK FROM pickup_datetime) para día de la semana (1=Domingo)
+
+EJEMPLOS DE CONSULTAS CORRECTAS:
+
+{example_text}
+
+REGLAS IMPORTANTES:
+1. SIEMPRE usa el nombre completo de la tabla
+2. NO uses LIMIT en medio de la consulta, solo al final
+3. Usa GROUP BY con los campos exactos del SELECT
+4. ROUND los valores numéricos a 2 decimales
+5. Incluye filtros WHERE apropiados
+
+NO agregues ningún texto adicional antes o después de la consulta SQL.
+"""
+
+
 class GeminiAgent:
-    def __init__(self):
-        # Asegurarse de que la API key esté configurada
-        if 'GOOGLE_API_KEY' not in os.environ:
-            raise ValueError("GOOGLE_API_KEY no está configurada en las variables de entorno")
-            
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-lite",  # Cambiado a flash-lite
-            #model="gemini-1.5-pro",
-            temperature=0.5,  # Reducida para respuestas más precisas
-            convert_system_message_to_human=True,
-            max_output_tokens=150,  # Reducido para respuestas más concisas
-            top_p=0.8,  # Añadido para mejor control de la generación
-            top_k=40  # Añadido para mejor control de la generación
-        )
-        
-        # Inicializar cliente de BigQuery
-        self.bq_client = BigQueryClient()
-        
-        # Obtener el esquema de la tabla
-        self.table_schema = self.bq_client.get_table_schema()
-        
-        # Inicializar memoria persistente
-        self.persistent_memory = ChromaMemory()
-        
-        # Modificar el system prompt para incluir contexto del historial
-        self.system_prompt = f"""Eres un analista especializado en datos de taxis de Nueva York que responde de manera rápida y precisa.
+    def __init__(self, use_cache: bool = True, llm=None, bq_client=None, memory=None,
+                 user_id: Optional[str] = None, resources: Optional[AgentResources] = None,
+                 state: Optional[ConversationState] = None):
+        # Recursos pesados compartidos; los clientes sueltos pueden inyectarse (p. ej. dobles de prueba)
+        if resources is None:
+            resources = AgentResources(llm=llm, bq_client=bq_client, memory=memory)
+        self.resources = resources
+        self.llm = resources.llm
+        self.bq_client = resources.bq_client
+        self.table_schema = resources.table_schema
+        self.persistent_memory = resources.memory
+        self.response_cache = resources.response_cache
+        self.use_cache = use_cache
         
-        Base de datos disponible: {self.bq_client.project_id}.{self.bq_client.dataset_id}.{self.bq_client.table_id}
+        # Estado de la sesión: espacio de nombres del usuario y memoria a corto plazo
+        self.state = state or ConversationState(user_id=user_id)
+        self.user_id = self.state.user_id
         
-        IMPORTANTE - UNIDADES Y CAMPOS:
-        1. 🚕 Distancias (trip_distance):
-           - Están en MILLAS
-           - Filtrar trip_distance > 0
-           - Filtrar trip_distance < 100 para excluir valores atípicos
+        self.schema_catalog = resources.schema_catalog
+        self.validator = resources.validator
+        self.context_builder = resources.context_builder
+        self.last_context_metrics: Dict[str, Any] = {}
+        self.table_ref = f"{self.bq_client.project_id}.{self.bq_client.dataset_id}.{self.bq_client.table_id}"
         
-        2. 💰 Tarifas y Pagos:
-           - fare_amount: tarifa base en USD
-           - tip_amount: propina en USD
-           - total_amount: pago total en USD
+        # Modo de respuesta: "adaptive" (plantillas y prompt compacto) o "llm" (siempre el prompt completo)
+        self.answer_mode = os.getenv("ANSWER_MODE", "adaptive")
+        # Tokens ahorrados frente al prompt completo (ANSWER_MEASURE_SAVINGS=1): arma ese prompt aunque no se use
+        self.measure_savings = os.getenv("ANSWER_MEASURE_SAVINGS") == "1"
+        self.last_answer_metrics: Dict[str, Any] = {}
         
-        3. ⏰ Campos de Tiempo:
-           - pickup_datetime: fecha y hora de inicio
-           - dropoff_datetime: fecha y hora de fin
-           - EXTRACT(HOUR FROM pickup_datetime) para hora del día
-           - EXTRACT(DAYOFWEEK FROM pickup_datetime) para día de la semana (1=Domingo)
-        
-        EJEMPLOS DE CONSULTAS CORRECTAS:
-
-        1. Para tarifas por hora:
-        ```sql
-        SELECT 
-            EXTRACT(HOUR FROM pickup_datetime) as hora,
-            COUNT(*) as total_viajes,
-            ROUND(AVG(fare_amount), 2) as tarifa_promedio,
-            ROUND(AVG(tip_amount), 2) as propina_promedio
-        FROM {self.bq_client.project_id}.{self.bq_client.dataset_id}.{self.bq_client.table_id}
-        WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)
-        GROUP BY hora
-        ORDER BY hora
-        ```
-
-        2. Para análisis por día:
-        ```sql
-        SELECT 
-            CASE EXTRACT(DAYOFWEEK FROM pickup_datetime)
-                WHEN 1 THEN 'Domingo'
-                WHEN 2 THEN 'Lunes'
-                WHEN 3 THEN 'Martes'
-                WHEN 4 THEN 'Miércoles'
-                WHEN 5 THEN 'Jueves'
-                WHEN 6 THEN 'Viernes'
-                WHEN 7 THEN 'Sábado'
-            END as dia_semana,
-            COUNT(*) as total_viajes,
-            ROUND(AVG(trip_distance), 2) as distancia_promedio,
-            ROUND(AVG(total_amount), 2) as ingreso_promedio
-        FROM {self.bq_client.project_id}.{self.bq_client.dataset_id}.{self.bq_client.table_id}
-        GROUP BY dia_semana
-        ORDER BY MIN(EXTRACT(DAYOFWEEK FROM pickup_datetime))
-        ```
-
-        3. Para distancias máximas:
-        ```sql
-        SELECT 
-            ROUND(trip_distance, 2) as distancia_millas,
-            ROUND(fare_amount, 2) as tarifa_usd,
-            pickup_datetime,
-            EXTRACT(HOUR FROM pickup_datetime) as hora
-        FROM {self.bq_client.project_id}.{self.bq_client.dataset_id}.{self.bq_client.table_id}
-        WHERE trip_distance > 0 AND trip_distance < 100
-        ORDER BY trip_distance DESC
-        LIMIT 5
-        ```
-
-        REGLAS IMPORTANTES:
-        1. SIEMPRE usa el nombre completo de la tabla
-        2. NO uses LIMIT en medio de la consulta, solo al final
-        3. Usa GROUP BY con los campos exactos del SELECT
-        4. ROUND los valores numéricos a 2 decimales
-        5. Incluye filtros WHERE apropiados
-        
-        NO agregues ningún texto adicional antes o después de la consulta SQL.
-        """
+        # System prompt completo (sin pregunta); por pregunta se usa system_prompt_for
+        self.system_prompt = self.system_prompt_for("")
 
-        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation_history: List[Dict[str, str]] = self.state.history
         self.max_history = 3  # Reducido de 5 a 3 para el modelo flash-lite
-    
-    def _get_relevant_history(self) -> List[Dict[str, str]]:
+        self.last_stream_metrics: Dict[str, Any] = {}
+        self.last_trace: Optional[RequestTrace] = None
+
+    def _get_relevant_history(self, history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
         """Obtiene el historial relevante combinando memoria a corto y largo plazo"""
         # Obtener historial reciente de la memoria en RAM
-        recent_history = self.conversation_history[-self.max_history:]
-        
+        recent_history = self._recent_history(history)
+
         # Obtener historial relevante de Chroma
-        persistent_history = self.persistent_memory.get_relevant_history(
-            query=recent_history[-1]["content"] if recent_history else "",
-            n_results=3
-        )
+        persistent_items = self._persistent_items(recent_history[-1]["content"] if recent_history else "")
+
+        return self._build_messages(persistent_items, recent_history)
+
+    def _persistent_items(self, question: str, n_results: int = 3) -> List[Dict[str, Any]]:
+        """Interacciones relevantes de la memoria persistente, con su similitud y antigüedad"""
+        if hasattr(self.persistent_memory, "get_relevant_items"):
+            return self.persistent_memory.get_relevant_items(query=question, n_results=n_results,
+                                                             user_id=self.user_id)
+        # Memorias sin puntajes: la relevancia sigue el orden en que se retornan
+        history = self.persistent_memory.get_relevant_history(query=question, n_results=n_results,
+                                                              user_id=self.user_id)
+        pairs = list(zip(history[::2], history[1::2]))
+        return [
+            {"question": q["content"], "answer": a["content"], "relevance": 1 - i / (len(pairs) + 1)}
+            for i, (q, a) in enumerate(pairs)
+        ]
+
+    def _recent_history(self, history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+        """Últimos turnos de la memoria a corto plazo"""
+        history = self.conversation_history if history is None else history
+        return history[-self.max_history:]
+
+    def system_prompt_for(self, question: str) -> str:
+        """System prompt con solo las columnas y ejemplos relevantes para la pregunta"""
+        schema_section = self.schema_catalog.schema_section(question) if self.schema_catalog else ""
+        examples = select_examples(question) if question else tuple(SQL_EXAMPLES)
+        return build_system_prompt(self.table_ref, schema_section or DEFAULT_SCHEMA_SECTION, examples)
+
+    def _prepare_context(self, recent_history: List[Dict[str, str]]) -> PreparedContext:
+        """System prompt de la pregunta y turnos recientes (lo que no depende de Chroma)"""
+        question = recent_history[-1]["content"] if recent_history else ""
+        return self.context_builder.prepare(self.system_prompt_for(question), recent_history)
+
+    def _context_messages(self, persistent_items: List[Dict[str, Any]], recent_history: List[Dict[str, str]],
+                          prepared: Optional[PreparedContext] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Mensajes del prompt y métricas de contexto de esta solicitud"""
+        prepared = prepared or self._prepare_context(recent_history)
+        messages, metrics = self.context_builder.merge(prepared, persistent_items)
+        annotate(context_tokens=metrics["context_tokens"])
+        return messages, metrics
+
+    def _build_messages(self, persistent_items: List[Dict[str, Any]], recent_history: List[Dict[str, str]],
+                        prepared: Optional[PreparedContext] = None) -> List[Dict[str, str]]:
+        """System prompt, memoria y turnos recientes dentro del presupuesto de tokens"""
+        messages, self.last_context_metrics = self._context_messages(persistent_items, recent_history, prepared)
+        return messages
+    
+    @staticmethod
+    def _clean_sql(query: str) -> str:
+        """Extrae el SQL de la respuesta del LLM y asegura un LIMIT"""
+        # Limpia la consulta SQL
+        query = query.strip()
+        
+        # Extraer la consulta SQL entre backticks o sql
+        if "```" in query:
+            parts = query.split("```")
+            for part in parts:
+                if "SELECT" in part.upper():
+                    query = part.strip()
+                    break
+        
+        # Remover prefijo 'sql' si existe
+        if query.lower().startswith('sql'):
+            query = query[3:].strip()
         
-        # Combinar historiales y agregar el system prompt
-        return ([{"role": "system", "content": self.system_prompt}] + 
-                persistent_history + recent_history)
+        # Asegurarse de que la consulta tenga un LIMIT
+        if query.upper().startswith('SELECT') and "LIMIT" not in query.upper():
+            query += " LIMIT 1000"
+        return query
     
-    def _execute_query(self, query: str) -> str:
-        """Ejecuta una consulta SQL y formatea los resultados"""
+    def _repair_sql(self, sql: str, error: str, question: str) -> str:
+        """Un solo intento de corrección, con el prompt del sistema y sin historial"""
+        messages = [
+            {"role": "system", "content": self.system_prompt_for(question)},
+            {"role": "user", "content": (
+                f"Pregunta: {question}\nEsta consulta SQL falló:\n{sql}\nError: {error}\n"
+                "Corrígela y responde SOLO con la consulta SQL."
+            )}
+        ]
+        return self._clean_sql(self.llm.invoke(messages, priority=PRIORITY_FOLLOWUP).content)
+    
+    def _run_query(self, query: str, question: str = "") -> Union[str, Tuple[QueryResult, List[str]]]:
+        """Valida y ejecuta una consulta SQL; retorna (resultado, notas) o un mensaje de error"""
         try:
-            # Limpia la consulta SQL
-            query = query.strip()
-            
-            # Extraer la consulta SQL entre backticks o sql
-            if "```" in query:
-                parts = query.split("```")
-                for part in parts:
-                    if "SELECT" in part.upper():
-                        query = part.strip()
-                        break
-            
-            # Remover prefijo 'sql' si existe
-            if query.lower().startswith('sql'):
-                query = query[3:].strip()
+            query = self._clean_sql(query)
             
             # Validar que la consulta comience con SELECT
             if not query.upper().strip().startswith('SELECT'):
                 return "Error: La consulta debe comenzar con SELECT"
             
-            # Asegurarse de que la consulta tenga un LIMIT
-            if "LIMIT" not in query.upper():
-                query += " LIMIT 1000"
+            # Validación local y estimación de costo antes de ejecutar; SQL inválido se corrige una vez
+            with span("validation"):
+                validation = self.validator.validate(query)
+                if validation.repairable:
+                    query = self._repair_sql(query, validation.error, question)
+                    validation = self.validator.validate(query)
+            if validation.estimated_bytes is not None:
+                annotate(estimated_bytes=validation.estimated_bytes)
+            if not validation.ok:
+                return f"Error en la consulta: {validation.error}"
+            
+            # En modo especulativo el embedding de la pregunta para la caché se calcula mientras corre
+            speculative = self.resources.speculative_executor
+            if speculative is not None and self.use_cache and question:
+                speculative.submit(self.response_cache.prepare, question)
             
             # Ejecutar la consulta
-            results = self.bq_client.query_data(query)
+            with span("query"):
+                results = self.bq_client.query_data(validation.sql)
             if isinstance(results, str):  # Es un mensaje de error
                 return f"Error en la consulta: {results}"
             
-            # Formatea los resultados para mejor legibilidad
             if not results:
                 return "La consulta no retornó resultados"
-            
-            # Formatea los resultados de manera más amigable
-            formatted_results = []
-            for row in results[:5]:
-                formatted_row = {}
-                for key, value in row.items():
-                    # Formatea números decimales a 2 lugares
-                    if isinstance(value, float):
-                        if 'distance' in key.lower():
-                            formatted_row[key] = f"{value:.2f} millas"
-                        elif any(word in key.lower() for word in ['fare', 'amount', 'total', 'tip']):
-                            formatted_row[key] = f"${value:.2f}"
-                        else:
-                            formatted_row[key] = f"{value:.2f}"
-                    else:
-                        formatted_row[key] = value
-                formatted_results.append(formatted_row)
-            
-            return formatted_results
+            if not isinstance(results, QueryResult):
+                results = QueryResult.from_pylist(results)
+            return results, validation.notes
             
         except Exception as e:
+            record_error("run_query", e)
             return f"Error ejecutando la consulta: {str(e)}"
     
-    @retry(
-        stop=stop_after_attempt(2),
-        wait=wait_exponential(multiplier=1, min=1, max=5),  # Tiempos más cortos
-        retry_error_callback=lambda _: "Servicio ocupado, intenta de nuevo."
-    )
-    def get_response(self, query: str) -> str:
+    @staticmethod
+    def _preview(result: QueryResult, notes: List[str]) -> List[Dict[str, Any]]:
+        """Primeras filas formateadas (solo esas se convierten a Python), con las notas de la validación"""
+        preview = result.preview(5)
+        if notes:
+            preview.append({"nota": "; ".join(notes)})
+        return preview
+    
+    def _execute_query(self, query: str, question: str = "") -> str:
+        """Valida, ejecuta una consulta SQL y formatea los resultados"""
+        outcome = self._run_query(query, question)
+        if isinstance(outcome, str):
+            return outcome
+        return self._preview(*outcome)
+    
+    def _make_plan(self, question: str, result: QueryResult, notes: List[str], sql: str = "") -> AnswerPlan:
+        """Plantilla para resultados simples; prompt compacto o completo para el resto"""
+        full_messages = None
+        if self.answer_mode != "adaptive" or self.measure_savings:
+            full_messages = self._interpretation_messages(self._preview(result, notes))
+        plan = plan_answer(question, result, notes, full_messages, self.answer_mode,
+                           self._clean_sql(sql) if sql else "")
+        annotate(**plan.metrics())
+        return plan
+
+    def _plan_answer(self, question: str, result: QueryResult, notes: List[str], sql: str = "") -> AnswerPlan:
+        """``_make_plan`` guardando sus métricas en ``last_answer_metrics``"""
+        plan = self._make_plan(question, result, notes, sql)
+        self.last_answer_metrics = plan.metrics()
+        return plan
+    
+    def _cache_scope(self, history: List[Dict[str, str]]) -> str:
+        """Contexto de la caché de respuestas: vacío sin historial, o usuario y turnos previos a la pregunta.
+
+        Sin historial la pregunta se entiende sola y la respuesta se comparte
+        entre usuarios; una pregunta de seguimiento solo se reutiliza dentro de
+        la misma conversación.
+        """
+        previous = history[-self.max_history * 2:]
+        if not previous:
+            return ""
+        payload = json.dumps([self.user_id, previous], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _cached_answer(self, query: str, history: List[Dict[str, str]], bypass_cache: bool) -> Optional[str]:
+        """Consulta la caché antes de llamar al LLM o a BigQuery"""
+        if not self.use_cache or bypass_cache:
+            return None
+        cached = self.response_cache.get(query, scope=self._cache_scope(history))
+        process_metrics.inc("cache_requests_total", cache="response", result="miss" if cached is None else "hit")
+        if cached is None:
+            return None
+        history.append({"role": "user", "content": query})
+        history.append({"role": "assistant", "content": cached.answer})
+        self._trim_history(history)
+        return cached.answer
+
+    @staticmethod
+    def _query_error_response(results: str) -> str:
+        return f"📊 {results}\n📝 Por favor, reformula tu pregunta para obtener la información deseada."
+
+    @staticmethod
+    def _interpretation_messages(results) -> List[Dict[str, str]]:
+        """Prompt para interpretar los resultados de la consulta"""
+        interpretation_prompt = f"""
+        Como analista de datos de taxis de NY, interpreta estos resultados: {results}
+        
+        REGLAS:
+        1. DEBES usar EXACTAMENTE este formato:
+        📊 [Dato principal con números y unidades]
+        📝 [Contexto o explicación relevante]
+        
+        2. Usa las unidades correctas:
+           - Distancias en MILLAS
+           - Dinero en USD
+           - Tiempo en horas/minutos
+           - Conteos en número de viajes
+        
+        3. La explicación debe ser informativa pero breve
+        
+        Ejemplos de formato:
+        📊 El promedio de viajes los lunes es 15,230 viajes
+        📝 Esto representa un 20% más que los fines de semana
+        
+        📊 La tarifa promedio en hora pico es $25.50 USD
+        📝 Las tarifas son 30% más altas entre 5-7 PM
+        
+        📊 La distancia promedio es 3.2 millas por viaje
+        📝 90% de los viajes son menores a 5 millas
+        """
+
+        return [
+            {"role": "system", "content": "Eres un analista experto en datos de taxis de NY. Tus interpretaciones son siempre precisas y útiles."},
+            {"role": "user", "content": interpretation_prompt}
+        ]
+
+    @staticmethod
+    def _format_answer(content: str) -> str:
+        if not content.startswith("📊"):
+            content = f"📊 {content}"
+        return content
+
+    def _remember(self, query: str, sql_query: str, final_response: str,
+                  history: List[Dict[str, str]]) -> None:
+        """Agrega la respuesta al historial, a la memoria persistente y a la caché"""
+        # El último turno del historial es la pregunta; el contexto es lo anterior
+        scope = self._cache_scope(history[:-1])
+        history.append({"role": "assistant", "content": final_response})
+        self._trim_history(history)
+
+        self.persistent_memory.add_interaction(
+            question=query,
+            answer=final_response,
+            metadata={"timestamp": str(datetime.now())},
+            user_id=self.user_id
+        )
+
+        if self.use_cache:
+            self.response_cache.put(query, sql=sql_query, answer=final_response, scope=scope)
+
+    @staticmethod
+    def _exception_response(e: Exception) -> str:
+        return f"📊 Error: {str(e)}\n📝 Por favor, intenta de nuevo con una pregunta diferente."
+
+    def get_response(self, query: str, bypass_cache: bool = False) -> str:
+        with request_trace("get_response", user_id=self.user_id) as trace:
+            self.last_trace = trace
+            try:
+                with span("cache_lookup"):
+                    cached = self._cached_answer(query, self.conversation_history, bypass_cache)
+                if cached is not None:
+                    return cached
+
+                # Agregar la pregunta al historial
+                self.conversation_history.append({"role": "user", "content": query})
+
+                # Obtener respuesta usando el historial
+                with span("history"):
+                    messages = self._get_relevant_history()
+                with span("sql_generation"):
+                    response = self.llm.invoke(messages)
+                content = response.content
+
+                # Extraer y ejecutar la consulta SQL
+                sql_query = content
+                outcome = self._run_query(sql_query, query)
+
+                if isinstance(outcome, str):
+                    return self._query_error_response(outcome)
+
+                # Plantilla determinista o interpretación del LLM según el resultado
+                with span("answer_plan"):
+                    plan = self._plan_answer(query, *outcome, sql_query)
+                if plan.answer is not None:
+                    final_response = plan.answer
+                else:
+                    with span("interpretation"):
+                        interpretation = self.llm.invoke(plan.messages, priority=PRIORITY_FOLLOWUP)
+                    final_response = self._format_answer(interpretation.content)
+
+                # Agregar al historial y memoria
+                with span("memory_write"):
+                    self._remember(query, sql_query, final_response, self.conversation_history)
+
+                return final_response
+
+            except Exception as e:
+                record_error("get_response", e)
+                # Los 429 ya se reintentaron con backoff en el limitador compartido
+                if is_rate_limited(e) or isinstance(e, RateLimitTimeout):
+                    return "Servicio ocupado, intenta de nuevo."
+                return self._exception_response(e)
+
+    def stream_response(self, query: str, bypass_cache: bool = False) -> Iterator[Dict[str, Any]]:
+        """Genera la respuesta como una secuencia de eventos.
+
+        Eventos emitidos (campo ``type``): ``sql``, ``query_started``, ``rows``
+        (vista previa y ``count``, None si el motor no informa el total),
+        ``token`` (fragmentos de la interpretación), ``error`` y al final
+        ``done`` con la respuesta completa y las métricas (``ttft_s``, ``total_s``,
+        ``trace_id`` y ``stages_ms``).
+        La interacción se guarda en memoria solo si el stream se consume completo.
+        """
+        with request_trace("stream_response", user_id=self.user_id) as trace:
+            self.last_trace = trace
+            yield from self._stream_events(query, bypass_cache, trace)
+
+    def _stream_events(self, query: str, bypass_cache: bool, trace: RequestTrace) -> Iterator[Dict[str, Any]]:
+        start = perf_counter()
+        metrics: Dict[str, Any] = {"ttft_s": None, "total_s": None, "cached": False}
+
+        def done(answer: str) -> Dict[str, Any]:
+            metrics["total_s"] = perf_counter() - start
+            metrics["trace_id"] = trace.trace_id
+            metrics["stages_ms"] = {stage: round(s * 1000, 1) for stage, s in trace.stages.items()}
+            self.last_stream_metrics = metrics
+            return {"type": "done", "answer": answer, "metrics": metrics}
+
         try:
+            with span("cache_lookup"):
+                cached = self._cached_answer(query, self.conversation_history, bypass_cache)
+            if cached is not None:
+                metrics["cached"] = True
+                metrics["ttft_s"] = perf_counter() - start
+                yield {"type": "token", "text": cached}
+                yield done(cached)
+                return
+
             # Agregar la pregunta al historial
             self.conversation_history.append({"role": "user", "content": query})
-            
-            # Obtener respuesta usando el historial
-            messages = self._get_relevant_history()
-            response = self.llm.invoke(messages)
-            content = response.content
-            
-            # Extraer y ejecutar la consulta SQL
-            sql_query = content
-            results = self._execute_query(sql_query)
-            
-            if isinstance(results, str) and "Error" in results:
-                return f"📊 {results}\n📝 Por favor, reformula tu pregunta para obtener la información deseada."
-            
-            # Generar interpretación de resultados
-            interpretation_prompt = f"""
-            Como analista de datos de taxis de NY, interpreta estos resultados: {results}
-            
-            REGLAS:
-            1. DEBES usar EXACTAMENTE este formato:
-            📊 [Dato principal con números y unidades]
-            📝 [Contexto o explicación relevante]
-            
-            2. Usa las unidades correctas:
-               - Distancias en MILLAS
-               - Dinero en USD
-               - Tiempo en horas/minutos
-               - Conteos en número de viajes
-            
-            3. La explicación debe ser informativa pero breve
-            
-            Ejemplos de formato:
-            📊 El promedio de viajes los lunes es 15,230 viajes
-            📝 Esto representa un 20% más que los fines de semana
-            
-            📊 La tarifa promedio en hora pico es $25.50 USD
-            📝 Las tarifas son 30% más altas entre 5-7 PM
-            
-            📊 La distancia promedio es 3.2 millas por viaje
-            📝 90% de los viajes son menores a 5 millas
-            """
-            
-            interpretation = self.llm.invoke([
-                {"role": "system", "content": "Eres un analista experto en datos de taxis de NY. Tus interpretaciones son siempre precisas y útiles."},
-                {"role": "user", "content": interpretation_prompt}
-            ])
-            
-            final_response = interpretation.content
-            if not final_response.startswith("📊"):
-                final_response = f"📊 {final_response}"
-            
-            # Agregar al historial y memoria
-            self.conversation_history.append({"role": "assistant", "content": final_response})
-            if len(self.conversation_history) > self.max_history * 2:
-                self.conversation_history = self.conversation_history[-self.max_history * 2:]
-            
-            self.persistent_memory.add_interaction(
-                question=query,
-                answer=final_response,
-                metadata={"timestamp": str(datetime.now())}
-            )
-            
-            return final_response
-            
+
+            # Generar la consulta SQL
+            with span("history"):
+                messages = self._get_relevant_history()
+            metrics["context_tokens"] = self.last_context_metrics.get("context_tokens")
+            with span("sql_generation"):
+                sql_query = self.llm.invoke(messages).content
+            yield {"type": "sql", "sql": sql_query}
+
+            yield {"type": "query_started"}
+            outcome = self._run_query(sql_query, query)
+
+            if isinstance(outcome, str):
+                answer = self._query_error_response(outcome)
+                yield {"type": "error", "message": answer}
+                yield done(answer)
+                return
+
+            result, notes = outcome
+            # Total según los metadatos del job: contar con len() leería todos los lotes
+            yield {"type": "rows", "rows": self._preview(result, notes), "count": result.row_count}
+
+            with span("answer_plan"):
+                plan = self._plan_answer(query, result, notes, sql_query)
+            metrics.update(plan.metrics())
+            if plan.answer is not None:
+                metrics["ttft_s"] = perf_counter() - start
+                yield {"type": "token", "text": plan.answer}
+                with span("memory_write"):
+                    self._remember(query, sql_query, plan.answer, self.conversation_history)
+                yield done(plan.answer)
+                return
+
+            # Transmitir la interpretación a medida que llegan los tokens
+            parts: List[str] = []
+            interpretation_start = perf_counter()
+            for chunk in self.llm.stream(plan.messages, priority=PRIORITY_FOLLOWUP):
+                text = chunk.content if isinstance(chunk.content, str) else "".join(
+                    part if isinstance(part, str) else part.get("text", "") for part in chunk.content
+                )
+                if not text:
+                    continue
+                if not parts:
+                    metrics["ttft_s"] = perf_counter() - start
+                    if not text.startswith("📊"):
+                        text = f"📊 {text}"
+                parts.append(text)
+                yield {"type": "token", "text": text}
+            # Sin span alrededor de los yield: incluye lo que el consumidor tarda entre fragmentos
+            record_stage("interpretation", perf_counter() - interpretation_start)
+
+            final_response = self._format_answer("".join(parts))
+            with span("memory_write"):
+                self._remember(query, sql_query, final_response, self.conversation_history)
+            yield done(final_response)
+
         except Exception as e:
-            if "429" in str(e):
-                sleep(1)
-                raise
-            return f"📊 Error: {str(e)}\n📝 Por favor, intenta de nuevo con una pregunta diferente."
+            record_error("stream_response", e)
+            busy = is_rate_limited(e) or isinstance(e, RateLimitTimeout)
+            answer = "Servicio ocupado, intenta de nuevo." if busy else self._exception_response(e)
+            yield {"type": "error", "message": answer}
+            yield done(answer)
+
+    def _trim_history(self, history: Optional[List[Dict[str, str]]] = None):
+        """Mantiene solo los últimos turnos en la memoria de corto plazo"""
+        history = self.conversation_history if history is None else history
+        if len(history) > self.max_history * 2:
+            del history[:-self.max_history * 2]
 
     def clear_history(self):
         """Limpiar todo el historial"""
-        self.conversation_history = []
-        self.persistent_memory.clear_memory() 
\ No newline at end of file
+        self.conversation_history.clear()
+        self.persistent_memory.clear_memory(user_id=self.user_id)
+        # La caché de respuestas es compartida; solo se limpia si no hay espacio de nombres
+        if self.user_id is None:
+            self.response_cache.clear()
@@ -0,0 +1,167 @@
+"""Armado del contexto del prompt con presupuesto de tokens.
+
+El prompt de generación de SQL siempre lleva el system prompt y la pregunta
+actual. El resto del presupuesto se reparte entre los turnos recientes (en
+orden, del más nuevo al más viejo) y las interacciones de la memoria
+persistente con relevancia suficiente, puntuadas por relevancia y antigüedad. Lo que no cabe completo se
+comprime a pregunta + primera línea de la respuesta, y si tampoco cabe se
+descarta. Las interacciones que ya están en el historial reciente no se repiten.
+La parte fija y reciente (``prepare``) no depende de la memoria persistente,
+así que puede armarse mientras corre la búsqueda en Chroma (``merge``).
+"""
+import os
+import time
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.tokens import TOKENS_PER_MESSAGE, estimate_tokens, message_tokens
+
+
+@lru_cache(maxsize=256)
+def static_prefix_tokens(system_prompt: str) -> int:
+    """Tokens del system prompt; se calcula una vez por variante del prompt"""
+    return TOKENS_PER_MESSAGE + estimate_tokens(system_prompt)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower().strip())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def _compress(answer: str) -> str:
+    """Primera línea de la respuesta (el dato 📊)"""
+    return answer.strip().splitlines()[0] if answer.strip() else answer
+
+
+@dataclass
+class _Candidate:
+    messages: List[Dict[str, str]]
+    compressed: List[Dict[str, str]]
+    score: float
+    order: float
+    source: str  # "recent" o "persistent"
+
+
+@dataclass
+class PreparedContext:
+    """System prompt, pregunta y turnos recientes, listos para sumar la memoria persistente"""
+    system: Dict[str, str]
+    question: List[Dict[str, str]]
+    previous: List[Dict[str, str]]
+    system_tokens: int
+    used: int
+    recent: List[_Candidate]
+
+
+class ContextBuilder:
+    """Arma los mensajes del prompt sin pasar de ``max_tokens``"""
+
+    def __init__(self, max_tokens: Optional[int] = None, min_relevance: Optional[float] = None,
+                 relevance_weight: float = 0.7, recency_half_life_hours: float = 24):
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.getenv("CONTEXT_MAX_TOKENS", "1000"))
+        self.min_relevance = min_relevance if min_relevance is not None else float(
+            os.getenv("CONTEXT_MIN_RELEVANCE", "0.3"))
+        self.relevance_weight = relevance_weight
+        self.recency_half_life = recency_half_life_hours * 3600
+
+    def _score(self, item: Dict[str, Any], now: float) -> float:
+        relevance = float(item.get("relevance", 0.5))
+        age = max(0.0, now - float(item.get("ts") or now))
+        recency = 0.5 ** (age / self.recency_half_life) if self.recency_half_life > 0 else 1.0
+        return self.relevance_weight * relevance + (1 - self.relevance_weight) * recency
+
+    @staticmethod
+    def _recent_candidates(previous: List[Dict[str, str]]) -> List[_Candidate]:
+        # Turnos recientes (pregunta + respuesta): siempre antes que la memoria persistente, el más nuevo primero
+        turns: List[List[Dict[str, str]]] = []
+        for message in previous:
+            if message["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        candidates = []
+        for position, turn in enumerate(turns):
+            compressed = [dict(m, content=_compress(m["content"])) if m["role"] == "assistant" else m for m in turn]
+            candidates.append(_Candidate(turn, compressed, 2.0 + position / 100, position, "recent"))
+        return candidates
+
+    def _persistent_candidates(self, persistent_items: List[Dict[str, Any]],
+                               previous: List[Dict[str, str]]) -> Tuple[List[_Candidate], int, int]:
+        candidates = []
+        seen = {_normalize(m["content"]) for m in previous if m["role"] == "user"}
+        deduped = irrelevant = 0
+        now = time.time()
+        for item in persistent_items:
+            key = _normalize(item["question"])
+            if key in seen:
+                deduped += 1
+                continue
+            seen.add(key)
+            if float(item.get("relevance", 1.0)) < self.min_relevance:
+                irrelevant += 1
+                continue
+            question = {"role": "user", "content": item["question"]}
+            candidates.append(_Candidate(
+                [question, {"role": "assistant", "content": item["answer"]}],
+                [question, {"role": "assistant", "content": _compress(item["answer"])}],
+                self._score(item, now),
+                float(item.get("ts") or 0),  # en el prompt van antes que los recientes, en orden cronológico
+                "persistent"
+            ))
+        return candidates, deduped, irrelevant
+
+    def prepare(self, system_prompt: str, recent_history: List[Dict[str, str]]) -> PreparedContext:
+        """Parte del prompt que no depende de la memoria persistente"""
+        question = recent_history[-1:] if recent_history and recent_history[-1]["role"] == "user" else []
+        previous = recent_history[:len(recent_history) - len(question)]
+        system_tokens = static_prefix_tokens(system_prompt)
+        return PreparedContext(
+            system={"role": "system", "content": system_prompt},
+            question=question,
+            previous=previous,
+            system_tokens=system_tokens,
+            used=system_tokens + message_tokens(question),
+            recent=self._recent_candidates(previous),
+        )
+
+    def build(self, system_prompt: str, persistent_items: List[Dict[str, Any]],
+              recent_history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Mensajes del prompt y métricas de tokens de la solicitud"""
+        return self.merge(self.prepare(system_prompt, recent_history), persistent_items)
+
+    def merge(self, prepared: PreparedContext,
+              persistent_items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Completa el prompt preparado con la memoria persistente dentro del presupuesto"""
+        used, system_tokens = prepared.used, prepared.system_tokens
+        persistent, deduped, dropped = self._persistent_candidates(persistent_items, prepared.previous)
+        candidates = prepared.recent + persistent
+
+        selected: List[_Candidate] = []
+        compressed = 0
+        for candidate in sorted(candidates, key=lambda c: c.score, reverse=True):
+            for messages, is_compressed in ((candidate.messages, False), (candidate.compressed, True)):
+                cost = message_tokens(messages)
+                if used + cost <= self.max_tokens:
+                    used += cost
+                    selected.append(_Candidate(messages, messages, candidate.score, candidate.order, candidate.source))
+                    compressed += is_compressed and messages != candidate.messages
+                    break
+            else:
+                dropped += 1
+
+        context: List[Dict[str, str]] = []
+        for candidate in sorted(selected, key=lambda c: (c.source == "recent", c.order)):
+            context.extend(candidate.messages)
+
+        metrics = {
+            "context_tokens": used,
+            "system_tokens": system_tokens,
+            "budget": self.max_tokens,
+            "persistent_items": sum(c.source == "persistent" for c in selected),
+            "recent_turns": sum(c.source == "recent" for c in selected),
+            "compressed": compressed,
+            "dropped": dropped,
+            "deduped": deduped,
+        }
+        return [prepared.system] + context + prepared.question, metrics
@@ -0,0 +1,337 @@
+"""Límite de solicitudes y tokens por minuto compartido por todo el proceso.
+
+``RateLimiter`` es un token bucket doble (solicitudes y tokens por minuto) con
+cola de prioridad: las llamadas que terminan una respuesta ya iniciada
+(interpretación, corrección de SQL) pasan antes que las preguntas nuevas. Cada
+429 pausa a todos los clientes con backoff exponencial y reduce la tasa; las
+respuestas exitosas la recuperan poco a poco.
+
+``RateLimitedLLM`` envuelve al cliente del LLM: pide cuota antes de cada
+llamada, reintenta los 429 a través del limitador y comparte una sola llamada
+entre prompts idénticos en vuelo.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from agent.tokens import estimate_tokens, message_tokens
+from observability.metrics import metrics
+
+# Prioridades (menor número, mayor prioridad)
+PRIORITY_FOLLOWUP = 0  # interpretación o corrección de una pregunta en curso
+PRIORITY_NEW = 1       # generación de SQL para una pregunta nueva
+
+
+class RateLimitTimeout(Exception):
+    """No hubo cuota disponible dentro del tiempo máximo de espera"""
+
+
+def is_rate_limited(error: Exception) -> bool:
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or type(error).__name__ == "ResourceExhausted"
+
+
+class _Bucket:
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = per_minute
+        self.capacity = max(1.0, per_minute * burst_seconds / 60)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_for(self, amount: float, now: float, factor: float) -> float:
+        """Segundos hasta poder tomar ``amount`` (0 si ya se puede)"""
+        if not self.per_minute:
+            return 0.0
+        rate = self.per_minute * factor / 60
+        self.level = min(self.capacity, self.level + max(0.0, now - self.updated) * rate)
+        self.updated = max(now, self.updated)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / rate
+
+    def take(self, amount: float) -> None:
+        if self.per_minute:
+            self.level -= min(amount, self.capacity)
+
+    def drain(self, until: float) -> None:
+        """Vacía el bucket y lo vuelve a llenar recién desde ``until``"""
+        self.level = 0.0
+        self.updated = until
+
+
+class RateLimiter:
+    """Cuota de solicitudes (rpm) y tokens (tpm) por minuto con prioridades y backoff adaptativo"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_wait: float = 30.0,
+                 burst_seconds: float = 1.0, max_backoff: float = 30.0):
+        self.max_wait = max_wait
+        self.max_backoff = max_backoff
+        self._requests = _Bucket(rpm, burst_seconds)
+        self._tokens = _Bucket(tpm, burst_seconds)
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._pause_until = 0.0
+        self._backoff = 1.0
+        self._factor = 1.0
+        self.stats = {"granted": 0, "rate_limited": 0, "timeouts": 0, "coalesced": 0}
+
+    def record(self, stat: str) -> None:
+        """Suma uno al contador ``stat`` de ``stats``"""
+        with self._cond:
+            self.stats[stat] += 1
+
+    def _try_acquire(self, ticket: Tuple[int, int], tokens: int) -> Optional[float]:
+        """0 si se otorgó la cuota, los segundos a esperar, o None si hay solicitudes antes en la cola"""
+        with self._cond:
+            if self._queue[0] != ticket:
+                return None
+            now = time.monotonic()
+            wait = max(self._pause_until - now,
+                       self._requests.wait_for(1, now, self._factor),
+                       self._tokens.wait_for(tokens, now, self._factor))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self.stats["granted"] += 1
+            self._cond.notify_all()
+            return 0.0
+
+    def _enqueue(self, priority: int) -> Tuple[int, int]:
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _abandon(self, ticket: Tuple[int, int]) -> None:
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self.stats["timeouts"] += 1
+                self._cond.notify_all()
+
+    def acquire(self, tokens: int = 0, priority: int = PRIORITY_NEW) -> None:
+        """Bloquea hasta tener cuota para una llamada de ``tokens`` tokens"""
+        ticket = self._enqueue(priority)
+        deadline = time.monotonic() + self.max_wait
+        try:
+            # El lock se suelta solo dentro de wait: un aviso entre revisar la cola y esperar no se pierde
+            with self._cond:
+                while True:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait == 0:
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimitTimeout("Servicio ocupado: no hubo cuota del LLM a tiempo")
+                    # Sin turno se espera el aviso de quien sale de la cola (cuota otorgada o abandono)
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+        finally:
+            self._abandon(ticket)
+
+    async def aacquire(self, tokens: int = 0, priority: int = PRIORITY_NEW) -> None:
+        """Versión asíncrona de ``acquire``: espera sin ocupar un hilo"""
+        ticket = self._enqueue(priority)
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while True:
+                wait = self._try_acquire(ticket, tokens)
+                if wait == 0:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateLimitTimeout("Servicio ocupado: no hubo cuota del LLM a tiempo")
+                # El event loop no puede bloquearse en la condición: sin turno se vuelve a revisar en 50 ms
+                await asyncio.sleep(min(0.05 if wait is None else wait, remaining))
+        finally:
+            self._abandon(ticket)
+
+    def on_rate_limited(self) -> None:
+        """Un 429: pausa global con backoff exponencial y menos tasa"""
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            now = time.monotonic()
+            # Los 429 de llamadas que ya estaban en vuelo durante la pausa no la alargan otra vez
+            if now < self._pause_until:
+                return
+            self._pause_until = now + self._backoff
+            # Sin ráfaga al terminar la pausa: la cuota del proveedor ya está gastada
+            self._requests.drain(self._pause_until)
+            self._tokens.drain(self._pause_until)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._factor = max(0.25, self._factor * 0.8)
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._backoff = 1.0
+            self._factor = min(1.0, self._factor + 0.05)
+
+
+def _prompt_key(messages: Any) -> Optional[str]:
+    try:
+        return json.dumps(messages, sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedLLM:
+    """Cliente del LLM detrás del limitador compartido, con coalescencia de prompts idénticos"""
+
+    def __init__(self, llm, limiter: RateLimiter, max_retries: int = 5, output_tokens: Optional[int] = None):
+        self.llm = llm
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.output_tokens = output_tokens or getattr(llm, "max_output_tokens", None) or 150
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+    def _cost(self, messages: Any) -> int:
+        return (message_tokens(messages) if isinstance(messages, list) else 0) + self.output_tokens
+
+    @staticmethod
+    def _record_usage(messages: Any, result: Any, completion: Optional[str] = None) -> None:
+        """Tokens reales si el cliente los informa (usage_metadata); si no, estimados"""
+        usage = getattr(result, "usage_metadata", None) or {}
+        prompt = usage.get("input_tokens") or (message_tokens(messages) if isinstance(messages, list) else 0)
+        if completion is None:
+            completion = getattr(result, "content", "")
+        output = usage.get("output_tokens") or estimate_tokens(completion if isinstance(completion, str) else "")
+        metrics.inc("llm_calls_total", outcome="ok")
+        metrics.inc("llm_tokens_total", prompt, kind="prompt")
+        metrics.inc("llm_tokens_total", output, kind="completion")
+
+    def _failed(self, error: Exception, retry: bool) -> None:
+        if is_rate_limited(error):
+            metrics.inc("llm_calls_total", outcome="rate_limited")
+            if retry:
+                self.limiter.on_rate_limited()
+        else:
+            metrics.inc("llm_calls_total", outcome="error")
+
+    def _call(self, fn: Callable[[], Any], messages: Any, priority: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(self._cost(messages), priority)
+            try:
+                result = fn()
+            except Exception as e:
+                retry = is_rate_limited(e) and attempt < self.max_retries
+                self._failed(e, retry)
+                if retry:
+                    continue
+                raise
+            self.limiter.on_success()
+            self._record_usage(messages, result)
+            return result
+
+    async def _acall(self, fn: Callable[[], Any], messages: Any, priority: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(self._cost(messages), priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                retry = is_rate_limited(e) and attempt < self.max_retries
+                self._failed(e, retry)
+                if retry:
+                    continue
+                raise
+            self.limiter.on_success()
+            self._record_usage(messages, result)
+            return result
+
+    def invoke(self, messages: Any, priority: int = PRIORITY_NEW, **kwargs) -> Any:
+        key = None if kwargs else _prompt_key(messages)
+        if key is None:
+            return self._call(lambda: self.llm.invoke(messages, **kwargs), messages, priority)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self.limiter.record("coalesced")
+            metrics.inc("llm_calls_total", outcome="coalesced")
+            return future.result()
+
+        try:
+            result = self._call(lambda: self.llm.invoke(messages), messages, priority)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def ainvoke(self, messages: Any, priority: int = PRIORITY_NEW, **kwargs) -> Any:
+        key = None if kwargs else _prompt_key(messages)
+        if key is None:
+            return await self._acall(lambda: self.llm.ainvoke(messages, **kwargs), messages, priority)
+
+        future = self._ainflight.get(key)
+        if future is not None:
+            self.limiter.record("coalesced")
+            metrics.inc("llm_calls_total", outcome="coalesced")
+            return await asyncio.shield(future)
+
+        future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._acall(lambda: self.llm.ainvoke(messages), messages, priority)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita el aviso de excepción no recuperada si nadie más esperaba
+            raise
+        finally:
+            self._ainflight.pop(key, None)
+
+    def stream(self, messages: Any, priority: int = PRIORITY_NEW, **kwargs) -> Iterator[Any]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(self._cost(messages), priority)
+            parts: List[str] = []
+            try:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    parts.append(chunk.content if isinstance(getattr(chunk, "content", None), str) else "")
+                    yield chunk
+            except Exception as e:
+                # Solo se reintenta si todavía no se entregó ningún fragmento
+                retry = is_rate_limited(e) and not parts and attempt < self.max_retries
+                self._failed(e, retry)
+                if retry:
+                    continue
+                raise
+            self.limiter.on_success()
+            self._record_usage(messages, None, "".join(parts))
+            return
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Limitador del proceso (LLM_RPM, LLM_TPM y LLM_MAX_WAIT_S; 0 = sin límite fijo)"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    rpm=float(os.getenv("LLM_RPM", "0")),
+                    tpm=float(os.getenv("LLM_TPM", "0")),
+                    max_wait=float(os.getenv("LLM_MAX_WAIT_S", "30"))
+                )
+    return _limiter
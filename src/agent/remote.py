@@ -0,0 +1,108 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from agent.resources import ConversationState
+from observability.tracing import RequestTrace
+
+
+class RemoteMemory:
+    """Vista de la memoria persistente servida por la API"""
+
+    def __init__(self, agent: "RemoteAgent"):
+        self._agent = agent
+
+    def count(self, user_id: Optional[str] = None) -> int:
+        user_id = user_id or self._agent.user_id
+        try:
+            params = {"user_id": user_id} if user_id else None
+            return self._agent._request("GET", "/memory", params=params).json()["count"]
+        except Exception as e:
+            print(f"Error contando memoria: {str(e)}")
+            return 0
+
+    def get_relevant_items(self, query: str, n_results: int = 3,
+                           user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        user_id = user_id or self._agent.user_id
+        response = self._agent._request("POST", f"/memory/{user_id}/search",
+                                        json={"query": query, "n_results": n_results})
+        return response.json()["items"]
+
+
+class RemoteAgent:
+    """Cliente de la API (server.py) con la misma interfaz que usa la UI de ``GeminiAgent``.
+
+    La conversación vive en el servidor: el historial de la sesión se guarda en
+    el almacén compartido y este cliente solo envía la pregunta y el usuario.
+    Se autentica con la clave de servicio (``api_key``, por defecto
+    AGENT_API_KEY) o con el token del usuario (``user_token``).
+    """
+
+    def __init__(self, base_url: Optional[str] = None, state: Optional[ConversationState] = None,
+                 timeout: float = 120, api_key: Optional[str] = None, user_token: Optional[str] = None):
+        self.base_url = (base_url or os.getenv("AGENT_API_URL", "http://localhost:8000")).rstrip("/")
+        self.state = state or ConversationState()
+        self.user_id = self.state.user_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        api_key = api_key or os.getenv("AGENT_API_KEY")
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+        if user_token:
+            self.session.headers["X-User-Token"] = user_token
+        self.persistent_memory = RemoteMemory(self)
+        self.last_trace: Optional[RequestTrace] = None
+        self.last_stream_metrics: Dict[str, Any] = {}
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _payload(self, query: str, bypass_cache: bool) -> Dict[str, Any]:
+        return {"question": query, "user_id": self.user_id, "bypass_cache": bypass_cache}
+
+    def get_response(self, query: str, bypass_cache: bool = False) -> str:
+        try:
+            data = self._request("POST", "/chat", json=self._payload(query, bypass_cache)).json()
+        except Exception as e:
+            return f"📊 Error: {str(e)}\n📝 Por favor, intenta de nuevo con una pregunta diferente."
+        self.last_trace = RequestTrace.from_dict(data["trace"]) if data.get("trace") else None
+        return data["answer"]
+
+    def stream_response(self, query: str, bypass_cache: bool = False) -> Iterator[Dict[str, Any]]:
+        """Eventos de ``GeminiAgent.stream_response`` leídos del stream NDJSON de la API"""
+        try:
+            response = self._request("POST", "/chat/stream", json=self._payload(query, bypass_cache), stream=True)
+            with response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "trace":
+                        self.last_trace = RequestTrace.from_dict(event["trace"])
+                        continue
+                    if event["type"] == "done":
+                        self.last_stream_metrics = event["metrics"]
+                    yield event
+        except requests.RequestException as e:
+            answer = f"📊 Error: {str(e)}\n📝 Por favor, intenta de nuevo con una pregunta diferente."
+            yield {"type": "error", "message": answer}
+            yield {"type": "done", "answer": answer, "metrics": {"ttft_s": None, "total_s": None}}
+
+    def clear_history(self):
+        """Limpiar la memoria y la sesión del usuario en el servidor"""
+        try:
+            self._request("DELETE", f"/memory/{self.user_id}")
+        except Exception as e:
+            print(f"Error limpiando memoria: {str(e)}")
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """Métricas del worker que atienda la solicitud"""
+        try:
+            return self._request("GET", "/metrics").json()
+        except Exception as e:
+            print(f"Error obteniendo métricas: {str(e)}")
+            return {}
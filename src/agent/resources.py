@@ -0,0 +1,104 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from langchain_google_genai import ChatGoogleGenerativeAI
+from data.bigquery_client import BigQueryClient
+from data.prefetch import Prefetcher
+from data.rollups import RollupManager
+from data.schema_catalog import SchemaCatalog
+from data.sql_validator import QueryValidator
+from memory.chroma_memory import ChromaMemory
+from agent.context import ContextBuilder
+from agent.rate_limiter import RateLimitedLLM, get_rate_limiter
+from agent.response_cache import ResponseCache
+
+
+def create_llm() -> ChatGoogleGenerativeAI:
+    """Crea el cliente de Gemini a partir de las variables de entorno"""
+    # Asegurarse de que la API key esté configurada
+    if 'GOOGLE_API_KEY' not in os.environ:
+        raise ValueError("GOOGLE_API_KEY no está configurada en las variables de entorno")
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.0-flash-lite",  # Cambiado a flash-lite
+        #model="gemini-1.5-pro",
+        temperature=0.5,  # Reducida para respuestas más precisas
+        convert_system_message_to_human=True,
+        max_output_tokens=150,  # Reducido para respuestas más concisas
+        top_p=0.8,  # Añadido para mejor control de la generación
+        top_k=40,  # Añadido para mejor control de la generación
+        # Los 429 los reintenta el limitador compartido (agent/rate_limiter.py), no el cliente
+        max_retries=int(os.getenv("LLM_CLIENT_RETRIES", "1"))
+    )
+
+
+class AgentResources:
+    """Recursos pesados y thread-safe que comparten todas las sesiones del proceso.
+
+    Cliente del LLM (detrás del limitador de cuota del proceso), cliente de BigQuery (con su pool de conexiones HTTP),
+    catálogo del esquema de la tabla, validador de SQL, memoria de Chroma (cliente persistente y modelo de
+    embeddings) y caché de respuestas. Cualquiera puede inyectarse.
+    """
+
+    def __init__(self, llm=None, bq_client=None, memory=None, response_cache: Optional[ResponseCache] = None,
+                 schema_catalog: Optional[SchemaCatalog] = None, validator: Optional[QueryValidator] = None):
+        llm = llm if llm is not None else create_llm()
+        self.llm = llm if isinstance(llm, RateLimitedLLM) else RateLimitedLLM(llm, get_rate_limiter())
+        self.bq_client = bq_client if bq_client is not None else BigQueryClient()
+
+        # Esquema y estadísticas desde la caché en disco (sin llamada a la API si está vigente)
+        self.schema_catalog = schema_catalog or SchemaCatalog(self.bq_client)
+        self.table_schema = self.schema_catalog.column_names()
+
+        # Consultas de agregación servidas desde el rollup (BQ_USE_ROLLUPS=1)
+        if os.getenv("BQ_USE_ROLLUPS") == "1" and hasattr(self.bq_client, "rollup_rewriter"):
+            self.bq_client.rollup_rewriter = RollupManager(self.bq_client).rewriter(self.table_schema or None)
+
+        # Modo especulativo (SPECULATIVE_PREFETCH=1): variantes probables de cada consulta se ejecutan en
+        # segundo plano y lo que la respuesta necesita sin depender de las filas se prepara mientras corre
+        self.prefetcher: Optional[Prefetcher] = None
+        self.speculative_executor: Optional[ThreadPoolExecutor] = None
+        if os.getenv("SPECULATIVE_PREFETCH") == "1" and hasattr(self.bq_client, "prefetcher"):
+            self.prefetcher = self.bq_client.prefetcher or Prefetcher.from_env(self.bq_client)
+            self.bq_client.prefetcher = self.prefetcher
+            self.speculative_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent-speculative")
+
+        # Validación local + dry run con presupuesto de bytes (BQ_MAX_BYTES_SCANNED)
+        self.validator = validator or QueryValidator(self.bq_client, self.schema_catalog)
+        self.memory = memory if memory is not None else ChromaMemory()
+
+        # Caché de respuestas (exacta + semántica) reutilizando los embeddings de Chroma
+        # ``is None``: una caché inyectada vacía tiene len() 0
+        self.response_cache = response_cache if response_cache is not None else ResponseCache(
+            embedding_function=self.memory.embedding_function,
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92")),
+            disk_path=os.getenv("RESPONSE_CACHE_PATH") or None,
+            volatile_ttl=float(os.getenv("RESPONSE_CACHE_VOLATILE_TTL", "60"))
+        )
+
+        # Presupuesto de tokens del contexto de generación de SQL (CONTEXT_MAX_TOKENS)
+        self.context_builder = ContextBuilder()
+
+
+class ConversationState:
+    """Estado liviano de una sesión: usuario y memoria a corto plazo"""
+
+    def __init__(self, user_id: Optional[str] = None):
+        self.user_id = user_id
+        self.history: List[Dict[str, str]] = []
+
+
+_shared: Optional[AgentResources] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_resources() -> AgentResources:
+    """Recursos compartidos del proceso, creados en el primer uso"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = AgentResources()
+    return _shared
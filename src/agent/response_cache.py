@@ -0,0 +1,250 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+from data.query_cache import is_volatile
+
+
+@dataclass
+class CachedResponse:
+    """Entrada de la caché: SQL generado y respuesta final para una pregunta"""
+    question: str
+    sql: str
+    answer: str
+    created_at: float = field(default_factory=time.time)
+    embedding: Optional[List[float]] = None
+    # Contexto de la conversación en que se respondió ("" para una pregunta sin historial)
+    scope: str = ""
+    # TTL propio (respuestas de SQL volátil); None usa el de la caché
+    ttl_seconds: Optional[float] = None
+
+
+class ResponseCache:
+    """Caché por niveles para el flujo pregunta → SQL → respuesta.
+
+    El nivel exacto usa la pregunta normalizada como llave. El nivel semántico
+    compara el embedding de la pregunta con los ya guardados y reutiliza la
+    respuesta cuando la similitud coseno supera ``similarity_threshold``.
+    Ambos niveles se buscan dentro de un ``scope``: una pregunta de seguimiento
+    ("¿y por día de la semana?") depende de la conversación, así que solo se
+    reutiliza con el mismo contexto. Las respuestas de SQL volátil (por ejemplo
+    con ``CURRENT_TIMESTAMP()``) duran ``volatile_ttl`` y no se guardan en disco,
+    igual que en ``QueryCache``.
+    Con ``disk_path`` las entradas se escriben también en SQLite (como JSON) y
+    cada búsqueda trae las que agregaron otros procesos (p. ej. los workers de
+    la API). Las entradas vencidas se descartan al encontrarlas en una búsqueda
+    y, en memoria, el límite ``max_entries`` saca las menos usadas.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.92,
+        disk_path: Optional[str] = None,
+        volatile_ttl: float = 60,
+    ):
+        self.embedding_function = embedding_function
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.volatile_ttl = volatile_ttl
+        self.disk_path = disk_path
+        self._synced_rowid = 0
+
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        # Embeddings recientes por pregunta normalizada: la búsqueda y el guardado calculan el mismo
+        self._embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+        if self.disk_path:
+            self._init_disk()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    def _init_disk(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache ("
+                    "key TEXT PRIMARY KEY, created_at REAL, payload BLOB)"
+                )
+        except Exception as e:
+            print(f"Error inicializando caché de respuestas en disco: {str(e)}")
+            self.disk_path = None
+
+    def _sync_from_disk(self) -> None:
+        """Trae a memoria las entradas que otros procesos guardaron desde la última sincronización"""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT rowid, key, payload FROM response_cache WHERE rowid > ? ORDER BY rowid DESC LIMIT ?",
+                    (self._synced_rowid, self.max_entries),
+                ).fetchall()
+        except Exception as e:
+            print(f"Error leyendo caché de respuestas en disco: {str(e)}")
+            return
+        with self._lock:
+            for rowid, key, payload in reversed(rows):
+                self._synced_rowid = max(self._synced_rowid, rowid)
+                try:
+                    entry = CachedResponse(**json.loads(payload))
+                except (ValueError, TypeError) as e:
+                    # Filas con otro formato (p. ej. de versiones anteriores) se ignoran
+                    print(f"Error leyendo entrada de la caché de respuestas: {str(e)}")
+                    continue
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_put(self, key: str, entry: CachedResponse) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, created_at, payload) VALUES (?, ?, ?)",
+                    (key, entry.created_at, json.dumps(asdict(entry), ensure_ascii=False)),
+                )
+                if self.ttl_seconds:
+                    conn.execute("DELETE FROM response_cache WHERE created_at < ?",
+                                 (time.time() - self.ttl_seconds,))
+        except Exception as e:
+            print(f"Error escribiendo caché de respuestas en disco: {str(e)}")
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normaliza la pregunta: minúsculas, sin tildes, sin puntuación y espacios simples"""
+        text = unicodedata.normalize("NFKD", question.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    @classmethod
+    def _key(cls, question: str, scope: str) -> str:
+        key = cls.normalize(question)
+        return f"{scope}:{key}" if scope else key
+
+    def _is_expired(self, entry: CachedResponse, now: float) -> bool:
+        ttl = entry.ttl_seconds if entry.ttl_seconds is not None else self.ttl_seconds
+        return ttl is not None and now - entry.created_at > ttl
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        if self.embedding_function is None:
+            return None
+        with self._lock:
+            embedding = self._embeddings.get(text)
+        if embedding is not None:
+            return embedding
+        try:
+            embedding = list(self.embedding_function([text])[0])
+        except Exception as e:
+            print(f"Error calculando embedding para la caché: {str(e)}")
+            return None
+        with self._lock:
+            self._embeddings[text] = embedding
+            while len(self._embeddings) > self.max_entries:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def prepare(self, question: str) -> None:
+        """Calcula por adelantado el embedding que usará ``put`` (p. ej. mientras corre la consulta)"""
+        self._embed(self.normalize(question))
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def get(self, question: str, scope: str = "") -> Optional[CachedResponse]:
+        """Busca una respuesta en caché, primero exacta y luego semántica, dentro de ``scope``"""
+        key = self._key(question, scope)
+        if self.disk_path:
+            self._sync_from_disk()
+        now = time.time()
+
+        with self._lock:
+            # Las entradas vencidas se descartan solo al encontrarlas: la llave buscada y los candidatos del scope
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry
+
+            candidates = []
+            expired = []
+            for k, e in self._entries.items():
+                if e.embedding is None or e.scope != scope:
+                    continue
+                if self._is_expired(e, now):
+                    expired.append(k)
+                else:
+                    candidates.append((k, e))
+            for k in expired:
+                del self._entries[k]
+
+        if candidates:
+            embedding = self._embed(self.normalize(question))
+            if embedding is not None:
+                best_key, best_score = None, -1.0
+                for k, e in candidates:
+                    score = self._cosine(embedding, e.embedding)
+                    if score > best_score:
+                        best_key, best_score = k, score
+
+                if best_score >= self.similarity_threshold:
+                    with self._lock:
+                        entry = self._entries.get(best_key)
+                        if entry is not None:
+                            self._entries.move_to_end(best_key)
+                            self.stats["semantic_hits"] += 1
+                            return entry
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, question: str, sql: str, answer: str, scope: str = "") -> None:
+        """Guarda el SQL y la respuesta final para una pregunta dentro de ``scope``"""
+        key = self._key(question, scope)
+        volatile = is_volatile(sql)
+        entry = CachedResponse(question=question, sql=sql, answer=answer,
+                               embedding=self._embed(self.normalize(question)), scope=scope,
+                               ttl_seconds=self.volatile_ttl if volatile else None)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.disk_path and not volatile:
+            self._disk_put(key, entry)
+
+    def clear(self) -> None:
+        """Vacía la caché sin reiniciar los contadores"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM response_cache")
+            except Exception as e:
+                print(f"Error limpiando caché de respuestas en disco: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,82 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+
+class SessionStore:
+    """Memoria a corto plazo de cada sesión en SQLite, compartida entre procesos.
+
+    Los workers de la API no guardan estado de la conversación: cada solicitud
+    carga el historial de su sesión y lo vuelve a escribir al terminar, así que
+    turnos consecutivos pueden caer en procesos distintos. Las sesiones sin
+    actividad por más de ``ttl_seconds`` se eliminan.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, updated_at REAL, history TEXT)"
+            )
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Construye el almacén a partir de variables de entorno"""
+        return cls(
+            path=os.getenv("SESSION_STORE_PATH", "./data/shared/sessions.db"),
+            ttl_seconds=float(os.getenv("SESSION_TTL", str(24 * 3600))),
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def load(self, session_id: str) -> List[Dict[str, str]]:
+        """Historial de la sesión (vacío si no existe)"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT history FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                    (session_id, time.time() - self.ttl_seconds),
+                ).fetchone()
+            return json.loads(row[0]) if row else []
+        except Exception as e:
+            print(f"Error leyendo la sesión: {str(e)}")
+            return []
+
+    def save(self, session_id: str, history: List[Dict[str, str]]) -> None:
+        """Guarda el historial de la sesión y descarta las sesiones vencidas"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, updated_at, history) VALUES (?, ?, ?)",
+                    (session_id, time.time(), json.dumps(history, ensure_ascii=False)),
+                )
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        except Exception as e:
+            print(f"Error guardando la sesión: {str(e)}")
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Elimina las sesiones cuyo ``session_id`` empieza con ``prefix``"""
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM sessions WHERE session_id LIKE ? ESCAPE '\\'", (pattern,))
+        except Exception as e:
+            print(f"Error eliminando sesiones: {str(e)}")
+
+    def delete(self, session_id: Optional[str] = None) -> None:
+        """Elimina una sesión o, sin ``session_id``, todas"""
+        try:
+            with self._connect() as conn:
+                if session_id is None:
+                    conn.execute("DELETE FROM sessions")
+                else:
+                    conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        except Exception as e:
+            print(f"Error eliminando la sesión: {str(e)}")
@@ -0,0 +1,18 @@
+from typing import Dict, List
+
+# Gemini y la mayoría de tokenizadores rondan 4 caracteres por token en español
+CHARS_PER_TOKEN = 4
+# Costo fijo aproximado por mensaje (rol y separadores)
+TOKENS_PER_MESSAGE = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación local de tokens, sin llamar a la API del modelo"""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Tokens estimados de un prompt en formato de mensajes"""
+    return sum(TOKENS_PER_MESSAGE + estimate_tokens(message.get("content", "")) for message in messages)
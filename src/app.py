@@ -1,13 +1,65 @@
 from dotenv import load_dotenv
 import os
+import uuid
 import streamlit as st
+from agent.auth import api_key, verify_user_token
 from agent.chat_agent import GeminiAgent
+from agent.remote import RemoteAgent
+from agent.resources import AgentResources, ConversationState
+from memory.embeddings import get_embedding_service
+from observability.metrics import metrics as process_metrics, start_metrics_server
+from observability.tracing import configure_logging
 
 # Cargar variables de entorno
 load_dotenv()
 
+@st.cache_resource
+def get_resources() -> AgentResources:
+    """Clientes y modelos compartidos por todas las sesiones del proceso"""
+    return AgentResources()
+
+@st.cache_resource
+def start_observability() -> None:
+    """Logs con trace id y endpoint de Prometheus (METRICS_PORT), una vez por proceso"""
+    configure_logging()
+    start_metrics_server()
+
+@st.cache_resource
+def warmup_embeddings() -> float:
+    """Carga el modelo de embeddings una sola vez al iniciar el proceso"""
+    return get_embedding_service().warmup()
+
 def main():
     st.title("🚕 Análisis de Taxis NY")
+    start_observability()
+    
+    # Con AGENT_API_URL la UI es un cliente liviano de la API (server.py); si no, ejecuta el agente
+    api_url = os.getenv("AGENT_API_URL")
+    if not api_url and os.getenv("EMBEDDING_WARMUP", "1") == "1":
+        warmup_embeddings()
+    
+    # Sin la clave de servicio la UI solo puede hablar con la API en nombre de un usuario con su token
+    token = st.query_params.get("token")
+    if api_url and not api_key() and not (st.query_params.get("user") and token):
+        st.error("Configura AGENT_API_KEY o abre la app con ?user=...&token=... (ver agent/auth.py)")
+        st.stop()
+    
+    # Estado liviano de la sesión; los clientes y modelos son compartidos por el proceso
+    if "conversation" not in st.session_state:
+        # Cada usuario (?user=...&token=..., ver agent/auth.py) o, en su defecto, cada sesión tiene su
+        # propia memoria; un ?user= sin token válido no da acceso a la memoria de ese usuario. Sin la
+        # clave de servicio el token no se puede verificar aquí: lo verifica la API en cada solicitud
+        user_id = st.query_params.get("user")
+        if api_key() and not verify_user_token(user_id, token):
+            user_id = uuid.uuid4().hex
+        elif not api_key() and not api_url:
+            user_id = uuid.uuid4().hex
+        st.session_state.conversation = ConversationState(user_id=user_id)
+    if api_url:
+        agent = RemoteAgent(api_url, state=st.session_state.conversation,
+                            user_token=None if api_key() else token)
+    else:
+        agent = GeminiAgent(resources=get_resources(), state=st.session_state.conversation)
     
     # Sidebar con información
     st.sidebar.title("📊 Guía de Preguntas")
@@ -36,19 +88,13 @@ def main():
     
     with col2:
         if st.button("Limpiar Memoria"):
-            if "agent" in st.session_state:
-                st.session_state.agent.clear_history()
+            agent.clear_history()
             st.session_state.messages = []
             st.rerun()
     
     # Mostrar información sobre la memoria
-    if "agent" in st.session_state:
-        memory_size = len(st.session_state.agent.persistent_memory.collection.get()["ids"])
-        st.sidebar.info(f"Interacciones en memoria: {memory_size}")
-    
-    # Inicializar el agente
-    if "agent" not in st.session_state:
-        st.session_state.agent = GeminiAgent()
+    memory_size = agent.persistent_memory.count(agent.user_id)
+    st.sidebar.info(f"Interacciones en memoria: {memory_size}")
     
     # Chat interface
     if "messages" not in st.session_state:
@@ -66,10 +112,45 @@ def main():
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Analizando datos..."):
-                response = st.session_state.agent.get_response(prompt)
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+            status = st.status("Analizando datos...", expanded=False)
+            metrics = {}
+
+            def stream_tokens():
+                # Traducir los eventos del agente en progreso visible y tokens
+                for event in agent.stream_response(prompt):
+                    if event["type"] == "sql":
+                        status.update(label="Consulta SQL generada")
+                        status.code(event["sql"], language="sql")
+                    elif event["type"] == "query_started":
+                        status.update(label="Ejecutando consulta en BigQuery...")
+                    elif event["type"] == "rows":
+                        status.update(label=f"Resultados listos ({event['count']} filas)")
+                    elif event["type"] == "token":
+                        yield event["text"]
+                    elif event["type"] == "error":
+                        yield event["message"]
+                    elif event["type"] == "done":
+                        metrics.update(event["metrics"])
+
+            response = st.write_stream(stream_tokens())
+            status.update(label="Análisis completo", state="complete")
+            if metrics.get("ttft_s") is not None:
+                st.caption(f"⏱️ Primer token: {metrics['ttft_s']:.2f} s · Total: {metrics['total_s']:.2f} s")
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            if agent.last_trace is not None:
+                st.session_state.last_trace = agent.last_trace.as_dict()
+
+    # Panel de depuración: etapas de la última solicitud y métricas del proceso
+    if os.getenv("DEBUG_PANEL", "1") == "1":
+        with st.sidebar.expander("🔍 Depuración"):
+            last_trace = st.session_state.get("last_trace")
+            if last_trace:
+                st.caption(f"Trace id: {last_trace['trace_id']} · Total: {last_trace['total_ms']} ms")
+                st.bar_chart(last_trace["stages_ms"])
+                st.json({"atributos": last_trace["attributes"], "errores": last_trace["errors"]})
+            else:
+                st.caption("Aún no hay solicitudes en esta sesión")
+            st.json(agent.metrics_snapshot() if api_url else process_metrics.snapshot(), expanded=False)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1 @@
+# Este archivo puede estar vacío 
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""Llamadas al LLM y tokens de prompt por camino de respuesta, con un LLM falso.
+
+Para cada forma de resultado (valor único, tabla corta, tabla de 24 filas y
+filas de detalle) compara ANSWER_MODE=llm (siempre el prompt completo) con el
+modo adaptativo (plantilla o prompt compacto), midiendo los tokens ahorrados
+(ANSWER_MEASURE_SAVINGS=1).
+Uso (desde ``src``)::
+
+    python -m benchmark.answer_bench
+"""
+import json
+import os
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+SHAPES = {
+    "escalar": [{"tarifa_promedio": 14.237}],
+    "tabla_corta": [{"payment_type": t, "viajes": 1000 * (i + 1)} for i, t in enumerate(["CSH", "CRD", "DIS", "NOC"])],
+    "por_hora": [{"hora": h, "total_viajes": 1000 + h, "tarifa_promedio": 12.5 + h / 10} for h in range(24)],
+    "detalle": [
+        {"distancia_millas": 90.5 - i, "tarifa_usd": 250.0 - i, "pickup_datetime": f"2024-03-0{i + 1} 10:00:00",
+         "hora": 10 + i}
+        for i in range(5)
+    ],
+}
+
+
+def run_shape(rows, mode: str) -> dict:
+    os.environ["ANSWER_MODE"] = mode
+    os.environ["ANSWER_MEASURE_SAVINGS"] = "1"
+    llm = FakeLLM(latency=0)
+    resources = AgentResources(llm=llm, bq_client=FakeBigQueryClient(latency=0, rows=rows), memory=FakeMemory(0))
+    agent = GeminiAgent(resources=resources, use_cache=False)
+    # El total de tokens del LLM incluye la generación de SQL, común a ambos modos; la pregunta
+    # indica el sentido del ranking (sin él la tabla corta va al LLM)
+    agent.get_response("¿Cuál tiene más viajes?")
+    return {
+        "llm_calls": llm.calls,
+        "llm_prompt_tokens_total": llm.prompt_tokens,
+        **agent.last_answer_metrics,
+    }
+
+
+def main():
+    report = {name: {mode: run_shape(rows, mode) for mode in ("llm", "adaptive")} for name, rows in SHAPES.items()}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
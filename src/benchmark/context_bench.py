@@ -0,0 +1,128 @@
+"""Tokens por turno del prompt de generación de SQL: concatenación completa vs. presupuesto.
+
+Reproduce conversaciones grabadas turno a turno. La memoria persistente se
+simula guardando cada turno y recuperando las 3 interacciones con más palabras
+en común con la pregunta (con su similitud y antigüedad). Para cada turno se
+comparan los tokens del prompt anterior (system + 3 pares de memoria + turnos
+recientes) con los del ContextBuilder.
+Uso (desde ``src``)::
+
+    python -m benchmark.context_bench [--conversations conversaciones.jsonl] [--budget 600]
+
+Cada línea del archivo es ``{"turns": [{"question": ..., "answer": ...}, ...]}``.
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+from agent.chat_agent import GeminiAgent
+from agent.context import ContextBuilder
+from agent.tokens import message_tokens
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+SAMPLE_CONVERSATION = [
+    ("¿Cuál es la tarifa promedio por hora del día?",
+     "📊 La tarifa promedio más alta es a las 5 AM con $18.40 USD\n📝 En la madrugada los viajes son más largos, "
+     "hacia aeropuertos; entre 7 y 9 AM baja a $13.10 USD por el tráfico urbano corto"),
+    ("¿Y las propinas por hora?",
+     "📊 La propina promedio más alta es a las 4 PM con $3.20 USD\n📝 Las propinas siguen la tarifa pero suben en "
+     "la tarde, cuando predomina el pago con tarjeta"),
+    ("¿Qué día de la semana tiene más viajes?",
+     "📊 El viernes tiene más viajes con 15,230 en promedio\n📝 Esto es un 20% más que el domingo; el jueves y "
+     "el sábado le siguen de cerca"),
+    ("¿Cuál es la tarifa promedio por hora del día?",
+     "📊 La tarifa promedio más alta es a las 5 AM con $18.40 USD\n📝 Igual que antes: la madrugada concentra "
+     "viajes largos a aeropuertos"),
+    ("¿Cuál fue el viaje más largo?",
+     "📊 El viaje más largo fue de 98.7 millas con tarifa de $250.00 USD\n📝 Los viajes de más de 50 millas son "
+     "menos del 0.1% del total y casi todos salen de JFK"),
+    ("¿Y la distancia promedio los fines de semana?",
+     "📊 La distancia promedio el fin de semana es 3.4 millas por viaje\n📝 Es 0.3 millas más que entre semana "
+     "por los viajes de ocio fuera de Manhattan"),
+    ("¿Cuánto se paga en efectivo vs tarjeta?",
+     "📊 El 68% de los viajes se paga con tarjeta\n📝 Con efectivo la propina registrada es casi cero porque no se "
+     "captura en el sistema"),
+    ("¿Las propinas con tarjeta por día de la semana?",
+     "📊 La propina promedio con tarjeta es mayor el viernes con $3.05 USD\n📝 El lunes es el día con propinas "
+     "más bajas, $2.71 USD en promedio"),
+]
+
+
+class RecordedMemory(FakeMemory):
+    """Memoria persistente simulada: similitud por palabras en común, con marca de tiempo"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.items: List[Dict[str, Any]] = []
+
+    def add(self, question: str, answer: str, ts: float) -> None:
+        self.items.append({"question": question, "answer": answer, "ts": ts})
+
+    def get_relevant_items(self, query: str, n_results: int = 3, user_id: str = None) -> List[Dict[str, Any]]:
+        words = set(query.lower().split())
+        scored = []
+        for item in self.items:
+            other = set(item["question"].lower().split())
+            scored.append(dict(item, relevance=len(words & other) / max(1, min(len(words), len(other)))))
+        return sorted(scored, key=lambda i: i["relevance"], reverse=True)[:n_results]
+
+    def get_relevant_history(self, query: str, n_results: int = 3, user_id: str = None) -> List[Dict[str, str]]:
+        history = []
+        for item in self.get_relevant_items(query, n_results):
+            history.extend([{"role": "user", "content": item["question"]},
+                            {"role": "assistant", "content": item["answer"]}])
+        return history
+
+
+def _load(path: str) -> List[List[tuple]]:
+    if not path:
+        return [SAMPLE_CONVERSATION]
+    with open(path, encoding="utf-8") as f:
+        return [[(t["question"], t["answer"]) for t in json.loads(line)["turns"]] for line in f if line.strip()]
+
+
+def replay(turns: List[tuple], budget: int) -> List[Dict[str, Any]]:
+    agent = GeminiAgent(llm=FakeLLM(latency=0), bq_client=FakeBigQueryClient(latency=0), memory=RecordedMemory())
+    agent.context_builder = ContextBuilder(max_tokens=budget)
+    memory = agent.persistent_memory
+    report = []
+    start = time.time() - len(turns) * 600  # un turno cada 10 minutos
+    for index, (question, answer) in enumerate(turns):
+        agent.conversation_history.append({"role": "user", "content": question})
+        recent = agent._recent_history()
+
+        legacy = ([{"role": "system", "content": agent.system_prompt_for(question)}]
+                  + memory.get_relevant_history(question) + recent)
+        agent._get_relevant_history()
+        report.append({
+            "turn": index + 1,
+            "legacy_tokens": message_tokens(legacy),
+            "budget_tokens": agent.last_context_metrics["context_tokens"],
+            **{k: agent.last_context_metrics[k] for k in ("persistent_items", "compressed", "dropped", "deduped")},
+        })
+
+        agent.conversation_history.append({"role": "assistant", "content": answer})
+        agent._trim_history()
+        memory.add(question, answer, start + index * 600)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokens por turno con y sin presupuesto de contexto")
+    parser.add_argument("--conversations", default=None)
+    parser.add_argument("--budget", type=int, default=600)
+    args = parser.parse_args()
+
+    turns = [row for conversation in _load(args.conversations) for row in replay(conversation, args.budget)]
+    legacy = sum(t["legacy_tokens"] for t in turns) / len(turns)
+    budgeted = sum(t["budget_tokens"] for t in turns) / len(turns)
+    print(json.dumps({
+        "turns": turns,
+        "avg_legacy_tokens": round(legacy, 1),
+        "avg_budget_tokens": round(budgeted, 1),
+        "reduction_pct": round(100 * (1 - budgeted / legacy), 1),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
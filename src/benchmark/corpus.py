@@ -0,0 +1,81 @@
+"""Corpus de preguntas del benchmark: las de la guía del sidebar de ``app.py``.
+
+Cada entrada trae la respuesta grabada del LLM para la pregunta: el SQL que
+genera (dialecto de BigQuery, con ``{table_ref}``) y la interpretación. Con
+``python -m benchmark.replay --record`` se pueden reemplazar por respuestas
+reales de Gemini.
+"""
+from typing import Any, Dict, List
+
+SIDEBAR_CORPUS: List[Dict[str, Any]] = [
+    {
+        "question": "¿Cuál es la tarifa promedio por viaje?",
+        "sql": """SELECT
+    ROUND(AVG(fare_amount), 2) as tarifa_promedio,
+    COUNT(*) as total_viajes
+FROM {table_ref}
+WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 30 DAY)""",
+        "answer": "📊 La tarifa promedio por viaje es $26.50 USD\n📝 Calculada sobre los viajes de los últimos 30 días",
+    },
+    {
+        "question": "¿Cuánto se gana en propinas en hora pico?",
+        "sql": """SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    ROUND(AVG(tip_amount), 2) as propina_promedio,
+    ROUND(SUM(tip_amount), 2) as propinas_total
+FROM {table_ref}
+WHERE EXTRACT(HOUR FROM pickup_datetime) IN (7, 8, 9, 17, 18, 19)
+GROUP BY hora
+ORDER BY hora""",
+        "answer": "📊 En hora pico la propina promedio es $2.00 USD por viaje\n📝 La tarde (5-7 PM) suma más propinas "
+                  "que la mañana por el mayor volumen de viajes",
+    },
+    {
+        "question": "¿Cuál es el pago total promedio por viaje?",
+        "sql": """SELECT
+    ROUND(AVG(total_amount), 2) as pago_total_promedio
+FROM {table_ref}
+WHERE total_amount > 0""",
+        "answer": "📊 El pago total promedio es $32.50 USD por viaje\n📝 Incluye tarifa, propina y recargos",
+    },
+    {
+        "question": "¿Cuáles son las horas más ocupadas?",
+        "sql": """SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    COUNT(*) as total_viajes
+FROM {table_ref}
+GROUP BY hora
+ORDER BY total_viajes DESC
+LIMIT 5""",
+        "answer": "📊 La hora más ocupada es las 6 PM\n📝 Le siguen las 7 PM y las 8 AM",
+    },
+    {
+        "question": "¿Qué día de la semana hay más viajes?",
+        "sql": """SELECT
+    CASE EXTRACT(DAYOFWEEK FROM pickup_datetime)
+        WHEN 1 THEN 'Domingo'
+        WHEN 2 THEN 'Lunes'
+        WHEN 3 THEN 'Martes'
+        WHEN 4 THEN 'Miércoles'
+        WHEN 5 THEN 'Jueves'
+        WHEN 6 THEN 'Viernes'
+        WHEN 7 THEN 'Sábado'
+    END as dia_semana,
+    COUNT(*) as total_viajes,
+    ROUND(AVG(trip_distance), 2) as distancia_promedio,
+    ROUND(AVG(total_amount), 2) as ingreso_promedio
+FROM {table_ref}
+GROUP BY dia_semana
+ORDER BY MIN(EXTRACT(DAYOFWEEK FROM pickup_datetime))""",
+        "answer": "📊 El viernes es el día con más viajes\n📝 La distancia y el ingreso promedio casi no cambian "
+                  "entre días",
+    },
+    {
+        "question": "¿Cuánto duran los viajes en promedio?",
+        "sql": """SELECT
+    ROUND(AVG(TIMESTAMP_DIFF(dropoff_datetime, pickup_datetime, MINUTE)), 1) as duracion_promedio_min
+FROM {table_ref}
+WHERE dropoff_datetime > pickup_datetime""",
+        "answer": "📊 Los viajes duran 12 minutos en promedio\n📝 Medido entre la hora de inicio y la de fin",
+    },
+]
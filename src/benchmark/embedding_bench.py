@@ -0,0 +1,77 @@
+"""Benchmark del servicio de embeddings por backend: arranque en frío y latencia por consulta.
+
+Uso (desde ``src``)::
+
+    python -m benchmark.embedding_bench --backends torch onnx onnx-int8
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from memory.embeddings import EmbeddingService
+
+QUESTIONS = [
+    "¿Cuál es la tarifa promedio por viaje?",
+    "¿Cuánto se gana en propinas en hora pico?",
+    "¿Cuál es el pago total promedio por viaje?",
+    "¿Cuáles son las horas más ocupadas?",
+    "¿Qué día de la semana hay más viajes?",
+    "¿Cuánto duran los viajes en promedio?",
+]
+
+
+def _p50_ms(samples: List[float]) -> float:
+    samples = sorted(samples)
+    return round(samples[len(samples) // 2] * 1000, 3)
+
+
+def bench_backend(backend: str, queries: int, threads: int) -> Dict[str, float]:
+    service = EmbeddingService(backend=backend, batch_window_ms=0)
+    cold_start = service.warmup()
+
+    texts = [f"{QUESTIONS[i % len(QUESTIONS)]} #{i}" for i in range(queries)]
+    miss, hit = [], []
+    for text in texts:
+        start = time.perf_counter()
+        service([text])
+        miss.append(time.perf_counter() - start)
+    for text in texts:
+        start = time.perf_counter()
+        service([text])
+        hit.append(time.perf_counter() - start)
+
+    # Solicitudes concurrentes agrupadas en micro-lotes
+    batched = EmbeddingService(backend=backend, batch_window_ms=2)
+    batched._model = service.model
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda t: batched([t + " (lote)"]), texts))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "cold_start_s": round(cold_start, 3),
+        "encode_ms_p50": _p50_ms(miss),
+        "cached_ms_p50": _p50_ms(hit),
+        "concurrent_texts_per_s": round(queries / elapsed, 1),
+        "avg_batch_size": round(batched.stats["encoded"] / max(batched.stats["batches"], 1), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de EmbeddingService")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        try:
+            print(json.dumps(bench_backend(backend, args.queries, args.threads)))
+        except Exception as e:
+            print(json.dumps({"backend": backend, "error": str(e)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Ejecuta las consultas de ejemplo del prompt en el motor local (DuckDB sobre Parquet).
+
+Genera un extracto sintético de los últimos días, traduce cada consulta del
+dialecto de BigQuery y reporta a qué motor se enrutaría y su latencia. Con
+``--bigquery`` además ejecuta cada consulta en BigQuery y compara columnas y
+valores (requiere credenciales y variables BQ_*). Los resultados esperados de
+la traducción sobre un extracto pequeño se verifican en tests/test_backends.py.
+Uso (desde ``src``)::
+
+    python -m benchmark.engine_bench --rows 1000000 --days 30
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import duckdb
+from agent.chat_agent import SQL_EXAMPLES
+from data.backends import BigQueryBackend, DuckDBBackend
+
+TABLE_REF = "bench-project.bench_dataset.taxi_trips"
+
+
+def write_extract(path: str, rows: int, days: int) -> None:
+    """Parquet sintético con la forma de los viajes de taxi, cubriendo los últimos ``days`` días"""
+    minutes = days * 24 * 60
+    duckdb.sql(f"""COPY (SELECT
+        date_trunc('day', now()::TIMESTAMP) - INTERVAL {days - 1} DAY + (i * 137 % {minutes}) * INTERVAL 1 MINUTE AS pickup_datetime,
+        date_trunc('day', now()::TIMESTAMP) - INTERVAL {days - 1} DAY + (i * 137 % {minutes} + 12) * INTERVAL 1 MINUTE AS dropoff_datetime,
+        (i % 70) / 10.0 + 0.3 AS trip_distance,
+        ['CSH', 'CRD', 'DIS', 'NOC'][i % 4 + 1] AS payment_type,
+        (i % 50) + 2.5 AS fare_amount,
+        (i % 9) * 0.5 AS tip_amount,
+        (i % 60) + 3.0 AS total_amount
+    FROM range({rows}) t(i)) TO '{path}' (FORMAT PARQUET)""")
+
+
+def _sql(example: str, table_ref: str) -> str:
+    return example.split("```sql")[1].split("```")[0].format(table_ref=table_ref).strip()
+
+
+def _timed(fn, sql: str):
+    start = time.perf_counter()
+    rows = fn(sql)
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor local DuckDB")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--parquet", default=None, help="Extracto existente (si no, se genera uno sintético)")
+    parser.add_argument("--bigquery", action="store_true", help="Compara contra BigQuery")
+    args = parser.parse_args()
+
+    table_ref = TABLE_REF
+    if args.bigquery:
+        table_ref = f"{os.getenv('BQ_PROJECT_ID')}.{os.getenv('BQ_DATASET_ID')}.{os.getenv('BQ_TABLE_ID')}"
+
+    parquet_path = args.parquet
+    if parquet_path is None:
+        parquet_path = os.path.join(tempfile.mkdtemp(), "taxi_recent.parquet")
+        write_extract(parquet_path, args.rows, args.days)
+
+    local = DuckDBBackend(parquet_path, table_ref)
+    remote = BigQueryBackend(table_ref) if args.bigquery else None
+
+    report = {"parquet": parquet_path, "coverage_start": str(local.coverage_start),
+              "coverage_end": str(local.coverage_end), "queries": {}}
+    for name, example in SQL_EXAMPLES.items():
+        sql = _sql(example, table_ref)
+        rows, elapsed = _timed(local.query, sql)
+        entry = {
+            "engine": "duckdb" if local.can_answer(sql) else "bigquery",
+            "rows": len(rows),
+            "duckdb_ms": round(elapsed * 1000, 2),
+        }
+        if remote is not None:
+            remote_rows, remote_elapsed = _timed(remote.query, sql)
+            entry["bigquery_ms"] = round(remote_elapsed * 1000, 2)
+            entry["same_columns"] = rows.column_names == remote_rows.column_names
+            # Mismos valores (la traducción de SQL también se prueba en tests/test_backends.py)
+            entry["same_rows"] = rows.to_pylist() == remote_rows.to_pylist()
+        report["queries"][name] = entry
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from agent.tokens import message_tokens
+
+# Consulta que devuelve el LLM falso cuando se le pide generar SQL
+DEFAULT_SQL = """SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    COUNT(*) as total_viajes,
+    ROUND(AVG(fare_amount), 2) as tarifa_promedio
+FROM bench-project.bench_dataset.taxi_trips
+GROUP BY hora
+ORDER BY hora"""
+
+DEFAULT_ANSWER = "📊 La tarifa promedio es $12.50 USD\n📝 Respuesta generada por el LLM de prueba"
+
+FAKE_SCHEMA = [
+    ("pickup_datetime", "TIMESTAMP"), ("dropoff_datetime", "TIMESTAMP"), ("passenger_count", "INTEGER"),
+    ("trip_distance", "FLOAT"), ("payment_type", "STRING"), ("fare_amount", "FLOAT"),
+    ("tip_amount", "FLOAT"), ("total_amount", "FLOAT"),
+]
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """LLM de prueba con latencia fija; responde SQL o interpretación según el prompt"""
+
+    def __init__(self, latency: float = 0.05, sql: str = DEFAULT_SQL, answer: str = DEFAULT_ANSWER):
+        self.latency = latency
+        self.sql = sql
+        self.answer = answer
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def _reply(self, messages: List[Dict[str, str]]) -> str:
+        self.calls += 1
+        self.prompt_tokens += message_tokens(messages)
+        system = messages[0]["content"] if messages else ""
+        return self.sql if "Base de datos disponible" in system else self.answer
+
+    def invoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        time.sleep(self.latency)
+        return FakeMessage(self._reply(messages))
+
+    async def ainvoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self._reply(messages))
+
+    def stream(self, messages: List[Dict[str, str]]) -> Iterator[FakeMessage]:
+        time.sleep(self.latency)
+        for word in self._reply(messages).split(" "):
+            yield FakeMessage(word + " ")
+
+
+def burn_cpu(seconds: float) -> None:
+    """Trabajo de CPU que retiene el GIL (decodificar resultados, formatear, serializar)"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class FakeBigQueryClient:
+    """Cliente de BigQuery de prueba que bloquea el hilo como lo haría query_job.result()"""
+
+    def __init__(self, latency: float = 0.2, rows: List[Dict[str, Any]] = None, cpu: float = 0.0):
+        self.cpu = cpu
+        self.project_id = "bench-project"
+        self.dataset_id = "bench_dataset"
+        self.table_id = "taxi_trips"
+        self.latency = latency
+        self.rows = rows if rows is not None else [
+            {"hora": h, "total_viajes": 1000 + h, "tarifa_promedio": 12.5 + h / 10} for h in range(24)
+        ]
+        self.queries = 0
+
+    @property
+    def table_ref(self) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+
+    def get_table_metadata(self) -> Dict[str, Any]:
+        return {"etag": "fake", "num_rows": None, "fields": [
+            {"name": name, "type": field_type, "mode": "NULLABLE", "description": ""}
+            for name, field_type in FAKE_SCHEMA
+        ]}
+
+    def get_table_schema(self) -> List[str]:
+        return [name for name, _ in FAKE_SCHEMA]
+
+    def query_data(self, query: str, use_cache: bool = True) -> List[Dict[str, Any]]:
+        self.queries += 1
+        time.sleep(self.latency)
+        burn_cpu(self.cpu)
+        return list(self.rows)
+
+
+class FakeMemory:
+    """Memoria persistente de prueba con latencia de búsqueda configurable"""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.embedding_function = None
+        self.interactions: List[Dict[str, Any]] = []
+
+    def add_interaction(self, question: str, answer: str, metadata: Dict[str, Any] = None,
+                        user_id: str = None) -> None:
+        self.interactions.append({"question": question, "answer": answer, "metadata": metadata or {},
+                                  "user_id": user_id})
+
+    def get_relevant_history(self, query: str, n_results: int = 3, user_id: str = None) -> List[Dict[str, str]]:
+        time.sleep(self.latency)
+        return []
+
+    def count(self, user_id: str = None) -> int:
+        return sum(1 for i in self.interactions if not user_id or i["user_id"] == user_id)
+
+    def clear_memory(self, user_id: str = None) -> None:
+        self.interactions = [i for i in self.interactions if user_id and i["user_id"] != user_id]
+
+
+class QuotaLLM(FakeLLM):
+    """LLM de prueba con cuota: más de ``per_second`` llamadas en el último segundo responden 429"""
+
+    def __init__(self, per_second: int = 10, latency: float = 0.2, **kwargs):
+        super().__init__(latency=latency, **kwargs)
+        self.per_second = per_second
+        self.rejected = 0
+        self._window: List[float] = []
+        self._lock = threading.Lock()
+
+    def _admit(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.per_second:
+                self.rejected += 1
+                raise Exception("429 Resource has been exhausted (e.g. check quota).")
+            self._window.append(now)
+
+    def invoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        self._admit()
+        return super().invoke(messages)
+
+    async def ainvoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        self._admit()
+        return await super().ainvoke(messages)
+
+
+class ReplayLLM(FakeLLM):
+    """LLM que responde con grabaciones por pregunta (SQL e interpretación) y una latencia fija o grabada"""
+
+    def __init__(self, recordings: List[Dict[str, Any]], table_ref: str, latency: Optional[float] = None):
+        super().__init__(latency=latency or 0.0)
+        self.fixed_latency = latency
+        self.recordings = [dict(r, sql=r["sql"].format(table_ref=table_ref)) for r in recordings]
+
+    def _match(self, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        # Para el SQL la pregunta es el último mensaje; para la interpretación va dentro del prompt
+        last = messages[-1]["content"] if messages else ""
+        for recording in self.recordings:
+            if recording["question"] == last or f"Pregunta: {recording['question']}" in last:
+                return recording
+        return None
+
+    def _respond(self, messages: List[Dict[str, str]]) -> Tuple[str, float]:
+        self.calls += 1
+        self.prompt_tokens += message_tokens(messages)
+        wants_sql = "Base de datos disponible" in (messages[0]["content"] if messages else "")
+        recording = self._match(messages)
+        if recording is None:
+            return (self.sql if wants_sql else self.answer), self.fixed_latency or 0.0
+        kind = "sql" if wants_sql else "answer"
+        latency = self.fixed_latency if self.fixed_latency is not None else recording.get(f"{kind}_latency_s", 0.0)
+        return recording[kind], latency
+
+    def invoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        content, latency = self._respond(messages)
+        time.sleep(latency)
+        return FakeMessage(content)
+
+    async def ainvoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        content, latency = self._respond(messages)
+        await asyncio.sleep(latency)
+        return FakeMessage(content)
+
+    def stream(self, messages: List[Dict[str, str]]) -> Iterator[FakeMessage]:
+        content, latency = self._respond(messages)
+        time.sleep(latency)
+        for word in content.split(" "):
+            yield FakeMessage(word + " ")
+
+
+def fake_resources():
+    """Recursos con backends falsos para ``AGENT_RESOURCES_FACTORY`` (p. ej. en los workers de la API).
+
+    Latencias y CPU por consulta desde FAKE_LLM_LATENCY, FAKE_BQ_LATENCY y FAKE_CPU_MS.
+    """
+    from agent.resources import AgentResources
+
+    return AgentResources(
+        llm=FakeLLM(latency=float(os.getenv("FAKE_LLM_LATENCY", "0.05"))),
+        bq_client=FakeBigQueryClient(latency=float(os.getenv("FAKE_BQ_LATENCY", "0.2")),
+                                     cpu=float(os.getenv("FAKE_CPU_MS", "0")) / 1000),
+        memory=FakeMemory(latency=0.0),
+    )
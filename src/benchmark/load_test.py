@@ -0,0 +1,65 @@
+"""Prueba de carga del agente asíncrono con backends falsos.
+
+Uso (desde ``src``)::
+
+    python -m benchmark.load_test --requests 400 --concurrency 1 8 32 128
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+from agent.async_agent import AsyncGeminiAgent, AsyncScheduler
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+
+async def run_load(concurrency: int, total_requests: int, llm_latency: float = 0.05,
+                   bq_latency: float = 0.2) -> Dict[str, float]:
+    """Atiende ``total_requests`` preguntas de sesiones distintas con la concurrencia dada"""
+    scheduler = AsyncScheduler(max_concurrency=concurrency, max_workers=max(concurrency, 4))
+    agent = AsyncGeminiAgent(
+        use_cache=False,
+        llm=FakeLLM(latency=llm_latency),
+        bq_client=FakeBigQueryClient(latency=bq_latency),
+        memory=FakeMemory(),
+        scheduler=scheduler
+    )
+
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        start = time.perf_counter()
+        await agent.aget_response(f"¿Cuál es la tarifa promedio por hora? #{i}", session_id=f"s{i}")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - start
+    scheduler.executor.shutdown(wait=False)
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "p50_s": round(latencies[len(latencies) // 2], 3),
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de AsyncGeminiAgent")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--bq-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_load(concurrency, args.requests, args.llm_latency, args.bq_latency))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
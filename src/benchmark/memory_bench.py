@@ -0,0 +1,102 @@
+"""Micro-benchmark de ChromaMemory: latencia de escritura y de conteo según el tamaño.
+
+Usa un embedding sintético para medir solo el costo de Chroma. Uso (desde ``src``)::
+
+    python -m benchmark.memory_bench --size 100000 --checkpoints 1000 10000 100000
+"""
+import argparse
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+from typing import List
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from memory.chroma_memory import ChromaMemory
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Embedding determinista y barato derivado del hash del texto"""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = []
+        for text in input:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            embeddings.append([digest[i % len(digest)] / 255.0 for i in range(self.dim)])
+        return embeddings
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark-hash"
+
+
+def _median_ms(samples: List[float]) -> float:
+    samples = sorted(samples)
+    return round(samples[len(samples) // 2] * 1000, 3)
+
+
+def run(size: int, checkpoints: List[int], samples: int = 50) -> List[dict]:
+    persist_dir = tempfile.mkdtemp(prefix="chroma_bench_")
+    try:
+        memory = ChromaMemory(
+            collection_name="bench_history",
+            persist_dir=persist_dir,
+            embedding_function=HashEmbeddingFunction(),
+            batch_size=1000
+        )
+        report = []
+        stored = 0
+        for checkpoint in sorted(checkpoints):
+            checkpoint = min(checkpoint, size)
+            # Poblar hasta el checkpoint usando el camino por lotes
+            while stored < checkpoint:
+                memory.add_interaction(f"pregunta {stored}", f"respuesta {stored}", {"timestamp": str(stored)})
+                stored += 1
+            memory.flush()
+
+            add_times, flush_times, count_times = [], [], []
+            memory.batch_size = samples + 1
+            for i in range(samples):
+                start = time.perf_counter()
+                memory.add_interaction(f"extra {stored}-{i}", "respuesta", {"timestamp": "bench"})
+                add_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            memory.flush()
+            flush_times.append(time.perf_counter() - start)
+            memory.batch_size = 1000
+
+            for _ in range(samples):
+                start = time.perf_counter()
+                memory.count()
+                count_times.append(time.perf_counter() - start)
+
+            report.append({
+                "stored": memory.count(),
+                "add_ms_p50": _median_ms(add_times),
+                "flush_batch_ms": _median_ms(flush_times),
+                "flush_per_item_ms": round(flush_times[0] * 1000 / samples, 3),
+                "count_ms_p50": _median_ms(count_times),
+            })
+            if checkpoint >= size:
+                break
+        return report
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ChromaMemory")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    for row in run(args.size, args.checkpoints, args.samples):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
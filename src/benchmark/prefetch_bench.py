@@ -0,0 +1,201 @@
+"""Mide la ejecución especulativa de consultas de seguimiento (SPECULATIVE_PREFETCH).
+
+Cada conversación es una pregunta del sidebar seguida de una pregunta de
+seguimiento, con respuestas grabadas del LLM y DuckDB sobre un extracto
+sintético con una latencia agregada que simula BigQuery. Se corre sin y con
+modo especulativo y se reportan la latencia de las preguntas de seguimiento,
+la tasa de acierto de los resultados especulativos, el tiempo ahorrado y el
+costo extra (consultas y bytes estimados).
+Uso (desde ``src``)::
+
+    python -m benchmark.prefetch_bench --query-latency 0.5 --think-time 1.0
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmark.corpus import SIDEBAR_CORPUS
+from benchmark.engine_bench import TABLE_REF, write_extract
+from benchmark.fakes import FakeMemory, ReplayLLM
+from benchmark.replay import RecordingBackend, _bq_client, _catalog, _percentiles
+from data.query_cache import QueryCache
+
+# Pregunta del sidebar -> seguimiento, con el SQL que escribiría el LLM (las dos últimas no son variantes)
+FOLLOW_UPS: List[Dict[str, Any]] = [
+    {
+        "after": "¿Cuánto se gana en propinas en hora pico?",
+        "question": "¿Y por día de la semana?",
+        "sql": """SELECT
+    CASE EXTRACT(DAYOFWEEK FROM pickup_datetime)
+        WHEN 1 THEN 'Domingo'
+        WHEN 2 THEN 'Lunes'
+        WHEN 3 THEN 'Martes'
+        WHEN 4 THEN 'Miércoles'
+        WHEN 5 THEN 'Jueves'
+        WHEN 6 THEN 'Viernes'
+        WHEN 7 THEN 'Sábado'
+    END as dia_semana,
+    ROUND(AVG(tip_amount), 2) as propina_promedio,
+    ROUND(SUM(tip_amount), 2) as propinas_total
+FROM {table_ref}
+WHERE EXTRACT(HOUR FROM pickup_datetime) IN (7, 8, 9, 17, 18, 19)
+GROUP BY dia_semana
+ORDER BY MIN(EXTRACT(DAYOFWEEK FROM pickup_datetime))""",
+        "answer": "📊 El viernes deja más propinas en hora pico\n📝 El domingo es el más bajo",
+    },
+    {
+        "after": "¿Cuál es la tarifa promedio por viaje?",
+        "question": "¿Y la propina promedio?",
+        "sql": """SELECT
+    ROUND(AVG(tip_amount), 2) as propina_promedio,
+    COUNT(*) as total_viajes
+FROM {table_ref}
+WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 30 DAY)""",
+        "answer": "📊 La propina promedio es $2.00 USD\n📝 Calculada sobre los viajes de los últimos 30 días",
+    },
+    {
+        "after": "¿Cuál es el pago total promedio por viaje?",
+        "question": "¿Y el pago total por hora?",
+        "sql": """SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    ROUND(AVG(total_amount), 2) as pago_total_promedio
+FROM {table_ref}
+WHERE total_amount > 0
+GROUP BY hora
+ORDER BY hora""",
+        "answer": "📊 El pago total más alto es a las 5 AM\n📝 Los viajes de madrugada son más largos",
+    },
+    {
+        "after": "¿Cuánto duran los viajes en promedio?",
+        "question": "¿Y la duración por mes?",
+        "sql": """SELECT
+    EXTRACT(MONTH FROM pickup_datetime) as mes,
+    ROUND(AVG(TIMESTAMP_DIFF(dropoff_datetime, pickup_datetime, MINUTE)), 1) as duracion_promedio_min
+FROM {table_ref}
+WHERE dropoff_datetime > pickup_datetime
+GROUP BY mes
+ORDER BY mes""",
+        "answer": "📊 La duración promedio casi no cambia entre meses\n📝 Ronda los 12 minutos",
+    },
+    {
+        "after": "¿Qué día de la semana hay más viajes?",
+        "question": "¿Y los viajes por hora?",
+        "sql": """SELECT
+    EXTRACT(HOUR FROM pickup_datetime) as hora,
+    COUNT(*) as total_viajes
+FROM {table_ref}
+GROUP BY hora
+ORDER BY total_viajes DESC""",
+        "answer": "📊 La hora con más viajes es las 6 PM\n📝 La madrugada es la más tranquila",
+    },
+    {
+        "after": "¿Cuáles son las horas más ocupadas?",
+        "question": "¿Cuál fue el viaje más largo?",
+        "sql": """SELECT
+    ROUND(trip_distance, 2) as distancia_millas,
+    ROUND(fare_amount, 2) as tarifa_usd
+FROM {table_ref}
+WHERE trip_distance > 0 AND trip_distance < 100
+ORDER BY trip_distance DESC
+LIMIT 1""",
+        "answer": "📊 El viaje más largo fue de 99.5 millas\n📝 Con una tarifa de $250 USD",
+    },
+]
+
+
+class SlowBackend(RecordingBackend):
+    """DuckDB con la latencia y el dry run de BigQuery simulados"""
+
+    def __init__(self, *args, latency: float = 0.5, bytes_per_query: int = 200 * 1024 ** 2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.bytes_per_query = bytes_per_query
+
+    def query(self, sql: str):
+        time.sleep(self.latency)
+        return super().query(sql)
+
+    def dry_run(self, sql: str) -> Optional[int]:
+        return self.bytes_per_query
+
+
+def run(parquet_path: str, speculative: bool, query_latency: float, think_time: float,
+        llm_latency: float, budget: int) -> Dict[str, Any]:
+    from agent.chat_agent import GeminiAgent
+    from agent.resources import AgentResources, ConversationState
+
+    os.environ["SPECULATIVE_PREFETCH"] = "1" if speculative else "0"
+    os.environ["PREFETCH_MAX_BYTES"] = str(budget)
+    workdir = tempfile.mkdtemp(prefix="prefetch_bench_")
+    try:
+        backend = SlowBackend(parquet_path, TABLE_REF, complete=True, latency=query_latency)
+        bq_client = _bq_client(backend, cache=QueryCache())
+        recordings = SIDEBAR_CORPUS + FOLLOW_UPS
+        resources = AgentResources(llm=ReplayLLM(recordings, TABLE_REF, llm_latency), bq_client=bq_client,
+                                   memory=FakeMemory(latency=0), schema_catalog=_catalog(bq_client, workdir))
+        # Calentamiento: primera lectura del Parquet fuera de la medición
+        backend.query(f"SELECT COUNT(*) FROM {TABLE_REF}")
+        backend.executed.clear()
+
+        first, follow = [], []
+        for index, item in enumerate(FOLLOW_UPS):
+            agent = GeminiAgent(resources=resources, use_cache=False, state=ConversationState(f"bench-{index}"))
+            start = time.perf_counter()
+            agent.get_response(item["after"])
+            first.append(time.perf_counter() - start)
+
+            time.sleep(think_time)
+            start = time.perf_counter()
+            agent.get_response(item["question"])
+            follow.append(time.perf_counter() - start)
+
+        report = {
+            "first_question": _percentiles(first),
+            "follow_up": _percentiles(follow),
+            "follow_up_mean_ms": round(sum(follow) * 1000 / len(follow), 2),
+            "backend_queries": len(backend.executed),
+        }
+        if resources.prefetcher is not None:
+            while resources.prefetcher.pending():
+                time.sleep(0.05)
+            prefetch = resources.prefetcher.report()
+            report["prefetch"] = prefetch
+            report["estimated_bytes_speculative"] = prefetch["executed"] * backend.bytes_per_query
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ejecución especulativa de seguimientos")
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--query-latency", type=float, default=0.5, help="latencia simulada de BigQuery (s)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="pausa entre la respuesta y el seguimiento")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--budget", type=int, default=1024 ** 3, help="PREFETCH_MAX_BYTES por ronda")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="prefetch_extract_")
+    try:
+        parquet_path = os.path.join(workdir, "taxi_trips.parquet")
+        write_extract(parquet_path, args.rows, args.days)
+        results = {
+            mode: run(parquet_path, mode == "especulativo", args.query_latency, args.think_time,
+                      args.llm_latency, args.budget)
+            for mode in ("secuencial", "especulativo")
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base, spec = results["secuencial"]["follow_up"]["p50_ms"], results["especulativo"]["follow_up"]["p50_ms"]
+    results["follow_up_p50_change_pct"] = round((spec - base) * 100 / base, 1) if base else None
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Goodput y latencia de cola ante ráfagas contra un LLM con cuota, con y sin limitador.
+
+Cada pregunta hace dos llamadas (SQL e interpretación) a un LLM falso que
+responde 429 por encima de ``--quota`` llamadas por segundo. Llegan
+``--bursts`` ráfagas de ``--burst-size`` preguntas; una parte repite las
+preguntas populares. Se comparan:
+
+- ``sin_limitador``: el comportamiento anterior, con reintentos sin
+  coordinar: el cliente reintenta cada llamada con backoff exponencial (1 s,
+  2 s) y el agente, tras esperar 1 s, repite la pregunta completa una vez;
+- ``limitador``: RateLimitedLLM con la cuota configurada (90%), prioridades y
+  coalescencia;
+- ``limitador_adaptativo``: igual pero sin conocer la cuota (solo backoff por 429).
+
+Uso (desde ``src``)::
+
+    python -m benchmark.rate_limit_bench [--quota 10] [--bursts 3] [--burst-size 40]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from agent.rate_limiter import PRIORITY_FOLLOWUP, RateLimitedLLM, RateLimiter, is_rate_limited
+from benchmark.fakes import QuotaLLM
+
+POPULAR = ["tarifa promedio por hora", "viajes por día de la semana", "propina promedio por tipo de pago"]
+
+
+def _questions(bursts: int, burst_size: int, duplicate_ratio: float, seed: int = 7) -> List[List[str]]:
+    rng = random.Random(seed)
+    return [
+        [rng.choice(POPULAR) if rng.random() < duplicate_ratio else f"pregunta {b}-{i}" for i in range(burst_size)]
+        for b in range(bursts)
+    ]
+
+
+def _messages(kind: str, question: str) -> List[Dict[str, str]]:
+    return [{"role": "user", "content": f"{kind}: {question}"}]
+
+
+def _with_client_retries(llm: QuotaLLM, messages: List[Dict[str, str]], attempts: int = 3) -> None:
+    for attempt in range(attempts):
+        try:
+            llm.invoke(messages)
+            return
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def _legacy(llm: QuotaLLM) -> Callable[[str], None]:
+    def ask(question: str) -> None:
+        for attempt in range(2):
+            try:
+                _with_client_retries(llm, _messages("sql", question))
+                _with_client_retries(llm, _messages("interpretacion", question))
+                return
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == 1:
+                    raise
+                time.sleep(1)
+    return ask
+
+
+def _limited(llm: RateLimitedLLM) -> Callable[[str], None]:
+    def ask(question: str) -> None:
+        llm.invoke(_messages("sql", question))
+        llm.invoke(_messages("interpretacion", question), priority=PRIORITY_FOLLOWUP)
+    return ask
+
+
+def run(mode: str, questions: List[List[str]], quota: int, burst_gap: float, latency: float) -> Dict[str, Any]:
+    llm = QuotaLLM(per_second=quota, latency=latency)
+    limiter: Optional[RateLimiter] = None
+    if mode == "sin_limitador":
+        ask = _legacy(llm)
+    else:
+        # El LLM falso mide la cuota por segundo: un segundo aquí equivale a un minuto real.
+        # La cuota se configura con 10% de margen y sin ráfaga (un solo token en el bucket)
+        rpm = quota * 60 * 0.9 if mode == "limitador" else 0
+        limiter = RateLimiter(rpm=rpm, max_wait=30, burst_seconds=1 / quota)
+        ask = _limited(RateLimitedLLM(llm, limiter))
+
+    latencies: List[float] = []
+    failures = []
+    lock = threading.Lock()
+
+    def client(question: str) -> None:
+        start = time.perf_counter()
+        try:
+            ask(question)
+        except Exception as e:
+            with lock:
+                failures.append(str(e)[:40])
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = []
+    start = time.perf_counter()
+    for burst in questions:
+        for question in burst:
+            thread = threading.Thread(target=client, args=(question,))
+            thread.start()
+            threads.append(thread)
+        time.sleep(burst_gap)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3) if latencies else None
+    return {
+        "preguntas": sum(len(b) for b in questions),
+        "completadas": len(latencies),
+        "fallidas": len(failures),
+        "elapsed_s": round(elapsed, 2),
+        "goodput_qps": round(len(latencies) / elapsed, 2),
+        "p50_s": pct(0.5),
+        "p95_s": pct(0.95),
+        "p99_s": pct(0.99),
+        "llamadas_llm": llm.calls,
+        "respuestas_429": llm.rejected,
+        **({"limitador": dict(limiter.stats)} if limiter else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ráfagas contra un LLM con cuota, con y sin limitador")
+    parser.add_argument("--quota", type=int, default=10, help="llamadas por segundo que acepta el LLM falso")
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--burst-size", type=int, default=40)
+    parser.add_argument("--burst-gap", type=float, default=2.0)
+    parser.add_argument("--duplicates", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    questions = _questions(args.bursts, args.burst_size, args.duplicates)
+    report = {mode: run(mode, questions, args.quota, args.burst_gap, args.latency)
+              for mode in ("sin_limitador", "limitador", "limitador_adaptativo")}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Suite de benchmarks sin servicios externos: replay del agente y micro-benchmarks.
+
+- ``agent``: reproduce el corpus del sidebar (benchmark/corpus.py) contra
+  ``GeminiAgent.get_response`` con respuestas grabadas del LLM, DuckDB sobre un
+  extracto sintético de viajes como sustituto de BigQuery y ChromaMemory con
+  embeddings sintéticos. Reporta latencia p50/p95/p99, throughput, tokens,
+  filas leídas y la mediana de cada etapa.
+- ``memory``: escritura y búsqueda en ChromaMemory.
+- ``client``: ``BigQueryClient.query_data`` por consulta del corpus, sin caché y
+  con caché.
+
+El reporte es un JSON; con ``--out`` se guarda y con ``--compare`` se agrega la
+variación porcentual contra un reporte anterior.
+Uso (desde ``src``)::
+
+    python -m benchmark.replay [--suites agent memory client] [--iterations 5] [--concurrency 4]
+                               [--recordings grabaciones.jsonl] [--out run.json] [--compare base.json]
+    python -m benchmark.replay --record grabaciones.jsonl   # graba respuestas reales de Gemini
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from benchmark.corpus import SIDEBAR_CORPUS
+from benchmark.engine_bench import TABLE_REF, write_extract
+from benchmark.fakes import ReplayLLM
+from benchmark.memory_bench import HashEmbeddingFunction
+from data.backends import DuckDBBackend
+from data.query_cache import QueryCache
+from observability.metrics import metrics
+
+# El cliente arma la referencia de la tabla desde estas variables
+BENCH_ENV = {"BQ_PROJECT_ID": "bench-project", "BQ_DATASET_ID": "bench_dataset", "BQ_TABLE_ID": "taxi_trips"}
+
+
+class RecordingBackend(DuckDBBackend):
+    """DuckDBBackend que anota cada SQL ejecutado, para contar las filas leídas después de medir"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executed: List[str] = []
+
+    def query(self, sql: str):
+        self.executed.append(sql)
+        return super().query(sql)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples)
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    pick = lambda p: round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def _load_recordings(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return SIDEBAR_CORPUS
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _bq_client(backend: DuckDBBackend, cache: Optional[QueryCache] = None):
+    from data.bigquery_client import BigQueryClient
+
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    # max_bytes=0: sin caché de resultados, cada pregunta llega al motor
+    return BigQueryClient(cache=cache or QueryCache(max_bytes=0), backend=backend)
+
+
+def _catalog(bq_client, workdir: str):
+    from data.schema_catalog import SchemaCatalog
+
+    # El catálogo de la tabla sintética no debe pisar el de la tabla real
+    return SchemaCatalog(bq_client, cache_path=os.path.join(workdir, "schema_catalog.json"))
+
+
+def _memory(persist_dir: str):
+    from memory.chroma_memory import ChromaMemory
+
+    return ChromaMemory(collection_name="bench_replay", persist_dir=persist_dir,
+                        embedding_function=HashEmbeddingFunction())
+
+
+def _token_counters() -> Dict[str, float]:
+    counters = metrics.snapshot()["counters"]
+    return {kind: counters.get(f'llm_tokens_total{{kind="{kind}"}}', 0.0) for kind in ("prompt", "completion")}
+
+
+def bench_agent(parquet_path: str, recordings: List[Dict[str, Any]], iterations: int, concurrency: int,
+                llm_latency: Optional[float]) -> Dict[str, Any]:
+    from agent.chat_agent import GeminiAgent
+    from agent.resources import AgentResources, ConversationState
+
+    backend = RecordingBackend(parquet_path, TABLE_REF, complete=True)
+    persist_dir = tempfile.mkdtemp(prefix="replay_chroma_")
+    try:
+        bq_client = _bq_client(backend)
+        memory = _memory(persist_dir)
+        resources = AgentResources(llm=ReplayLLM(recordings, TABLE_REF, llm_latency), bq_client=bq_client,
+                                   memory=memory, schema_catalog=_catalog(bq_client, persist_dir))
+        # Calentamiento: catálogo, prompts y primera lectura del Parquet fuera de la medición
+        GeminiAgent(resources=resources, use_cache=False).get_response(recordings[0]["question"])
+        backend.executed.clear()
+
+        questions = [r["question"] for _ in range(iterations) for r in recordings]
+        latencies: List[float] = []
+        stages: Dict[str, List[float]] = {}
+        failures = 0
+        lock = threading.Lock()
+        pending = iter(enumerate(questions))
+
+        def worker():
+            nonlocal failures
+            while True:
+                with lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                index, question = item
+                agent = GeminiAgent(resources=resources, use_cache=False, state=ConversationState(f"bench-{index}"))
+                start = time.perf_counter()
+                answer = agent.get_response(question)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    failures += answer.startswith("📊 Error")
+                    for stage, seconds in agent.last_trace.stages.items():
+                        stages.setdefault(stage, []).append(seconds)
+
+        tokens_before = _token_counters()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        tokens_after = _token_counters()
+
+        # Filas leídas: cada SQL distinto se perfila una vez, fuera de la medición de latencia
+        executed = Counter(backend.executed)
+        rows_scanned = sum(backend.rows_scanned(sql) * count for sql, count in executed.items())
+        return {
+            "requests": len(questions),
+            "concurrency": concurrency,
+            "errors": failures,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(questions) / elapsed, 2),
+            **_percentiles(latencies),
+            "prompt_tokens_per_request": round((tokens_after["prompt"] - tokens_before["prompt"]) / len(questions), 1),
+            "completion_tokens_per_request": round(
+                (tokens_after["completion"] - tokens_before["completion"]) / len(questions), 1),
+            "rows_scanned_per_request": round(rows_scanned / len(questions)),
+            "stages_p50_ms": {stage: _percentiles(samples)["p50_ms"] for stage, samples in stages.items()},
+        }
+    finally:
+        # Escribir el lote pendiente antes de borrar el directorio (si no, lo intenta al salir)
+        memory.flush()
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def bench_memory(size: int, samples: int) -> Dict[str, Any]:
+    persist_dir = tempfile.mkdtemp(prefix="replay_memory_")
+    try:
+        memory = _memory(persist_dir)
+        for i in range(size):
+            memory.add_interaction(f"pregunta {i} sobre tarifas", f"📊 respuesta {i}", {"timestamp": str(i)})
+        memory.flush()
+
+        add_times, search_times = [], []
+        for i in range(samples):
+            start = time.perf_counter()
+            memory.add_interaction(f"extra {i}", "📊 respuesta", {"timestamp": "bench"})
+            add_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        memory.flush()
+        flush_s = time.perf_counter() - start
+
+        for i in range(samples):
+            question = SIDEBAR_CORPUS[i % len(SIDEBAR_CORPUS)]["question"]
+            start = time.perf_counter()
+            memory.get_relevant_items(question, n_results=3)
+            search_times.append(time.perf_counter() - start)
+        return {
+            "stored": memory.count(),
+            "add": _percentiles(add_times),
+            "flush_per_item_ms": round(flush_s * 1000 / samples, 3),
+            "search": _percentiles(search_times),
+        }
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def bench_client(parquet_path: str, recordings: List[Dict[str, Any]], samples: int) -> Dict[str, Any]:
+    backend = DuckDBBackend(parquet_path, TABLE_REF, complete=True)
+    client = _bq_client(backend, QueryCache())
+    report = {}
+    for recording in recordings:
+        sql = recording["sql"].format(table_ref=TABLE_REF)
+        cold, cached = [], []
+        for _ in range(samples):
+            start = time.perf_counter()
+            result = client.query_data(sql, use_cache=False)
+            result.table  # materializa todos los lotes
+            cold.append(time.perf_counter() - start)
+        client.query_data(sql)
+        for _ in range(samples):
+            start = time.perf_counter()
+            client.query_data(sql).table
+            cached.append(time.perf_counter() - start)
+        report[recording["question"]] = {
+            "rows": len(result),
+            "rows_scanned": backend.rows_scanned(sql),
+            "cold": _percentiles(cold),
+            "cached": _percentiles(cached),
+        }
+    return report
+
+
+def record(parquet_path: str, out_path: str) -> None:
+    """Graba SQL, interpretación y latencias reales de Gemini para cada pregunta del corpus"""
+    from agent.chat_agent import GeminiAgent
+    from agent.resources import AgentResources, create_llm
+
+    class Recorder:
+        def __init__(self, llm):
+            self.llm = llm
+            self.calls: List[Dict[str, Any]] = []
+
+        def invoke(self, messages, **kwargs):
+            start = time.perf_counter()
+            response = self.llm.invoke(messages, **kwargs)
+            self.calls.append({"content": response.content, "latency_s": round(time.perf_counter() - start, 3)})
+            return response
+
+    recorder = Recorder(create_llm())
+    persist_dir = tempfile.mkdtemp(prefix="record_chroma_")
+    try:
+        bq_client = _bq_client(DuckDBBackend(parquet_path, TABLE_REF, complete=True))
+        resources = AgentResources(llm=recorder, bq_client=bq_client, memory=_memory(persist_dir),
+                                   schema_catalog=_catalog(bq_client, persist_dir))
+        os.environ["ANSWER_MODE"] = "llm"  # siempre hay interpretación para grabar
+        with open(out_path, "w", encoding="utf-8") as f:
+            for entry in SIDEBAR_CORPUS:
+                recorder.calls.clear()
+                GeminiAgent(resources=resources, use_cache=False).get_response(entry["question"])
+                sql_call, answer_call = recorder.calls[0], recorder.calls[-1]
+                f.write(json.dumps({
+                    "question": entry["question"],
+                    "sql": sql_call["content"].replace(TABLE_REF, "{table_ref}"),
+                    "answer": answer_call["content"],
+                    "sql_latency_s": sql_call["latency_s"],
+                    "answer_latency_s": answer_call["latency_s"],
+                }, ensure_ascii=False) + "\n")
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+def _flatten(report: Any, prefix: str = "") -> Dict[str, float]:
+    if isinstance(report, dict):
+        flat = {}
+        for key, value in report.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else key))
+        return flat
+    if isinstance(report, (int, float)) and not isinstance(report, bool):
+        return {prefix: float(report)}
+    return {}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, float]:
+    """Variación porcentual de cada métrica numérica presente en ambos reportes"""
+    before = _flatten(baseline.get("results", {}))
+    after = _flatten(current.get("results", {}))
+    return {key: round(100 * (after[key] - value) / value, 1)
+            for key, value in before.items() if key in after and value}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks sin servicios externos del agente NL→SQL")
+    parser.add_argument("--suites", nargs="+", default=["agent", "memory", "client"],
+                        choices=["agent", "memory", "client"])
+    parser.add_argument("--rows", type=int, default=500000, help="filas del extracto sintético")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--parquet", default=None, help="extracto existente (si no, se genera uno sintético)")
+    parser.add_argument("--recordings", default=None, help="JSONL grabado con --record")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=None,
+                        help="latencia fija del LLM (por defecto la grabada o 0)")
+    parser.add_argument("--memory-size", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--record", default=None, help="graba respuestas reales de Gemini en este JSONL y termina")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="reporte anterior para calcular la variación")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    try:
+        parquet_path = args.parquet
+        if parquet_path is None:
+            parquet_path = os.path.join(workdir, "taxi_trips.parquet")
+            write_extract(parquet_path, args.rows, args.days)
+
+        if args.record:
+            record(parquet_path, args.record)
+            return
+
+        recordings = _load_recordings(args.recordings)
+        results: Dict[str, Any] = {}
+        if "agent" in args.suites:
+            results["agent"] = bench_agent(parquet_path, recordings, args.iterations, args.concurrency,
+                                           args.llm_latency)
+        if "memory" in args.suites:
+            results["memory"] = bench_memory(args.memory_size, args.samples)
+        if "client" in args.suites:
+            results["client"] = bench_client(parquet_path, recordings, args.samples)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "params": vars(args),
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison_pct"] = compare(report, json.load(f))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compara el camino de resultados por filas (lista de dicts) con el columnar (Arrow).
+
+Para cada tamaño de resultado ejecuta la misma consulta en DuckDB y mide
+latencia y memoria hasta obtener las 5 filas formateadas que usa la
+interpretación: ``rows`` materializa todas las filas como diccionarios y las
+formatea una por una (comportamiento anterior); ``arrow`` lee lotes a demanda
+y formatea por columna; ``arrow_cached`` pasa por ``BigQueryClient`` con la
+caché de consultas activa (como en el agente): los resultados de más de
+QUERY_CACHE_MAX_ROWS filas no se leen completos para guardarlos.
+Uso (desde ``src``)::
+
+    python -m benchmark.result_bench --sizes 1000 100000 1000000
+"""
+import argparse
+import gc
+import json
+import tempfile
+import os
+import time
+import tracemalloc
+from benchmark.engine_bench import TABLE_REF, write_extract
+from data.backends import DuckDBBackend
+from data.query_cache import QueryCache
+
+QUERY = f"SELECT pickup_datetime, trip_distance, fare_amount, tip_amount, total_amount FROM `{TABLE_REF}` LIMIT {{rows}}"
+
+
+def _legacy_format(rows):
+    """Formato fila por fila del agente antes del camino columnar"""
+    formatted_results = []
+    for row in rows[:5]:
+        formatted_row = {}
+        for key, value in row.items():
+            if isinstance(value, float):
+                if 'distance' in key.lower():
+                    formatted_row[key] = f"{value:.2f} millas"
+                elif any(word in key.lower() for word in ['fare', 'amount', 'total', 'tip']):
+                    formatted_row[key] = f"${value:.2f}"
+                else:
+                    formatted_row[key] = f"{value:.2f}"
+            else:
+                formatted_row[key] = value
+        formatted_results.append(formatted_row)
+    return formatted_results
+
+
+def _rows_path(backend: DuckDBBackend, sql: str):
+    cursor = backend._conn.cursor()
+    result = cursor.execute(backend.translate(sql))
+    columns = [column[0] for column in result.description]
+    rows = [dict(zip(columns, row)) for row in result.fetchall()]
+    preview = _legacy_format(rows)
+    cursor.close()
+    return preview, 0
+
+
+def _arrow_path(backend: DuckDBBackend, sql: str):
+    result = backend.query(sql)
+    preview = result.preview(5)
+    return preview, sum(batch.nbytes for batch in result._batches)
+
+
+def _arrow_cached_path(backend: DuckDBBackend, sql: str):
+    from benchmark.replay import _bq_client
+
+    result = _bq_client(backend, cache=QueryCache()).query_data(sql)
+    preview = result.preview(5)
+    return preview, sum(batch.nbytes for batch in result._batches)
+
+
+def _measure(fn, backend: DuckDBBackend, sql: str):
+    # Latencia sin tracemalloc (que penaliza la creación de objetos) y memoria en una segunda corrida
+    gc.collect()
+    start = time.perf_counter()
+    preview, arrow_bytes = fn(backend, sql)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    fn(backend, sql)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "latency_ms": round(elapsed * 1000, 2),
+        "python_peak_mb": round(python_peak / 1e6, 2),
+        "arrow_mb": round(arrow_bytes / 1e6, 2),
+        "preview_rows": len(preview),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de resultados por filas vs columnar")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    args = parser.parse_args()
+
+    parquet_path = os.path.join(tempfile.mkdtemp(), "taxi_recent.parquet")
+    write_extract(parquet_path, max(args.sizes), 30)
+    backend = DuckDBBackend(parquet_path, TABLE_REF, complete=True)
+    _arrow_path(backend, QUERY.format(rows=10))  # calentamiento (imports y caché del Parquet)
+
+    report = {}
+    for size in args.sizes:
+        sql = QUERY.format(rows=size)
+        report[size] = {
+            name: _measure(fn, backend, sql)
+            for name, fn in [("rows", _rows_path), ("arrow", _arrow_path), ("arrow_cached", _arrow_cached_path)]
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compara consultas sobre la tabla cruda y su reescritura sobre el rollup usando DuckDB.
+
+Verifica que los resultados sean idénticos y reporta filas leídas y latencia.
+Uso (desde ``src``)::
+
+    python -m benchmark.rollup_bench --rows 1000000
+"""
+import argparse
+import json
+import time
+import duckdb
+from data.rollups import RollupRewriter, rollup_select_sql
+
+SOURCE = "bench_taxi_trips"
+ROLLUP = "bench_taxi_trips_rollup_hourly"
+
+QUERIES = [
+    f"""SELECT EXTRACT(HOUR FROM pickup_datetime) as hora, COUNT(*) as total_viajes,
+        ROUND(AVG(fare_amount), 2) as tarifa_promedio, ROUND(AVG(tip_amount), 2) as propina_promedio
+    FROM {SOURCE} GROUP BY hora ORDER BY hora""",
+    f"""SELECT CASE EXTRACT(DAYOFWEEK FROM pickup_datetime) WHEN 0 THEN 'Domingo' WHEN 1 THEN 'Lunes'
+        WHEN 2 THEN 'Martes' WHEN 3 THEN 'Miércoles' WHEN 4 THEN 'Jueves' WHEN 5 THEN 'Viernes'
+        WHEN 6 THEN 'Sábado' END as dia_semana, COUNT(*) as total_viajes,
+        ROUND(AVG(trip_distance), 2) as distancia_promedio, ROUND(AVG(total_amount), 2) as ingreso_promedio
+    FROM {SOURCE} GROUP BY dia_semana ORDER BY MIN(EXTRACT(DAYOFWEEK FROM pickup_datetime))""",
+    f"""SELECT payment_type, COUNT(*) as viajes, ROUND(SUM(tip_amount), 2) as propinas
+    FROM {SOURCE} WHERE DATE(pickup_datetime) >= DATE '2024-03-01' GROUP BY payment_type ORDER BY payment_type""",
+    f"SELECT ROUND(AVG(fare_amount), 2) as tarifa_promedio FROM {SOURCE}",
+]
+
+
+def load(con: duckdb.DuckDBPyConnection, rows: int) -> None:
+    """Tabla sintética con la forma de los viajes de taxi y su rollup"""
+    con.execute(f"""CREATE TABLE {SOURCE} AS SELECT
+        TIMESTAMP '2024-01-01' + (i * 137 % 250000) * INTERVAL 1 MINUTE AS pickup_datetime,
+        TIMESTAMP '2024-01-01' + (i * 137 % 250000 + 12) * INTERVAL 1 MINUTE AS dropoff_datetime,
+        (i % 70) / 10.0 + 0.3 AS trip_distance,
+        ['CSH', 'CRD', 'DIS', 'NOC'][i % 4 + 1] AS payment_type,
+        CASE WHEN i % 97 = 0 THEN NULL ELSE (i % 50) + 2.5 END AS fare_amount,
+        (i % 9) * 0.5 AS tip_amount,
+        (i % 60) + 3.0 AS total_amount
+    FROM range({rows}) t(i)""")
+    con.execute("CREATE MACRO SAFE_DIVIDE(a, b) AS a / NULLIF(b, 0)")
+    con.execute(f"CREATE TABLE {ROLLUP} AS " + rollup_select_sql(SOURCE).replace("`", ""))
+
+
+def _timed(con: duckdb.DuckDBPyConnection, sql: str):
+    start = time.perf_counter()
+    rows = con.execute(sql).fetchall()
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de reescritura a rollups")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    load(con, args.rows)
+    rollup_rows = con.execute(f"SELECT COUNT(*) FROM {ROLLUP}").fetchone()[0]
+    rewriter = RollupRewriter(SOURCE, ROLLUP)
+
+    for sql in QUERIES:
+        rewritten = rewriter.rewrite(sql)
+        raw, raw_s = _timed(con, sql)
+        if rewritten is None:
+            print(json.dumps({"query": sql[:60], "rewritten": False}))
+            continue
+        fast, fast_s = _timed(con, rewritten.replace("`", ""))
+        print(json.dumps({
+            "query": " ".join(sql.split())[:60],
+            "identical": raw == fast,
+            "rows_scanned_raw": args.rows,
+            "rows_scanned_rollup": rollup_rows,
+            "raw_ms": round(raw_s * 1000, 2),
+            "rollup_ms": round(fast_s * 1000, 2),
+        }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
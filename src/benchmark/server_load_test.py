@@ -0,0 +1,143 @@
+"""Prueba de carga de la API (server.py) con distintos números de workers y backends falsos.
+
+Cada configuración levanta ``python -m server --workers N`` con
+``AGENT_RESOURCES_FACTORY=benchmark.fakes:fake_resources`` y estado
+compartido en un directorio temporal, y envía ``--requests`` preguntas de
+usuarios distintos con ``--concurrency`` conexiones. ``--cpu-ms`` agrega
+trabajo que retiene el GIL por solicitud, que es lo que limita a un solo
+proceso; la escala con los workers depende de los núcleos disponibles
+(``cpu_count`` en el reporte).
+Uso (desde ``src``)::
+
+    python -m benchmark.server_load_test --workers 1 2 4 --requests 400 --concurrency 64 --cpu-ms 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOAD_TEST_KEY = "load-test-key"
+
+
+def start_server(workers: int, port: int, shared_dir: str, args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        AGENT_RESOURCES_FACTORY="benchmark.fakes:fake_resources",
+        FAKE_LLM_LATENCY=str(args.llm_latency),
+        FAKE_BQ_LATENCY=str(args.bq_latency),
+        FAKE_CPU_MS=str(args.cpu_ms),
+        SHARED_STATE_DIR=shared_dir,
+        AGENT_API_KEY=LOAD_TEST_KEY,
+        SCHEMA_CACHE_PATH=os.path.join(shared_dir, "schema_catalog.json"),
+        EMBEDDING_WARMUP="0",
+        LOG_LEVEL="WARNING",
+    )
+    for name in ("QUERY_CACHE_PATH", "RESPONSE_CACHE_PATH", "SESSION_STORE_PATH"):
+        env.pop(name, None)
+    return subprocess.Popen([sys.executable, "-m", "server", "--workers", str(workers), "--port", str(port),
+                             "--host", "127.0.0.1"], cwd=SRC_DIR, env=env)
+
+
+def wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"La API no respondió en {timeout} s")
+
+
+async def run_load(base_url: str, total_requests: int, concurrency: int, offset: int = 0) -> Dict[str, Any]:
+    """Preguntas distintas (sin aciertos de caché) de usuarios distintos"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    pids = set()
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, headers={"X-API-Key": LOAD_TEST_KEY},
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={
+                        "question": f"¿Cuál es la tarifa promedio por hora? #{offset + i}",
+                        "user_id": f"load-{offset + i}",
+                    })
+                    failed = response.status_code != 200 or response.json()["answer"].startswith("📊 Error")
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - start
+        # Conexiones nuevas para que el kernel reparta entre los workers
+        for _ in range(20):
+            pids.add((await client.get("/health", headers={"Connection": "close"})).json()["pid"])
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "p50_s": round(latencies[len(latencies) // 2], 3),
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "worker_pids_seen": len(pids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con varios workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--bq-latency", type=float, default=0.2)
+    parser.add_argument("--cpu-ms", type=float, default=10, help="CPU con el GIL tomado por consulta")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    for workers in args.workers:
+        shared_dir = tempfile.mkdtemp(prefix="server_load_")
+        server = start_server(workers, args.port, shared_dir, args)
+        try:
+            wait_ready(base_url)
+            # Calentamiento: que todos los workers hayan atendido alguna solicitud
+            asyncio.run(run_load(base_url, workers * 8, workers * 4, offset=10 ** 6))
+            result = asyncio.run(run_load(base_url, args.requests, args.concurrency))
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            shutil.rmtree(shared_dir, ignore_errors=True)
+        results.append({"workers": workers, **result})
+
+    base = results[0]["throughput_rps"] / results[0]["workers"]
+    for result in results:
+        result["scaling_efficiency"] = round(result["throughput_rps"] / (base * result["workers"]), 2)
+        print(json.dumps({"cpu_count": os.cpu_count(), "cpu_ms": args.cpu_ms, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Costo de crear sesiones con recursos compartidos: tiempo de creación y RSS del proceso.
+
+Uso (desde ``src``)::
+
+    python -m benchmark.session_bench --sessions 1 10 100 1000
+"""
+import argparse
+import json
+import time
+from typing import List
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources, ConversationState
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+
+def _rss_mb() -> float:
+    """Memoria residente actual del proceso (Linux)"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    import resource
+    return round(pages * resource.getpagesize() / 1024 / 1024, 2)
+
+
+def run(session_counts: List[int]) -> List[dict]:
+    resources = AgentResources(llm=FakeLLM(latency=0), bq_client=FakeBigQueryClient(latency=0), memory=FakeMemory(0))
+    sessions = []
+    report = []
+    for target in sorted(session_counts):
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        created = 0
+        while len(sessions) < target:
+            state = ConversationState(user_id=f"user-{len(sessions)}")
+            sessions.append(GeminiAgent(resources=resources, state=state))
+            created += 1
+        elapsed = time.perf_counter() - start
+        report.append({
+            "sessions": len(sessions),
+            "create_ms_per_session": round(elapsed * 1000 / created, 4) if created else None,
+            "rss_mb": _rss_mb(),
+            "rss_delta_mb": round(_rss_mb() - rss_before, 2),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de creación de sesiones")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+    for row in run(args.sessions):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
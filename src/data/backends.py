@@ -0,0 +1,419 @@
+"""Motores de consulta intercambiables detrás de BigQueryClient.
+
+``BigQueryBackend`` ejecuta en BigQuery. ``DuckDBBackend`` responde localmente
+sobre un extracto Parquet de la tabla (leído por DuckDB sin cargarlo completo
+en memoria) y traduce el dialecto de BigQuery que generan los prompts.
+
+Para crear el extracto de los últimos días (desde ``src``)::
+
+    python -m data.backends extract --days 30 --out ./data/taxi_recent.parquet
+"""
+import argparse
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import sqlglot
+from requests.adapters import HTTPAdapter
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from data.results import QueryResult
+from observability.metrics import metrics
+from observability.tracing import annotate
+
+
+class QueryBackend:
+    """Interfaz común de los motores de consulta"""
+
+    name = "base"
+
+    def query(self, sql: str) -> QueryResult:
+        raise NotImplementedError
+
+    def get_table_metadata(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def can_answer(self, sql: str) -> bool:
+        """Indica si el motor tiene los datos que la consulta necesita"""
+        return True
+
+    def dry_run(self, sql: str) -> Optional[int]:
+        """Bytes estimados que escanearía la consulta; None si el motor no lo informa"""
+        return None
+
+
+class BigQueryBackend(QueryBackend):
+    name = "bigquery"
+
+    def __init__(self, table_ref: str):
+        from google.cloud import bigquery
+
+        if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS no está configurada")
+
+        self.table_ref = table_ref
+        self.client = bigquery.Client()
+
+        # Pool de conexiones HTTP reutilizable cuando el cliente se comparte entre sesiones
+        pool_size = int(os.getenv("BQ_HTTP_POOL_SIZE", "0"))
+        if pool_size > 0:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.client._http.mount("https://", adapter)
+
+        # Lectura de resultados grandes con la Storage Read API (si está instalada)
+        self.bqstorage_client = None
+        if os.getenv("BQ_USE_STORAGE_API", "1") == "1":
+            try:
+                from google.cloud import bigquery_storage
+                self.bqstorage_client = bigquery_storage.BigQueryReadClient()
+            except Exception:
+                self.bqstorage_client = None
+
+    def query(self, sql: str) -> QueryResult:
+        query_job = self.client.query(sql)
+        rows = query_job.result(page_size=int(os.getenv("BQ_PAGE_SIZE", "10000")))
+        bytes_processed, slot_ms = query_job.total_bytes_processed or 0, query_job.slot_millis or 0
+        metrics.inc("bq_bytes_processed_total", bytes_processed)
+        metrics.inc("bq_slot_ms_total", slot_ms)
+        annotate(bq_bytes_processed=bytes_processed, bq_slot_ms=slot_ms, bq_cache_hit=bool(query_job.cache_hit))
+        # Lotes Arrow leídos a demanda: por páginas REST o streams de la Storage API
+        batches = rows.to_arrow_iterable(bqstorage_client=self.bqstorage_client)
+        return QueryResult(batches, total_rows=rows.total_rows)
+
+    def get_table_metadata(self) -> Dict[str, Any]:
+        table = self.client.get_table(self.table_ref)
+        return {
+            "etag": table.etag,
+            "num_rows": table.num_rows,
+            "partition_field": table.time_partitioning.field if table.time_partitioning else None,
+            "fields": [
+                {"name": field.name, "type": field.field_type, "mode": field.mode,
+                 "description": field.description or ""}
+                for field in table.schema
+            ]
+        }
+
+    def dry_run(self, sql: str) -> int:
+        """Bytes que escanearía la consulta, sin ejecutarla ni cobrarla"""
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        return self.client.query(sql, job_config=job_config).total_bytes_processed
+
+    def execute_script(self, script: str) -> None:
+        self.client.query(script).result()
+
+
+# Traducciones de funciones de BigQuery a DuckDB
+_TRANSLATIONS = [
+    # BigQuery: 1=Domingo ... 7=Sábado; DuckDB dow: 0=Domingo
+    (re.compile(r"EXTRACT\s*\(\s*DAYOFWEEK\s+FROM\s+", re.IGNORECASE), "__DOW__("),
+    (re.compile(r"\b(TIMESTAMP|DATE|DATETIME)_SUB\s*\(", re.IGNORECASE), "__SUB__("),
+    (re.compile(r"\b(TIMESTAMP|DATE|DATETIME)_ADD\s*\(", re.IGNORECASE), "__ADD__("),
+    (re.compile(r"\bCURRENT_TIMESTAMP\s*\(\s*\)", re.IGNORECASE), "CURRENT_TIMESTAMP::TIMESTAMP"),
+    (re.compile(r"\bCURRENT_DATE\s*\(\s*\)", re.IGNORECASE), "CURRENT_DATE"),
+    (re.compile(r"\b(TIMESTAMP|DATE|DATETIME)_DIFF\s*\(", re.IGNORECASE), "__DIFF__("),
+    (re.compile(r"\b(TIMESTAMP|DATE|DATETIME)_TRUNC\s*\(", re.IGNORECASE), "__TRUNC__("),
+]
+
+# Unidades de DATE_TRUNC/TIMESTAMP_TRUNC que DuckDB entiende igual
+_TRUNC_UNITS = {"YEAR", "QUARTER", "MONTH", "WEEK", "DAY", "HOUR", "MINUTE", "SECOND"}
+# Unidades de los intervalos relativos en los filtros de tiempo
+_BOUND_UNITS = {"DAY": timedelta(days=1), "HOUR": timedelta(hours=1), "MINUTE": timedelta(minutes=1)}
+
+# Metadato del Parquet con el momento en que se tomó el extracto
+EXTRACTED_AT_KEY = b"extracted_at"
+
+
+def _split_args(text: str) -> List[str]:
+    """Separa argumentos de nivel superior de una llamada (respeta paréntesis)"""
+    args, depth, current = [], 0, []
+    for char in text:
+        if char == "," and depth == 0:
+            args.append("".join(current))
+            current = []
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current.append(char)
+    args.append("".join(current))
+    return args
+
+
+def _rewrite_calls(sql: str, marker: str, build) -> str:
+    """Reemplaza cada ``marker(args...)`` por ``build(args)`` respetando paréntesis anidados"""
+    while marker in sql:
+        start = sql.index(marker)
+        depth, end = 0, start + len(marker) - 1
+        for end in range(start + len(marker) - 1, len(sql)):
+            depth += sql[end] == "("
+            depth -= sql[end] == ")"
+            if depth == 0:
+                break
+        args = [arg.strip() for arg in _split_args(sql[start + len(marker):end])]
+        sql = f"{sql[:start]}{build(args)}{sql[end + 1:]}"
+    return sql
+
+
+def _interval_call(operator: str):
+    def build(args: List[str]) -> str:
+        if len(args) != 2:
+            raise ValueError("No se pudo traducir la aritmética de fechas de la consulta")
+        return f"({args[0]} {operator} {args[1]})"
+    return build
+
+
+def _diff_call(args: List[str]) -> str:
+    """TIMESTAMP_DIFF(fin, inicio, MINUTE) -> date_diff('minute', inicio, fin)"""
+    if len(args) != 3:
+        raise ValueError("No se pudo traducir la diferencia de fechas de la consulta")
+    return f"date_diff('{args[2].lower()}', {args[1]}, {args[0]})"
+
+
+def _trunc_call(args: List[str]) -> str:
+    """DATE_TRUNC(fecha, MONTH) -> date_trunc('month', fecha)"""
+    if len(args) != 2 or args[1].upper() not in _TRUNC_UNITS:
+        raise ValueError("No se pudo traducir el truncamiento de fechas de la consulta")
+    return f"date_trunc('{args[1].lower()}', {args[0]})"
+
+
+def _bound_value(node: exp.Expression, now: datetime) -> Optional[datetime]:
+    """Valor de un límite de tiempo: literal, CURRENT_* o CURRENT_* menos un intervalo; None si no se sabe"""
+    if isinstance(node, exp.Cast):
+        node = node.this
+    if isinstance(node, exp.Literal) and node.is_string:
+        try:
+            return datetime.fromisoformat(node.this.replace("T", " ")[:19])
+        except ValueError:
+            return None
+    if isinstance(node, exp.CurrentTimestamp):
+        return now
+    if isinstance(node, exp.CurrentDate):
+        return datetime.combine(now.date(), datetime.min.time())
+    if isinstance(node, (exp.TimestampSub, exp.DateSub)):
+        base = _bound_value(node.this, now)
+        unit = node.unit.name.upper() if node.unit else ""
+        if base is None or unit not in _BOUND_UNITS or not str(node.expression.name).isdigit():
+            return None
+        return base - int(node.expression.name) * _BOUND_UNITS[unit]
+    return None
+
+
+def _time_window(sql: str, column: str, now: datetime) -> Optional[Tuple[Optional[datetime], Optional[datetime]]]:
+    """Inicio y fin de la ventana de tiempo que filtra la consulta (sin fin: hasta ``now``).
+
+    Solo entiende una consulta simple cuyo WHERE es una conjunción: cada
+    término sobre ``column`` debe ser una comparación con un límite conocido.
+    Con OR, NOT, subconsultas u otras formas retorna None (no se sabe).
+    """
+    try:
+        tree = sqlglot.parse_one(sql.strip().rstrip(";"), read="bigquery")
+    except SqlglotError:
+        return None
+    if not isinstance(tree, exp.Select) or len(list(tree.find_all(exp.Select))) > 1:
+        return None
+    where = tree.args.get("where")
+    if where is None:
+        return None, None
+
+    def is_column(node: exp.Expression) -> bool:
+        if isinstance(node, (exp.Date, exp.TsOrDsToDate)):
+            node = node.this
+        return isinstance(node, exp.Column) and node.name.lower() == column
+
+    day = timedelta(days=1)
+    lower: List[datetime] = []
+    upper: List[datetime] = []
+    terms = where.this.flatten() if isinstance(where.this, exp.And) else [where.this]
+    for term in terms:
+        if not any(c.name.lower() == column for c in term.find_all(exp.Column)):
+            continue
+        if isinstance(term, exp.Between) and is_column(term.this):
+            low, high = _bound_value(term.args["low"], now), _bound_value(term.args["high"], now)
+            if low is None or high is None:
+                return None
+            by_date = isinstance(term.this, (exp.Date, exp.TsOrDsToDate))
+            lower.append(low)
+            upper.append(high + day if by_date else high)
+            continue
+        if not isinstance(term, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.EQ)):
+            return None
+        if is_column(term.this):
+            side, bound, op = term.this, term.expression, type(term)
+        elif is_column(term.expression):
+            # 'x' <= columna equivale a columna >= 'x'
+            flipped = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE, exp.EQ: exp.EQ}
+            side, bound, op = term.expression, term.this, flipped[type(term)]
+        else:
+            return None
+        value = _bound_value(bound, now)
+        if value is None:
+            return None
+        # Con DATE(columna) un límite de día incluye el día completo
+        by_date = isinstance(side, (exp.Date, exp.TsOrDsToDate))
+        if op in (exp.GT, exp.GTE, exp.EQ):
+            lower.append(value + day if by_date and op is exp.GT else value)
+        if op in (exp.LT, exp.LTE, exp.EQ):
+            upper.append(value + day if by_date and op is not exp.LT else value)
+    return (max(lower) if lower else None), (min(upper) if upper else None)
+
+
+def _stream(cursor, reader):
+    """Entrega los lotes del cursor y lo cierra al terminar"""
+    try:
+        yield from reader
+    finally:
+        cursor.close()
+
+
+class DuckDBBackend(QueryBackend):
+    """Motor local sobre un extracto Parquet de la tabla de viajes.
+
+    Si ``complete`` es False el extracto solo tiene datos recientes: una
+    consulta se responde localmente solo si su filtro de tiempo cae dentro del
+    rango cubierto; las demás quedan para BigQuery. El rango termina en el
+    momento del extracto (metadato ``extracted_at`` o, si no está, el último
+    ``pickup_datetime``): una ventana que llega hasta ahora solo se responde
+    localmente si el extracto tiene a lo más ``DUCKDB_STALENESS_TOLERANCE``
+    segundos de antigüedad.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, parquet_path: str, table_ref: str, complete: bool = False):
+        import duckdb
+
+        self.parquet_path = parquet_path
+        self.table_ref = table_ref
+        self.complete = complete
+        self.view_name = table_ref.split(".")[-1]
+        self.batch_rows = int(os.getenv("DUCKDB_BATCH_ROWS", "10000"))
+
+        self._conn = duckdb.connect()
+        self._conn.execute("SET TimeZone = 'UTC'")
+        self._conn.execute(
+            f"CREATE VIEW \"{self.view_name}\" AS SELECT * FROM read_parquet('{parquet_path}')"
+        )
+        self._conn.execute("CREATE MACRO SAFE_DIVIDE(a, b) AS a / NULLIF(b, 0)")
+        self._lock = threading.Lock()
+
+        self.staleness_tolerance = timedelta(seconds=float(os.getenv("DUCKDB_STALENESS_TOLERANCE", "3600")))
+        start, end = self._conn.execute(
+            f"SELECT MIN(pickup_datetime), MAX(pickup_datetime) FROM \"{self.view_name}\"").fetchone()
+        self.coverage_start: Optional[datetime] = start.replace(tzinfo=None) if start else None
+        self.coverage_end: Optional[datetime] = self._extracted_at() or (end.replace(tzinfo=None) if end else None)
+
+    def _extracted_at(self) -> Optional[datetime]:
+        """Momento del extracto guardado por ``extract_parquet`` (UTC, sin zona)"""
+        try:
+            import pyarrow.parquet as pq
+
+            value = (pq.read_schema(self.parquet_path).metadata or {}).get(EXTRACTED_AT_KEY)
+            return datetime.fromisoformat(value.decode()).replace(tzinfo=None) if value else None
+        except Exception:
+            return None
+
+    def translate(self, sql: str) -> str:
+        """Traduce el dialecto de BigQuery usado por el agente a DuckDB"""
+        sql = re.sub(rf"`?{re.escape(self.table_ref)}`?", f"\"{self.view_name}\"", sql)
+        sql = sql.replace("`", "\"")
+        for pattern, replacement in _TRANSLATIONS:
+            sql = pattern.sub(replacement, sql)
+        sql = _rewrite_calls(sql, "__DOW__(", lambda args: f"(EXTRACT(DOW FROM {args[0]}) + 1)")
+        sql = _rewrite_calls(sql, "__DIFF__(", _diff_call)
+        sql = _rewrite_calls(sql, "__TRUNC__(", _trunc_call)
+        sql = _rewrite_calls(sql, "__SUB__(", _interval_call("-"))
+        return _rewrite_calls(sql, "__ADD__(", _interval_call("+"))
+
+    def can_answer(self, sql: str) -> bool:
+        if self.complete:
+            return True
+        if self.coverage_start is None or self.coverage_end is None:
+            return False
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        window = _time_window(sql, "pickup_datetime", now)
+        if window is None:
+            return False
+        window_start, window_end = window
+        if window_start is None or window_start < self.coverage_start:
+            return False
+        # Sin límite superior explícito la ventana llega hasta ahora
+        return (window_end or now) <= self.coverage_end + self.staleness_tolerance
+
+    def query(self, sql: str) -> QueryResult:
+        translated = self.translate(sql)
+        # Una conexión DuckDB no admite consultas concurrentes; cada hilo usa un cursor propio
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            reader = cursor.execute(translated).fetch_record_batch(self.batch_rows)
+        except Exception:
+            cursor.close()
+            raise
+        return QueryResult(_stream(cursor, reader), reader.schema)
+
+    def rows_scanned(self, sql: str) -> int:
+        """Filas que lee la consulta según el perfil de DuckDB (la ejecuta con EXPLAIN ANALYZE)"""
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            profile = cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {self.translate(sql)}").fetchone()[1]
+        finally:
+            cursor.close()
+        return int(json.loads(profile).get("cumulative_rows_scanned", 0))
+
+    def get_table_metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            cursor = self._conn.cursor()
+        try:
+            described = cursor.execute(f"DESCRIBE \"{self.view_name}\"").fetchall()
+            num_rows = cursor.execute(f"SELECT COUNT(*) FROM \"{self.view_name}\"").fetchone()[0]
+        finally:
+            cursor.close()
+        return {
+            "etag": f"parquet:{os.path.getmtime(self.parquet_path):.0f}",
+            "num_rows": num_rows,
+            "fields": [
+                {"name": name, "type": column_type, "mode": "NULLABLE", "description": ""}
+                for name, column_type, *_ in described
+            ]
+        }
+
+
+def extract_parquet(table_ref: str, out_path: str, days: int) -> int:
+    """Exporta los últimos ``days`` días de la tabla de BigQuery a Parquet"""
+    import pyarrow.parquet as pq
+
+    backend = BigQueryBackend(table_ref)
+    extracted_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    table = backend.client.query(
+        f"SELECT * FROM `{table_ref}` "
+        f"WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {int(days)} DAY)"
+    ).to_arrow()
+    # El momento del extracto marca hasta dónde llegan los datos (ver DuckDBBackend.can_answer)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), EXTRACTED_AT_KEY: extracted_at.isoformat().encode()})
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    pq.write_table(table, out_path)
+    return table.num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extractos locales para DuckDBBackend")
+    parser.add_argument("action", choices=["extract"])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--out", default=os.getenv("LOCAL_PARQUET_PATH", "./data/taxi_recent.parquet"))
+    args = parser.parse_args()
+
+    table_ref = f"{os.getenv('BQ_PROJECT_ID')}.{os.getenv('BQ_DATASET_ID')}.{os.getenv('BQ_TABLE_ID')}"
+    rows = extract_parquet(table_ref, args.out, args.days)
+    print(f"Extracto de {rows} filas guardado en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,69 @@
-from google.cloud import bigquery
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
+from data.backends import BigQueryBackend, DuckDBBackend, QueryBackend
+from data.query_cache import QueryCache
+from data.results import QueryResult
+from observability.metrics import metrics
+from observability.tracing import annotate, record_error
 
 class BigQueryClient:
-    def __init__(self):
-        if not os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS no está configurada")
-            
-        self.client = bigquery.Client()
+    def __init__(self, cache: Optional[QueryCache] = None, backend: Optional[QueryBackend] = None,
+                 local_backend: Optional[QueryBackend] = None):
         self.project_id = os.getenv('BQ_PROJECT_ID')
         self.dataset_id = os.getenv('BQ_DATASET_ID')
         self.table_id = os.getenv('BQ_TABLE_ID')
         
         if not all([self.project_id, self.dataset_id, self.table_id]):
             raise ValueError("Variables de ambiente BQ_PROJECT_ID, BQ_DATASET_ID y BQ_TABLE_ID son requeridas")
+        
+        # Motores de consulta: QUERY_ENGINE=bigquery (por defecto), hybrid (local primero) o duckdb (sin red)
+        engine = os.getenv("QUERY_ENGINE", "bigquery")
+        parquet_path = os.getenv("LOCAL_PARQUET_PATH")
+        if local_backend is None and engine in ("hybrid", "duckdb") and parquet_path:
+            local_backend = DuckDBBackend(parquet_path, self.table_ref, complete=engine == "duckdb")
+        self.local_backend = local_backend
+        
+        if backend is None:
+            backend = local_backend if engine == "duckdb" and local_backend else BigQueryBackend(self.table_ref)
+        self.backend = backend
+        self.client = getattr(backend, "client", None)
+        
+        # Caché de resultados por SQL canónico; los resultados de más de QUERY_CACHE_MAX_ROWS filas
+        # se guardan solo cuando quien los usa termina de leerlos
+        self.cache = cache if cache is not None else QueryCache.from_env()
+        self.cache_max_rows = int(os.getenv("QUERY_CACHE_MAX_ROWS", "10000"))
+        
+        # Reescritura opcional hacia tablas resumen (ver data/rollups.py)
+        self.rollup_rewriter = None
+        
+        # Ejecución especulativa opcional de consultas de seguimiento (ver data/prefetch.py)
+        self.prefetcher = None
+    
+    def _qualify_table(self, query: str) -> str:
+        """Asegura que la tabla esté completamente calificada"""
+        table_ref = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+        if self.table_id in query and f"{self.dataset_id}.{self.table_id}" not in query:
+            query = query.replace(self.table_id, table_ref)
+        return query
+    
+    @property
+    def table_ref(self) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+    
+    def get_table_metadata(self) -> Dict[str, Any]:
+        """Obtiene etag, número de filas y esquema completo (tipo, modo y descripción) de la tabla"""
+        return self.backend.get_table_metadata()
     
     def get_table_schema(self) -> List[str]:
         """Obtiene el esquema de la tabla"""
         try:
-            table_ref = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
-            table = self.client.get_table(table_ref)
-            return [field.name for field in table.schema]
+            return [field["name"] for field in self.get_table_metadata()["fields"]]
         except Exception as e:
             print(f"Error obteniendo el esquema: {str(e)}")
             return []
     
-    def query_data(self, query: str) -> List[Dict[str, Any]]:
-        """Ejecuta una consulta en BigQuery y retorna los resultados"""
+    def query_data(self, query: str, use_cache: bool = True) -> QueryResult:
+        """Ejecuta una consulta y retorna los resultados en formato columnar"""
         try:
             # Limpia la consulta SQL
             query = query.strip()
@@ -38,12 +75,81 @@ class BigQueryClient:
                 return "Error: La consulta debe comenzar con SELECT"
             
             # Asegura que la tabla esté completamente calificada
-            table_ref = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
-            if self.table_id in query and f"{self.dataset_id}.{self.table_id}" not in query:
-                query = query.replace(self.table_id, table_ref)
+            query = self._qualify_table(query)
+            
+            if use_cache:
+                cached = self.cache.get(query)
+                metrics.inc("cache_requests_total", cache="query", result="miss" if cached is None else "hit")
+                if cached is not None:
+                    if self.prefetcher is not None:
+                        self.prefetcher.note_cache_hit(query)
+                    return cached
+                
+                # Resultado de una variante especulativa equivalente (o espera a que termine)
+                if self.prefetcher is not None:
+                    rows = self.prefetcher.claim(query)
+                    if rows is not None:
+                        self.cache_result(query, rows)
+                        self.prefetcher.schedule(query)
+                        return rows
             
-            query_job = self.client.query(query)
-            results = query_job.result()
-            return [dict(row) for row in results]
+            rows = self._run(query)
+            
+            if use_cache:
+                self.cache_result(query, rows)
+                if self.prefetcher is not None:
+                    self.prefetcher.schedule(query)
+            return rows
         except Exception as e:
-            return f"Error ejecutando la consulta: {str(e)}" 
\ No newline at end of file
+            record_error("query_data", e)
+            return f"Error ejecutando la consulta: {str(e)}"
+    
+    def cache_result(self, query: str, result: Any) -> bool:
+        """Guarda el resultado en la caché sin forzar la lectura de todos los lotes pendientes.
+
+        Serializar un ``QueryResult`` lee la tabla completa: se guarda de
+        inmediato si ya se leyó o si tiene a lo más ``cache_max_rows`` filas
+        (según los metadatos o leyendo como máximo ese número, p. ej. en
+        DuckDB, que no informa el total); si no, se guarda cuando quien lo
+        consume termina de leerlo. Retorna True si quedó guardado ya.
+        """
+        if not isinstance(result, QueryResult) or result.complete or result.within(self.cache_max_rows):
+            self.cache.put(query, result)
+            return True
+        result.on_complete(lambda: self.cache.put(query, result))
+        return False
+    
+    def _use_local(self, query: str) -> bool:
+        return self.local_backend is not None and self.local_backend is not self.backend \
+            and self.local_backend.can_answer(query)
+    
+    def _for_backend(self, query: str) -> str:
+        """Usa el rollup cuando la consulta se puede responder desde él (solo existe en BigQuery)"""
+        if self.rollup_rewriter is not None and self.backend.name == "bigquery":
+            return self.rollup_rewriter.rewrite(query) or query
+        return query
+    
+    def _run(self, query: str) -> QueryResult:
+        """Ejecuta en el motor local si tiene los datos; si no, o si falla, en el motor principal"""
+        if self._use_local(query):
+            try:
+                result = self.local_backend.query(query)
+                annotate(query_engine=self.local_backend.name)
+                return result
+            except Exception as e:
+                record_error("local_engine", e)
+                print(f"Motor local no pudo responder, usando {self.backend.name}: {str(e)}")
+        
+        annotate(query_engine=self.backend.name)
+        return self.backend.query(self._for_backend(query))
+    
+    def estimate_bytes(self, query: str) -> Optional[int]:
+        """Bytes que escanearía la consulta en el motor que la va a ejecutar (dry run)"""
+        query = self._qualify_table(query)
+        if self._use_local(query):
+            return 0
+        return self.backend.dry_run(self._for_backend(query))
+    
+    def execute_script(self, script: str) -> None:
+        """Ejecuta DDL/DML (por ejemplo, el mantenimiento de rollups) sin pasar por la caché"""
+        self.backend.execute_script(script)
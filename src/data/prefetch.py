@@ -0,0 +1,379 @@
+"""Ejecución especulativa de las preguntas de seguimiento más probables.
+
+Después de una consulta, las preguntas de seguimiento ("¿y por día de la
+semana?", "¿y las propinas?") suelen repetir casi el mismo SQL con otra
+granularidad de tiempo u otra métrica. ``follow_up_variants`` deriva esas
+variantes del SQL ejecutado y ``Prefetcher`` las corre en segundo plano,
+dentro de un presupuesto de bytes estimados con dry run, y deja los
+resultados en la caché de consultas.
+
+Como el SQL que escribe el LLM no coincide carácter a carácter con la
+variante, los resultados especulativos se guardan bajo ``prefetch_key``:
+el SQL reescrito por sqlglot y luego canonicalizado. ``BigQueryClient``
+consulta esa llave cuando la caché normal falla (``claim``); si la variante
+todavía se está ejecutando, espera a que termine en lugar de repetirla.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from data.query_cache import canonicalize_sql
+from observability.metrics import metrics
+from observability.tracing import annotate
+
+# Granularidades de tiempo: unidad de EXTRACT -> (alias, expresión, orden), con la forma de los ejemplos del prompt
+GRANULARITIES: Dict[str, Tuple[str, str, str]] = {
+    "HOUR": ("hora", "EXTRACT(HOUR FROM {col})", "hora"),
+    "DAYOFWEEK": (
+        "dia_semana",
+        "CASE EXTRACT(DAYOFWEEK FROM {col}) WHEN 1 THEN 'Domingo' WHEN 2 THEN 'Lunes' WHEN 3 THEN 'Martes' "
+        "WHEN 4 THEN 'Miércoles' WHEN 5 THEN 'Jueves' WHEN 6 THEN 'Viernes' WHEN 7 THEN 'Sábado' END",
+        "MIN(EXTRACT(DAYOFWEEK FROM {col}))",
+    ),
+    "MONTH": ("mes", "EXTRACT(MONTH FROM {col})", "mes"),
+}
+
+# Columnas de métrica intercambiables y la raíz con la que suelen aparecer en los alias
+METRIC_COLUMNS: Dict[str, str] = {
+    "fare_amount": "tarifa",
+    "tip_amount": "propina",
+    "total_amount": "pago_total",
+    "trip_distance": "distancia",
+}
+
+
+def prefetch_key(sql: str) -> Optional[str]:
+    """Forma normalizada con la que se comparan variantes y consultas; None si no se puede parsear"""
+    try:
+        tree = sqlglot.parse_one(sql.strip().rstrip(";"), read="bigquery")
+    except SqlglotError:
+        return None
+    return canonicalize_sql(tree.sql(dialect="bigquery"))
+
+
+def _select(sql: str) -> Optional[exp.Select]:
+    try:
+        tree = sqlglot.parse_one(sql, read="bigquery")
+    except SqlglotError:
+        return None
+    return tree if isinstance(tree, exp.Select) else None
+
+
+def _time_unit(expression: exp.Expression, date_column: str) -> Optional[str]:
+    """Unidad de EXTRACT sobre la columna de fecha (directo o dentro de un CASE)"""
+    node = expression.this if isinstance(expression, exp.Case) else expression
+    if isinstance(node, exp.Extract) and isinstance(node.expression, exp.Column) \
+            and node.expression.name.lower() == date_column.lower():
+        return node.this.name.upper()
+    return None
+
+
+def _projection(sql: str) -> exp.Expression:
+    return sqlglot.parse_one(f"SELECT {sql}", read="bigquery").expressions[0]
+
+
+def _refers_to(node: exp.Expression, alias: str, expression: exp.Expression) -> bool:
+    """La expresión de GROUP BY/ORDER BY usa la dimensión (por alias o repitiendo su EXTRACT)"""
+    if isinstance(node, exp.Column) and not node.table and node.name.lower() == alias.lower():
+        return True
+    extract = expression.this if isinstance(expression, exp.Case) else expression
+    return any(sub == extract for sub in node.find_all(exp.Extract))
+
+
+def _regroup(select: exp.Select, unit: str, date_column: str,
+             current: Optional[Tuple[exp.Alias, exp.Expression]]) -> exp.Select:
+    """Copia de la consulta agrupada por otra granularidad de tiempo"""
+    alias, expression, order = (part.format(col=date_column) for part in GRANULARITIES[unit])
+    tree = select.copy()
+    if current is None:
+        # Agregación sin dimensión: se agrega la dimensión al inicio
+        tree.set("expressions", [_projection(f"{expression} AS {alias}")] + list(tree.expressions))
+        tree = tree.group_by(alias, copy=False)
+        if not tree.args.get("order"):
+            tree = tree.order_by(order, copy=False)
+        return tree
+
+    old_alias, old_expression = current
+    for projection in tree.expressions:
+        if projection == old_alias:
+            projection.replace(_projection(f"{expression} AS {alias}"))
+            break
+    old_name = old_alias.alias
+    for clause, replacement in (("group", alias), ("order", order)):
+        node = tree.args.get(clause)
+        if node is None:
+            continue
+        for item in node.expressions:
+            target = item.this if isinstance(item, exp.Ordered) else item
+            if _refers_to(target, old_name, old_expression):
+                target.replace(sqlglot.parse_one(replacement, read="bigquery"))
+    return tree
+
+
+def _swap_metric(select: exp.Select, old: str, new: str) -> Optional[exp.Select]:
+    """Copia de la consulta sobre otra columna de métrica; None si los alias no se pueden renombrar"""
+    old_stem, new_stem = METRIC_COLUMNS[old], METRIC_COLUMNS[new]
+    tree = select.copy()
+    renames: Dict[str, str] = {}
+    for projection in tree.expressions:
+        if isinstance(projection, exp.Alias) and old_stem in projection.alias.lower():
+            renames[projection.alias.lower()] = projection.alias.lower().replace(old_stem, new_stem)
+            projection.set("alias", exp.to_identifier(renames[projection.alias.lower()]))
+    if not renames:
+        return None
+    # La columna en agregados y filtros, y los alias en GROUP BY/ORDER BY
+    for column in list(tree.find_all(exp.Column)):
+        name = column.name.lower()
+        if name == old:
+            column.replace(exp.column(new))
+        elif name in renames and not column.table:
+            column.replace(exp.column(renames[name]))
+    return tree
+
+
+def follow_up_variants(sql: str, date_column: str = "pickup_datetime") -> List[str]:
+    """Variantes probables de una consulta de agregación: otras granularidades y otras métricas"""
+    select = _select(sql)
+    if select is None or not any(select.find_all(exp.AggFunc)):
+        return []
+
+    # Dimensión de tiempo actual (alias y expresión), si la hay
+    current, unit = None, None
+    for projection in select.expressions:
+        if isinstance(projection, exp.Alias):
+            unit = _time_unit(projection.this, date_column)
+            if unit is not None:
+                current = (projection, projection.this)
+                break
+    if current is None and select.args.get("group"):
+        # Agrupada por otra dimensión (p. ej. distancia): no hay granularidad que cambiar
+        variants: List[exp.Select] = []
+    else:
+        variants = [_regroup(select, other, date_column, current) for other in GRANULARITIES if other != unit]
+
+    # Otras métricas, solo cuando la consulta agrega una sola columna conocida
+    aggregated = {
+        column.name.lower()
+        for agg in select.find_all(exp.AggFunc)
+        for column in agg.find_all(exp.Column)
+        if column.name.lower() in METRIC_COLUMNS
+    }
+    if len(aggregated) == 1:
+        old = aggregated.pop()
+        for new in METRIC_COLUMNS:
+            if new != old:
+                swapped = _swap_metric(select, old, new)
+                if swapped is not None:
+                    variants.append(swapped)
+
+    return [variant.sql(dialect="bigquery") for variant in variants]
+
+
+class Prefetcher:
+    """Corre en segundo plano las variantes de la última consulta y las deja en la caché.
+
+    Cada ronda ejecuta en paralelo como máximo ``max_variants`` variantes y
+    omite las que harían que la suma de bytes estimados por dry run supere
+    ``max_bytes``. Las rondas comparten un pool pequeño (``workers``) para no
+    competir con las consultas de los usuarios; si ya hay ``max_pending``
+    rondas en espera, la nueva se descarta.
+    """
+
+    def __init__(self, bq_client, max_variants: int = 4, max_bytes: int = 1024 ** 3, workers: int = 4,
+                 max_pending: int = 8, max_wait: float = 30, date_column: Optional[str] = None):
+        self.bq_client = bq_client
+        self.max_variants = max_variants
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.date_column = date_column or os.getenv("BQ_DATE_COLUMN", "pickup_datetime")
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        # Llave -> segundos que tomó la consulta especulativa (lo que se ahorra quien la use)
+        self._ready: "OrderedDict[str, float]" = OrderedDict()
+        self._claimed: set = set()
+        self._queued = 0
+        self.stats: Dict[str, Any] = {
+            "rounds": 0, "executed": 0, "skipped_budget": 0, "skipped_busy": 0, "not_cached": 0, "errors": 0,
+            "hits": 0, "saved_s": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls, bq_client) -> "Prefetcher":
+        """Construye el prefetcher a partir de variables de entorno"""
+        return cls(
+            bq_client,
+            max_variants=int(os.getenv("PREFETCH_MAX_VARIANTS", "4")),
+            max_bytes=int(os.getenv("PREFETCH_MAX_BYTES", str(1024 ** 3))),
+            workers=int(os.getenv("PREFETCH_WORKERS", "4")),
+            max_pending=int(os.getenv("PREFETCH_MAX_PENDING", "8")),
+        )
+
+    def schedule(self, sql: str) -> None:
+        """Programa una ronda con las variantes de una consulta recién ejecutada; no bloquea"""
+        with self._lock:
+            self.stats["rounds"] += 1
+            if self._queued >= self.max_pending:
+                self.stats["skipped_busy"] += 1
+                metrics.inc("prefetch_queries_total", outcome="busy")
+                return
+            self._queued += 1
+        self.executor.submit(self._run_round, sql)
+
+    def _plan(self, sql: str) -> List[Tuple[str, str, Future]]:
+        """Variantes que no están en caché ni en curso, registradas como en curso"""
+        batch: List[Tuple[str, str, Future]] = []
+        variants = follow_up_variants(sql, self.date_column)
+        with self._lock:
+            for variant in variants:
+                key = prefetch_key(variant)
+                if key is None or key in self._inflight or self.bq_client.cache.contains(key):
+                    continue
+                future: Future = Future()
+                self._inflight[key] = future
+                batch.append((key, variant, future))
+                if len(batch) >= self.max_variants:
+                    break
+        return batch
+
+    def _run_round(self, sql: str) -> None:
+        try:
+            batch = self._plan(sql)
+        except Exception as e:
+            print(f"Error derivando variantes para prefetch: {str(e)}")
+            return
+        finally:
+            # La ronda deja de contar como en espera cuando sus variantes ya figuran en curso
+            with self._lock:
+                self._queued -= 1
+        # Las variantes de una ronda corren en paralelo y comparten el presupuesto de bytes
+        budget = {"spent": 0}
+        for key, variant, future in batch:
+            try:
+                self.executor.submit(self._run_variant, key, variant, future, budget)
+            except RuntimeError:
+                # El pool se cerró (fin del proceso): nadie debe esperar esta variante
+                future.cancel()
+                self._finish(key)
+
+    def _run_variant(self, key: str, variant: str, future: Future, budget: Dict[str, int]) -> None:
+        # Cancelada por una consulta del usuario que llegó antes de empezar
+        if not future.set_running_or_notify_cancel():
+            self._finish(key)
+            return
+        result, outcome = None, "error"
+        try:
+            estimated = self.bq_client.estimate_bytes(variant) or 0
+            with self._lock:
+                allowed = budget["spent"] + estimated <= self.max_bytes
+                if allowed:
+                    budget["spent"] += estimated
+            if not allowed:
+                outcome = "budget"
+            else:
+                start = perf_counter()
+                result = self.bq_client.query_data(variant, use_cache=False)
+                if isinstance(result, str):
+                    result = None
+                else:
+                    elapsed = perf_counter() - start
+                    metrics.inc("prefetch_bytes_total", estimated)
+                    # Solo queda lista si se guardó ya: un resultado grande espera a que alguien lo lea
+                    # completo, y eso no pasa si nadie lo reclama mientras corre
+                    if self.bq_client.cache_result(key, result):
+                        outcome = "executed"
+                        with self._lock:
+                            self._ready[key] = elapsed
+                            while len(self._ready) > 1024:
+                                self._claimed.discard(self._ready.popitem(last=False)[0])
+                    else:
+                        outcome = "too_large"
+        except Exception as e:
+            print(f"Error en consulta especulativa: {str(e)}")
+        with self._lock:
+            self.stats["executed" if outcome == "executed" else
+                       "skipped_budget" if outcome == "budget" else
+                       "not_cached" if outcome == "too_large" else "errors"] += 1
+        metrics.inc("prefetch_queries_total", outcome=outcome)
+        self._finish(key)
+        future.set_result(result)
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def claim(self, query: str) -> Optional[Any]:
+        """Resultado especulativo para la consulta (esperando si aún corre) o None"""
+        key = prefetch_key(query)
+        if key is None:
+            return None
+        with self._lock:
+            future = self._inflight.get(key)
+            ready = key in self._ready
+        if future is None and not ready:
+            return None
+
+        waited = 0.0
+        if future is not None:
+            # Si no empezó, la cancela y la consulta corre de forma normal
+            if future.cancel():
+                return None
+            start = perf_counter()
+            try:
+                result = future.result(timeout=self.max_wait)
+            except Exception:
+                return None
+            waited = perf_counter() - start
+        else:
+            result = self.bq_client.cache.get(key)
+            if result is None:
+                # Expiró o salió de la caché: deja de contarse como lista
+                with self._lock:
+                    self._ready.pop(key, None)
+        if result is None:
+            return None
+        self._record_hit(key, waited)
+        return result
+
+    def note_cache_hit(self, query: str) -> None:
+        """Cuenta el acierto cuando la consulta coincidió tal cual con la llave de una variante"""
+        key = canonicalize_sql(query)
+        with self._lock:
+            prefetched = key in self._ready
+        if prefetched:
+            self._record_hit(key, 0.0)
+
+    def _record_hit(self, key: str, waited: float) -> None:
+        with self._lock:
+            first_use = key not in self._claimed
+            self._claimed.add(key)
+            saved = max(0.0, self._ready.get(key, 0.0) - waited)
+            if first_use:
+                self.stats["hits"] += 1
+                self.stats["saved_s"] += saved
+        if first_use:
+            metrics.inc("prefetch_hits_total")
+            metrics.inc("prefetch_saved_seconds_total", saved)
+        annotate(prefetch_hit=True, prefetch_saved_ms=round(saved * 1000, 1))
+
+    def pending(self) -> int:
+        """Rondas en espera más variantes en curso"""
+        with self._lock:
+            return self._queued + len(self._inflight)
+
+    def report(self) -> Dict[str, Any]:
+        """Contadores con la tasa de acierto (resultados especulativos usados / ejecutados)"""
+        with self._lock:
+            report = dict(self.stats)
+        report["hit_rate"] = round(report["hits"] / report["executed"], 3) if report["executed"] else 0.0
+        report["saved_s"] = round(report["saved_s"], 3)
+        return report
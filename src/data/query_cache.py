@@ -0,0 +1,221 @@
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# Palabras clave que se normalizan a mayúsculas en la forma canónica
+SQL_KEYWORDS = {
+    "select", "from", "where", "group", "by", "order", "having", "limit", "as",
+    "and", "or", "not", "in", "is", "null", "between", "like", "case", "when",
+    "then", "else", "end", "asc", "desc", "distinct", "join", "left", "right",
+    "inner", "outer", "on", "with", "union", "all", "interval", "extract",
+    "count", "sum", "avg", "min", "max", "round", "cast", "safe_divide",
+    "timestamp_sub", "timestamp_add", "date", "timestamp", "hour", "day",
+    "dayofweek", "week", "month", "year", "minute", "second", "true", "false",
+}
+
+# Funciones cuyo resultado cambia entre ejecuciones
+VOLATILE_PATTERN = re.compile(
+    r"\b(CURRENT_TIMESTAMP|CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIME|NOW|RAND|GENERATE_UUID|SESSION_USER)\b",
+    re.IGNORECASE,
+)
+
+# Literales de texto e identificadores entre backticks se conservan intactos
+_TOKEN_PATTERN = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|[^'\"`]+")
+
+
+def canonicalize_sql(query: str) -> str:
+    """Forma canónica de una consulta: espacios y palabras clave normalizados"""
+    query = query.strip().rstrip(";").strip()
+    parts = []
+    for token in _TOKEN_PATTERN.findall(query):
+        if token[0] in "'\"":
+            parts.append(token)
+        elif token[0] == "`":
+            parts.append(token.strip("`"))
+        else:
+            token = re.sub(r"\s+", " ", token)
+            token = re.sub(r"\s*([(),=<>+\-*/])\s*", r"\1", token)
+            token = re.sub(
+                r"\b[A-Za-z_]+\b",
+                lambda m: m.group(0).upper() if m.group(0).lower() in SQL_KEYWORDS else m.group(0),
+                token,
+            )
+            parts.append(token)
+    return "".join(parts).strip()
+
+
+def is_volatile(query: str) -> bool:
+    """Indica si la consulta usa funciones no deterministas como CURRENT_TIMESTAMP()"""
+    without_literals = re.sub(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"", "''", query)
+    return bool(VOLATILE_PATTERN.search(without_literals))
+
+
+class QueryCache:
+    """Caché LRU de resultados de consultas, limitada por tamaño en bytes.
+
+    Cada entrada tiene su propio TTL. Las consultas volátiles (por ejemplo con
+    ``CURRENT_TIMESTAMP()``) usan ``volatile_ttl`` y nunca se guardan en disco,
+    porque su resultado depende del momento en que se ejecutan. Si se indica
+    ``disk_path`` los resultados estables se persisten en SQLite para que un
+    contenedor nuevo pueda reutilizarlos.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600,
+        volatile_ttl: float = 60,
+        disk_path: Optional[str] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.volatile_ttl = volatile_ttl
+        self.disk_path = disk_path
+
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.disk_path:
+            self._init_disk()
+
+    @classmethod
+    def from_env(cls) -> "QueryCache":
+        """Construye la caché a partir de variables de entorno"""
+        return cls(
+            max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+            volatile_ttl=float(os.getenv("QUERY_CACHE_VOLATILE_TTL", "60")),
+            disk_path=os.getenv("QUERY_CACHE_PATH") or None,
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, timeout=5)
+
+    def _init_disk(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS query_cache ("
+                    "key TEXT PRIMARY KEY, expires_at REAL, payload BLOB)"
+                )
+        except Exception as e:
+            print(f"Error inicializando caché en disco: {str(e)}")
+            self.disk_path = None
+
+    def _ttl_for(self, query: str) -> float:
+        return self.volatile_ttl if is_volatile(query) else self.ttl_seconds
+
+    def get(self, query: str) -> Optional[Any]:
+        """Retorna el resultado en caché para la consulta o None"""
+        key = canonicalize_sql(query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._size -= size
+
+        if self.disk_path and not is_volatile(key):
+            value = self._disk_get(key, now)
+            if value is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                self._store(key, value, now + self.ttl_seconds)
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def contains(self, query: str) -> bool:
+        """Indica si hay un resultado vigente en memoria, sin contar un acierto ni moverlo en el LRU"""
+        entry = self._entries.get(canonicalize_sql(query))
+        return entry is not None and entry[2] >= time.time()
+
+    def put(self, query: str, value: Any) -> None:
+        """Guarda el resultado de una consulta"""
+        key = canonicalize_sql(query)
+        ttl = self._ttl_for(key)
+        if ttl <= 0:
+            return
+
+        expires_at = time.time() + ttl
+        payload = self._store(key, value, expires_at)
+        if payload is not None and self.disk_path and not is_volatile(key):
+            self._disk_put(key, payload, expires_at)
+
+    def _store(self, key: str, value: Any, expires_at: float) -> Optional[bytes]:
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"Error serializando resultado para la caché: {str(e)}")
+            return None
+
+        size = len(payload)
+        if size > self.max_bytes:
+            return payload
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._size -= old_size
+                self.stats["evictions"] += 1
+        return payload
+
+    def _disk_get(self, key: str, now: float) -> Optional[Any]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT payload FROM query_cache WHERE key = ? AND expires_at >= ?",
+                    (key, now),
+                ).fetchone()
+            return pickle.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error leyendo caché en disco: {str(e)}")
+            return None
+
+    def _disk_put(self, key: str, payload: bytes, expires_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_cache (key, expires_at, payload) VALUES (?, ?, ?)",
+                    (key, expires_at, payload),
+                )
+                conn.execute("DELETE FROM query_cache WHERE expires_at < ?", (time.time(),))
+        except Exception as e:
+            print(f"Error escribiendo caché en disco: {str(e)}")
+
+    def clear(self) -> None:
+        """Vacía la caché en memoria y en disco"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM query_cache")
+            except Exception as e:
+                print(f"Error limpiando caché en disco: {str(e)}")
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
@@ -0,0 +1,196 @@
+"""Resultados de consultas en formato columnar (Apache Arrow).
+
+Los motores entregan lotes Arrow (``RecordBatch``) que ``QueryResult`` va
+leyendo a demanda: pedir las primeras filas solo trae los lotes necesarios y
+solo esas filas se convierten a objetos de Python. Se mantiene la interfaz de
+lista (``len``, índices, slices, iteración) para el código que espera filas
+como diccionarios.
+"""
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+# Palabras en el nombre de la columna que indican su unidad
+DISTANCE_WORDS = ["distance", "distancia", "millas"]
+MONEY_WORDS = ["fare", "amount", "total", "tip", "tarifa", "propina", "ingreso", "monto", "usd"]
+
+
+def column_unit(name: str) -> Optional[str]:
+    """Unidad de una columna según su nombre: millas, USD o None"""
+    key = name.lower()
+    if any(word in key for word in DISTANCE_WORDS):
+        return "millas"
+    if any(word in key for word in MONEY_WORDS):
+        return "USD"
+    return None
+
+
+class QueryResult:
+    """Resultado columnar de una consulta, leído por lotes a demanda.
+
+    ``total_rows`` es el número de filas según los metadatos del job (None si
+    el motor no lo informa); permite conocer el tamaño sin leer los lotes.
+    """
+
+    def __init__(self, batches: Iterable[pa.RecordBatch], schema: Optional[pa.Schema] = None,
+                 total_rows: Optional[int] = None):
+        self._pending: Optional[Iterator[pa.RecordBatch]] = iter(batches)
+        self._batches: List[pa.RecordBatch] = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._on_complete: List[Callable[[], None]] = []
+        self.total_rows = total_rows
+
+        # Sin esquema explícito se toma del primer lote
+        if schema is None:
+            self._fill(1)
+            schema = self._batches[0].schema if self._batches else pa.schema([])
+        self.schema = schema
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "QueryResult":
+        return cls(table.to_batches(), table.schema)
+
+    @classmethod
+    def from_reader(cls, reader: pa.RecordBatchReader) -> "QueryResult":
+        return cls(reader, reader.schema)
+
+    @classmethod
+    def from_pylist(cls, rows: List[Dict[str, Any]]) -> "QueryResult":
+        return cls.from_table(pa.Table.from_pylist(rows))
+
+    def _fill(self, rows: Optional[int] = None) -> None:
+        """Lee lotes pendientes hasta tener ``rows`` filas (todas si es None)"""
+        callbacks: List[Callable[[], None]] = []
+        with self._lock:
+            while self._pending is not None and (rows is None or self._buffered < rows):
+                batch = next(self._pending, None)
+                if batch is None:
+                    self._pending = None
+                    callbacks, self._on_complete = self._on_complete, []
+                    break
+                self._batches.append(batch)
+                self._buffered += batch.num_rows
+        # Fuera del lock: un callback puede volver a leer el resultado (p. ej. serializarlo)
+        for callback in callbacks:
+            callback()
+
+    @property
+    def complete(self) -> bool:
+        """Indica si ya se leyeron todos los lotes"""
+        return self._pending is None
+
+    @property
+    def row_count(self) -> Optional[int]:
+        """Filas según los metadatos o, si ya se leyó todo, las leídas; None si aún no se sabe"""
+        if self.total_rows is not None:
+            return self.total_rows
+        return self._buffered if self.complete else None
+
+    def within(self, rows: int) -> bool:
+        """Indica si el resultado tiene a lo más ``rows`` filas, leyendo como máximo ``rows + 1``"""
+        if self.total_rows is not None:
+            return self.total_rows <= rows
+        self._fill(rows + 1)
+        return self.complete
+
+    def on_complete(self, callback: Callable[[], None]) -> None:
+        """Ejecuta ``callback`` cuando se termine de leer el resultado (de inmediato si ya se leyó)"""
+        with self._lock:
+            if self._pending is not None:
+                self._on_complete.append(callback)
+                return
+        callback()
+
+    @property
+    def table(self) -> pa.Table:
+        self._fill()
+        return pa.Table.from_batches(self._batches, schema=self.schema)
+
+    @property
+    def column_names(self) -> List[str]:
+        return self.schema.names
+
+    @property
+    def num_rows(self) -> int:
+        self._fill()
+        return self._buffered
+
+    def head(self, rows: int) -> pa.Table:
+        """Primeras ``rows`` filas, leyendo solo los lotes necesarios"""
+        self._fill(rows)
+        return pa.Table.from_batches(self._batches, schema=self.schema).slice(0, rows)
+
+    def to_pylist(self) -> List[Dict[str, Any]]:
+        return self.table.to_pylist()
+
+    def preview(self, rows: int = 5) -> List[Dict[str, Any]]:
+        """Primeras filas con montos y distancias formateados"""
+        return format_table(self.head(rows))
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __bool__(self) -> bool:
+        self._fill(1)
+        return self._buffered > 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        index = 0
+        while True:
+            if index >= len(self._batches):
+                self._fill(self._buffered + 1)
+                if index >= len(self._batches):
+                    return
+            yield from self._batches[index].to_pylist()
+            index += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is not None and index.stop >= 0 and (index.start or 0) >= 0:
+                return self.head(index.stop).to_pylist()[index]
+            return self.to_pylist()[index]
+        if index >= 0:
+            self._fill(index + 1)
+            if index < self._buffered:
+                return self.head(index + 1).slice(index, 1).to_pylist()[0]
+            raise IndexError("índice fuera del resultado")
+        return self.to_pylist()[index]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Para la caché: se serializa la tabla completa (buffers Arrow, sin objetos por fila).
+        # Lee los lotes pendientes; BigQueryClient solo guarda resultados leídos o pequeños
+        return {"table": self.table}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        table = state["table"]
+        self.__init__(table.to_batches(), table.schema)
+
+    def __repr__(self) -> str:
+        return f"QueryResult(columns={self.column_names}, rows_read={self._buffered})"
+
+
+def _format_column(name: str, column: pa.ChunkedArray) -> List[Any]:
+    """Formatea una columna completa de una vez: 2 decimales y unidad según el nombre"""
+    if not pa.types.is_floating(column.type):
+        return column.to_pylist()
+
+    values = column.to_numpy()
+    text = np.char.mod("%.2f", np.nan_to_num(values))
+    unit = column_unit(name)
+    if unit == "millas":
+        text = np.char.add(text, " millas")
+    elif unit == "USD":
+        text = np.char.add("$", text)
+
+    nulls = column.is_null().to_numpy(zero_copy_only=False)
+    return [None if null else value for value, null in zip(text.tolist(), nulls)]
+
+
+def format_table(table: pa.Table) -> List[Dict[str, Any]]:
+    """Filas listas para el prompt de interpretación"""
+    names = table.column_names
+    columns = [_format_column(name, table.column(i)) for i, name in enumerate(names)]
+    return [dict(zip(names, values)) for values in zip(*columns)]
@@ -0,0 +1,146 @@
+"""Tablas resumen (rollups) pre-agregadas y reescritura automática de consultas.
+
+El rollup agrupa los viajes por fecha × hora × tipo de pago y guarda, para
+cada métrica, suma, conteo, mínimo y máximo. Las consultas de agregación que
+solo usan esas dimensiones se reescriben para leer el rollup en lugar de la
+tabla cruda, con el mismo resultado y muchas menos filas escaneadas.
+
+Uso (desde ``src``)::
+
+    python -m data.rollups build     # crea el rollup completo
+    python -m data.rollups refresh   # refresca los últimos días
+"""
+import argparse
+import os
+import re
+from typing import List, Optional
+
+METRICS = ["fare_amount", "tip_amount", "trip_distance", "total_amount"]
+DIMENSIONS = ["pickup_date", "pickup_hour", "payment_type"]
+
+# Columnas de la tabla cruda que el rollup no conserva tal cual
+RAW_COLUMNS = [
+    "pickup_datetime", "dropoff_datetime", "passenger_count", "trip_distance", "fare_amount",
+    "tip_amount", "total_amount", "tolls_amount", "extra", "mta_tax", "imp_surcharge",
+    "airport_fee", "rate_code", "store_and_fwd_flag", "pickup_location_id", "dropoff_location_id",
+    "vendor_id",
+]
+
+_AGGREGATE = re.compile(r"\b(COUNT|SUM|AVG|MIN|MAX)\s*\(", re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+
+def rollup_select_sql(source_ref: str, where: str = "") -> str:
+    """SELECT que produce las filas del rollup a partir de la tabla cruda"""
+    metrics = ",\n    ".join(
+        f"SUM({m}) AS {m}_sum, COUNT({m}) AS {m}_count, MIN({m}) AS {m}_min, MAX({m}) AS {m}_max"
+        for m in METRICS
+    )
+    return f"""SELECT
+    DATE(pickup_datetime) AS pickup_date,
+    EXTRACT(HOUR FROM pickup_datetime) AS pickup_hour,
+    payment_type,
+    COUNT(*) AS trip_count,
+    {metrics}
+FROM `{source_ref}`
+{where}
+GROUP BY pickup_date, pickup_hour, payment_type"""
+
+
+class RollupRewriter:
+    """Reescribe SQL generado para leer el rollup cuando es equivalente.
+
+    Solo se reescriben consultas de agregación sobre la tabla cruda, sin JOIN,
+    subconsultas ni funciones de ventana, cuyas columnas se pueden derivar
+    del rollup. Cualquier otra consulta se deja intacta (retorna None).
+    """
+
+    def __init__(self, source_ref: str, rollup_ref: str, raw_columns: Optional[List[str]] = None):
+        self.source_ref = source_ref
+        self.rollup_ref = rollup_ref
+        self.raw_columns = [c for c in (raw_columns or RAW_COLUMNS) if c not in DIMENSIONS]
+
+        metric_group = "|".join(METRICS)
+        self._substitutions = [
+            (re.compile(r"EXTRACT\s*\(\s*HOUR\s+FROM\s+pickup_datetime\s*\)", re.IGNORECASE), "pickup_hour"),
+            (re.compile(r"EXTRACT\s*\(\s*(DAYOFWEEK|DAYOFYEAR|DAY|WEEK|MONTH|QUARTER|YEAR)\s+FROM\s+pickup_datetime\s*\)",
+                        re.IGNORECASE), r"EXTRACT(\1 FROM pickup_date)"),
+            (re.compile(r"\bDATE\s*\(\s*pickup_datetime\s*\)", re.IGNORECASE), "pickup_date"),
+            (re.compile(r"\bCOUNT\s*\(\s*\*\s*\)", re.IGNORECASE), "SUM(trip_count)"),
+            (re.compile(rf"\bAVG\s*\(\s*({metric_group})\s*\)", re.IGNORECASE),
+             r"SAFE_DIVIDE(SUM(\1_sum), SUM(\1_count))"),
+            (re.compile(rf"\bSUM\s*\(\s*({metric_group})\s*\)", re.IGNORECASE), r"SUM(\1_sum)"),
+            (re.compile(rf"\bCOUNT\s*\(\s*({metric_group})\s*\)", re.IGNORECASE), r"SUM(\1_count)"),
+            (re.compile(rf"\bMIN\s*\(\s*({metric_group})\s*\)", re.IGNORECASE), r"MIN(\1_min)"),
+            (re.compile(rf"\bMAX\s*\(\s*({metric_group})\s*\)", re.IGNORECASE), r"MAX(\1_max)"),
+        ]
+        self._table = re.compile(rf"`?{re.escape(source_ref)}`?")
+        self._leftovers = re.compile(rf"\b({'|'.join(map(re.escape, self.raw_columns))})\b", re.IGNORECASE)
+
+    def rewrite(self, sql: str) -> Optional[str]:
+        """SQL equivalente sobre el rollup, o None si no se puede responder desde él"""
+        upper = _LITERALS.sub("''", sql).upper()
+        if (len(self._table.findall(sql)) != 1 or upper.count("SELECT") != 1
+                or re.search(r"\b(JOIN|OVER|WITH|UNION|DISTINCT)\b", upper)
+                or not _AGGREGATE.search(upper)):
+            return None
+
+        rewritten = sql
+        for pattern, replacement in self._substitutions:
+            rewritten = pattern.sub(replacement, rewritten)
+
+        # Si queda alguna columna cruda (en SELECT, WHERE, ORDER BY...) el rollup no alcanza
+        check = _LITERALS.sub("''", rewritten)
+        check = re.sub(r"\bAS\s+\w+", "", check, flags=re.IGNORECASE)
+        if self._leftovers.search(check):
+            return None
+
+        return self._table.sub(f"`{self.rollup_ref}`", rewritten)
+
+
+class RollupManager:
+    """Construye y refresca incrementalmente el rollup en BigQuery"""
+
+    def __init__(self, bq_client, rollup_ref: Optional[str] = None, lookback_days: int = 3):
+        self.bq_client = bq_client
+        self.source_ref = bq_client.table_ref
+        self.rollup_ref = rollup_ref or os.getenv("BQ_ROLLUP_TABLE") or f"{self.source_ref}_rollup_hourly"
+        self.lookback_days = lookback_days
+
+    def build(self) -> None:
+        """Crea (o reemplaza) el rollup completo, particionado por fecha"""
+        self.bq_client.execute_script(
+            f"CREATE OR REPLACE TABLE `{self.rollup_ref}`\n"
+            f"PARTITION BY pickup_date AS\n{rollup_select_sql(self.source_ref)}"
+        )
+
+    def refresh(self) -> None:
+        """Recalcula solo los últimos ``lookback_days`` días (datos tardíos incluidos)"""
+        since = (f"DATE_SUB((SELECT IFNULL(MAX(pickup_date), DATE '1970-01-01') FROM `{self.rollup_ref}`), "
+                 f"INTERVAL {int(self.lookback_days)} DAY)")
+        self.bq_client.execute_script(f"""DECLARE since DATE DEFAULT {since};
+BEGIN TRANSACTION;
+DELETE FROM `{self.rollup_ref}` WHERE pickup_date >= since;
+INSERT INTO `{self.rollup_ref}`
+{rollup_select_sql(self.source_ref, "WHERE DATE(pickup_datetime) >= since")};
+COMMIT TRANSACTION;""")
+
+    def rewriter(self, raw_columns: Optional[List[str]] = None) -> RollupRewriter:
+        return RollupRewriter(self.source_ref, self.rollup_ref, raw_columns)
+
+
+def main():
+    from data.bigquery_client import BigQueryClient
+
+    parser = argparse.ArgumentParser(description="Construye o refresca el rollup de viajes")
+    parser.add_argument("action", choices=["build", "refresh"])
+    parser.add_argument("--lookback-days", type=int, default=3)
+    args = parser.parse_args()
+
+    manager = RollupManager(BigQueryClient(), lookback_days=args.lookback_days)
+    getattr(manager, args.action)()
+    print(f"Rollup {manager.rollup_ref}: {args.action} completado")
+
+
+if __name__ == "__main__":
+    main()
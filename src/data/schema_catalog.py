@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# Descripciones por defecto cuando la tabla no las trae en BigQuery
+DEFAULT_DESCRIPTIONS = {
+    "pickup_datetime": "fecha y hora de inicio",
+    "dropoff_datetime": "fecha y hora de fin",
+    "trip_distance": "distancia en MILLAS; filtrar > 0 y < 100",
+    "fare_amount": "tarifa base en USD",
+    "tip_amount": "propina en USD",
+    "total_amount": "pago total en USD",
+    "payment_type": "tipo de pago",
+    "passenger_count": "número de pasajeros",
+}
+
+# Palabras de la pregunta (sin tildes) que apuntan a cada columna
+KEYWORDS = {
+    "fare_amount": ["tarifa", "precio", "cobr", "cuesta", "costo"],
+    "tip_amount": ["propina"],
+    "total_amount": ["pago", "total", "ingreso", "gana", "dinero"],
+    "payment_type": ["pago", "efectivo", "tarjeta"],
+    "trip_distance": ["distancia", "milla", "lejos", "largo", "corto"],
+    "pickup_datetime": ["hora", "dia", "semana", "mes", "fecha", "cuando", "ocupad", "pico", "duran", "duracion"],
+    "dropoff_datetime": ["duran", "duracion", "tiempo de viaje"],
+    "passenger_count": ["pasajero", "personas"],
+}
+
+NUMERIC_TYPES = {"INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC"}
+TIME_TYPES = {"TIMESTAMP", "DATETIME", "DATE"}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class SchemaCatalog:
+    """Catálogo del esquema y estadísticas por columna, cacheado en disco.
+
+    El archivo guarda el ``etag`` de la tabla: mientras la caché esté vigente
+    no se llama a la API al iniciar, y al refrescar solo se recalculan las
+    estadísticas si el ``etag`` cambió. Las estadísticas (mínimo/máximo de
+    fechas, distintos aproximados y rango típico p5–p95) se calculan con una
+    sola consulta sobre una muestra de la tabla.
+    """
+
+    def __init__(self, bq_client, cache_path: Optional[str] = None,
+                 refresh_interval: Optional[float] = None, sample_percent: Optional[float] = None):
+        self.bq_client = bq_client
+        self.cache_path = cache_path or os.getenv("SCHEMA_CACHE_PATH", "./data/schema_catalog.json")
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(
+            os.getenv("SCHEMA_REFRESH_INTERVAL", "86400"))
+        self.sample_percent = sample_percent if sample_percent is not None else float(
+            os.getenv("SCHEMA_STATS_SAMPLE_PERCENT", "10"))
+
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = self._load()
+
+        if not self._data.get("fields"):
+            self.refresh()
+        elif time.time() - self._data.get("checked_at", 0) > self.refresh_interval:
+            # Caché vencida: se usa lo que hay y se revisa el etag en segundo plano
+            threading.Thread(target=self.refresh, name="schema-refresh", daemon=True).start()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if data.get("table_ref") == self.bq_client.table_ref else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Error guardando el catálogo de esquema: {str(e)}")
+
+    def refresh(self, force: bool = False) -> None:
+        """Revisa el etag de la tabla y recalcula esquema y estadísticas si cambió"""
+        try:
+            metadata = self.bq_client.get_table_metadata()
+        except Exception as e:
+            print(f"Error obteniendo el esquema: {str(e)}")
+            return
+
+        with self._lock:
+            changed = force or metadata["etag"] != self._data.get("etag")
+            data = dict(self._data)
+            data.update({"table_ref": self.bq_client.table_ref, "checked_at": time.time()})
+            if changed:
+                data.update({
+                    "etag": metadata["etag"],
+                    "num_rows": metadata.get("num_rows"),
+                    "partition_field": metadata.get("partition_field"),
+                    "fields": metadata["fields"],
+                    "stats": self._compute_stats(metadata["fields"])
+                })
+            self._data = data
+            self._save()
+
+    def _compute_stats(self, fields: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        expressions = []
+        for field in fields:
+            name, field_type = field["name"], field["type"]
+            if field.get("mode") == "REPEATED" or field_type in ("RECORD", "STRUCT"):
+                continue
+            expressions.append(f"APPROX_COUNT_DISTINCT({name}) AS {name}__distinct")
+            if field_type in TIME_TYPES:
+                expressions.append(f"MIN({name}) AS {name}__min")
+                expressions.append(f"MAX({name}) AS {name}__max")
+            elif field_type in NUMERIC_TYPES:
+                expressions.append(f"APPROX_QUANTILES({name}, 20)[OFFSET(1)] AS {name}__p5")
+                expressions.append(f"APPROX_QUANTILES({name}, 20)[OFFSET(19)] AS {name}__p95")
+        if not expressions:
+            return {}
+
+        sample = f" TABLESAMPLE SYSTEM ({self.sample_percent:g} PERCENT)" if 0 < self.sample_percent < 100 else ""
+        query = f"SELECT {', '.join(expressions)} FROM `{self.bq_client.table_ref}`{sample}"
+        rows = self.bq_client.query_data(query, use_cache=False)
+        if isinstance(rows, str) or not rows:
+            print(f"Error calculando estadísticas del esquema: {rows}")
+            return {}
+
+        stats: Dict[str, Dict[str, Any]] = {}
+        for key, value in rows[0].items():
+            if "__" not in key:
+                continue
+            column, stat = key.rsplit("__", 1)
+            stats.setdefault(column, {})[stat] = value
+        return stats
+
+    @property
+    def fields(self) -> List[Dict[str, Any]]:
+        return self._data.get("fields", [])
+
+    @property
+    def partition_field(self) -> Optional[str]:
+        """Columna de partición por tiempo de la tabla, si tiene"""
+        return self._data.get("partition_field")
+
+    def column_names(self) -> List[str]:
+        return [field["name"] for field in self.fields]
+
+    def relevant_columns(self, question: str) -> List[str]:
+        """Columnas que la pregunta parece necesitar; todas si no hay coincidencias"""
+        text = _normalize(question)
+        names = self.column_names()
+        selected = [
+            name for name in names
+            if name.replace("_", " ") in text
+            or any(word in text for word in KEYWORDS.get(name, []))
+        ]
+        if not selected:
+            return names
+        # El tiempo casi siempre se usa para filtrar
+        if "pickup_datetime" in names and "pickup_datetime" not in selected:
+            selected.append("pickup_datetime")
+        return selected
+
+    def _describe(self, field: Dict[str, Any]) -> str:
+        name = field["name"]
+        parts = [f"- {name} ({field['type']})"]
+        description = field.get("description") or DEFAULT_DESCRIPTIONS.get(name)
+        if description:
+            parts.append(f": {description}")
+
+        stats = self._data.get("stats", {}).get(name, {})
+        if "min" in stats and "max" in stats:
+            parts.append(f"; datos entre {str(stats['min'])[:10]} y {str(stats['max'])[:10]}")
+        elif "p5" in stats and "p95" in stats:
+            parts.append(f"; rango típico {stats['p5']:g}–{stats['p95']:g}")
+        if stats.get("distinct") is not None and stats["distinct"] <= 20:
+            parts.append(f"; {stats['distinct']} valores distintos")
+        return "".join(parts)
+
+    def schema_section(self, question: str = "") -> str:
+        """Sección compacta del prompt con las columnas relevantes para la pregunta"""
+        wanted = set(self.relevant_columns(question) if question else self.column_names())
+        return "\n".join(self._describe(field) for field in self.fields if field["name"] in wanted)
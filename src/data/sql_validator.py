@@ -0,0 +1,142 @@
+"""Validación previa del SQL generado, antes de enviarlo al motor.
+
+Parsea la consulta localmente con sqlglot (dialecto BigQuery), revisa que sea
+un solo SELECT y que las columnas existan en el catálogo del esquema, y estima
+con un dry run los bytes que escanearía. Si supera el presupuesto y no filtra
+por fecha, se le agrega un filtro de los últimos días y se vuelve a estimar;
+si aún lo supera, se rechaza.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+
+@dataclass
+class ValidationResult:
+    sql: str
+    error: Optional[str] = None
+    repairable: bool = False  # el error se puede corregir pidiéndole al LLM otra versión
+    estimated_bytes: Optional[int] = None
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class QueryValidator:
+    """Valida columnas, estima costo y agrega filtros de fecha faltantes"""
+
+    def __init__(self, bq_client, schema_catalog=None, max_bytes: Optional[int] = None,
+                 lookback_days: Optional[int] = None, date_column: Optional[str] = None):
+        self.bq_client = bq_client
+        self.schema_catalog = schema_catalog
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("BQ_MAX_BYTES_SCANNED", str(10 * 1024 ** 3)))
+        self.lookback_days = lookback_days if lookback_days is not None else int(
+            os.getenv("BQ_DEFAULT_LOOKBACK_DAYS", "30"))
+        self.date_column = (date_column or getattr(schema_catalog, "partition_field", None)
+                            or os.getenv("BQ_DATE_COLUMN", "pickup_datetime"))
+
+    def _known_columns(self) -> Set[str]:
+        names = self.schema_catalog.column_names() if self.schema_catalog else []
+        return {name.lower() for name in names}
+
+    def _targets_table(self, table: exp.Table) -> bool:
+        return table.name.lower() == self.bq_client.table_id.lower()
+
+    def _has_date_filter(self, tree: exp.Expression) -> bool:
+        return any(
+            column.name.lower() == self.date_column.lower()
+            for where in tree.find_all(exp.Where)
+            for column in where.find_all(exp.Column)
+        )
+
+    def _date_condition(self) -> exp.Expression:
+        field_types = {f["name"]: f["type"] for f in (self.schema_catalog.fields if self.schema_catalog else [])}
+        days = int(self.lookback_days)
+        if field_types.get(self.date_column) == "DATE":
+            condition = f"{self.date_column} >= DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY)"
+        else:
+            condition = f"{self.date_column} >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {days} DAY)"
+        return sqlglot.condition(condition, dialect="bigquery")
+
+    def _add_date_filter(self, tree: exp.Expression) -> Optional[str]:
+        """Agrega el filtro de fecha a cada SELECT que lee la tabla; None si no hay dónde"""
+        tree = tree.copy()
+        changed = False
+        for select in tree.find_all(exp.Select):
+            source = select.args.get("from") or select.args.get("from_")
+            if source is not None and isinstance(source.this, exp.Table) and self._targets_table(source.this):
+                select.where(self._date_condition(), copy=False)
+                changed = True
+        return tree.sql(dialect="bigquery") if changed else None
+
+    def _estimate(self, sql: str) -> Optional[int]:
+        estimate = getattr(self.bq_client, "estimate_bytes", None)
+        return estimate(sql) if estimate else None
+
+    def validate(self, sql: str) -> ValidationResult:
+        try:
+            statements = [s for s in sqlglot.parse(sql, read="bigquery") if s is not None]
+        except ParseError as e:
+            description = e.errors[0].get("description") if e.errors else str(e)
+            return ValidationResult(sql, f"SQL inválido: {description}", repairable=True)
+
+        if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+            return ValidationResult(sql, "Solo se permite una consulta SELECT")
+        tree = statements[0]
+
+        # Columnas contra el catálogo (los alias del SELECT también se pueden referenciar)
+        known = self._known_columns()
+        if known:
+            aliases = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+            aliases |= {table_alias.name.lower() for table_alias in tree.find_all(exp.TableAlias)}
+            unknown = sorted({
+                column.name for column in tree.find_all(exp.Column)
+                if column.name and column.name.lower() not in known and column.name.lower() not in aliases
+            })
+            if unknown:
+                return ValidationResult(sql, f"Columnas desconocidas: {', '.join(unknown)}", repairable=True)
+
+        result = ValidationResult(sql)
+        if not self.max_bytes:
+            return result
+
+        try:
+            result.estimated_bytes = self._estimate(sql)
+        except Exception as e:
+            # El dry run también detecta errores que el parser local deja pasar
+            return ValidationResult(sql, f"Consulta rechazada por el motor: {str(e)}", repairable=True)
+        if result.estimated_bytes is None or result.estimated_bytes <= self.max_bytes:
+            return result
+
+        if self.lookback_days > 0 and not self._has_date_filter(tree):
+            rewritten = self._add_date_filter(tree)
+            if rewritten:
+                try:
+                    estimated = self._estimate(rewritten)
+                except Exception as e:
+                    estimated = None
+                    print(f"Error estimando la consulta con filtro de fecha: {str(e)}")
+                if estimated is not None:
+                    result.notes.append(f"Se limitó a los últimos {self.lookback_days} días")
+                    result.sql, result.estimated_bytes = rewritten, estimated
+                    if estimated <= self.max_bytes:
+                        return result
+
+        result.error = (f"La consulta escanearía ~{_format_bytes(result.estimated_bytes)} "
+                        f"(límite {_format_bytes(self.max_bytes)}); agrega un filtro de fechas más corto")
+        return result
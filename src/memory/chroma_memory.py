@@ -1,22 +1,42 @@
-from chromadb import PersistentClient
-from chromadb.utils import embedding_functions
+from chromadb import HttpClient, PersistentClient
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import atexit
+import hashlib
 import json
+import threading
+import time
+from memory.embeddings import get_embedding_service
+from memory.retention import RetentionPolicy, ensure_background_compaction
+from observability.metrics import metrics
 
 class ChromaMemory:
-    def __init__(self, collection_name: str = "taxi_chat_history"):
+    def __init__(self, collection_name: str = "taxi_chat_history", persist_dir: str = "./data/chroma_db",
+                 embedding_function=None, batch_size: Optional[int] = None, user_id: Optional[str] = None):
         # Crear directorio para la base de datos si no existe
-        self.persist_dir = "./data/chroma_db"
+        self.persist_dir = persist_dir
         os.makedirs(self.persist_dir, exist_ok=True)
         
-        # Inicializar el cliente de Chroma con la nueva configuración
-        self.client = PersistentClient(path=self.persist_dir)
+        # Inicializar el cliente de Chroma con la nueva configuración; con varios procesos (workers de la
+        # API) la base local no es segura y se usa un servidor de Chroma compartido (CHROMA_HOST)
+        if os.getenv("CHROMA_HOST"):
+            self.client = HttpClient(host=os.getenv("CHROMA_HOST"), port=int(os.getenv("CHROMA_PORT", "8000")))
+        else:
+            self.client = PersistentClient(path=self.persist_dir)
         
-        # Usar sentence-transformers para embeddings
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        # Usar el servicio de embeddings compartido (modelo cargado una sola vez por proceso)
+        self.embedding_function = embedding_function or get_embedding_service()
+        
+        # Buffer de escrituras: las interacciones se agregan en lote con un solo collection.add
+        self.batch_size = batch_size or int(os.getenv("CHROMA_BATCH_SIZE", "8"))
+        # Aunque el lote no se llene, lo pendiente no espera más de CHROMA_FLUSH_INTERVAL segundos
+        self.flush_interval = float(os.getenv("CHROMA_FLUSH_INTERVAL", "30"))
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_lock = threading.Lock()
+        atexit.register(self.flush)
+        
+        # Espacio de nombres por defecto: cada interacción guarda su user_id en los metadatos
+        self.user_id = user_id
         
         # Crear o obtener la colección
         try:
@@ -33,56 +53,192 @@ class ChromaMemory:
                 embedding_function=self.embedding_function,
                 metadata={"hnsw:space": "cosine"}
             )
+        
+        # Compactación periódica en segundo plano (CHROMA_COMPACTION_INTERVAL en segundos)
+        interval = float(os.getenv("CHROMA_COMPACTION_INTERVAL", "0"))
+        if interval > 0:
+            ensure_background_compaction(self, RetentionPolicy.from_env(), interval)
+    
+    @staticmethod
+    def _interaction_id(document: str, user_id: Optional[str] = None) -> str:
+        """ID estable derivado del contenido; no depende del tamaño de la colección"""
+        return hashlib.sha1(f"{user_id or ''}\n{document}".encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def split_document(doc: str) -> Optional[Tuple[str, str]]:
+        """Separa un documento 'Q: ...\\nA: ...' en pregunta y respuesta"""
+        q_and_a = doc.split("\nA: ", 1)
+        if len(q_and_a) != 2:
+            return None
+        return q_and_a[0].replace("Q: ", "", 1), q_and_a[1]
+    
+    def _where(self, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        user_id = user_id or self.user_id
+        return {"user_id": user_id} if user_id else None
+    
+    def add_interaction(self, question: str, answer: str, metadata: Dict[str, Any] = None,
+                        user_id: Optional[str] = None) -> None:
+        """Agrega una interacción a la memoria (se escribe al llenarse el buffer)"""
+        user_id = user_id or self.user_id
+        document = f"Q: {question}\nA: {answer}"
+        
+        # ts numérico para poder filtrar por antigüedad en Chroma
+        metadata = dict(metadata or {})
+        metadata.setdefault("ts", time.time())
+        if user_id:
+            metadata["user_id"] = user_id
+        
+        with self._buffer_lock:
+            self._buffer.append({
+                "id": self._interaction_id(document, user_id),
+                "document": document,
+                "metadata": metadata
+            })
+            should_flush = (len(self._buffer) >= self.batch_size
+                            or time.time() - self._buffer[0]["metadata"]["ts"] >= self.flush_interval)
+        
+        if should_flush:
+            self.flush()
+    
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [list(map(float, vector)) for vector in self.embedding_function(texts)]
+    
+    def _ensure_embeddings(self, items: List[Dict[str, Any]]) -> None:
+        """Calcula una sola vez el embedding de las interacciones del buffer (la búsqueda y el upsert lo reutilizan)"""
+        missing = [item for item in items if item.get("embedding") is None]
+        if missing:
+            for item, embedding in zip(missing, self._embed([item["document"] for item in missing])):
+                item["embedding"] = embedding
     
-    def add_interaction(self, question: str, answer: str, metadata: Dict[str, Any] = None) -> None:
-        """Agrega una interacción a la memoria"""
+    def flush(self) -> None:
+        """Escribe las interacciones pendientes en una sola llamada a Chroma"""
+        with self._buffer_lock:
+            pending, self._buffer = self._buffer, []
+        if not pending:
+            return
+        
+        # Deduplicar por ID dentro del lote (upsert no acepta IDs repetidos)
+        unique = {item["id"]: item for item in pending}
         try:
-            # Crear un ID único basado en el timestamp
-            interaction_id = str(len(self.collection.get()["ids"]) + 1)
-            
-            # Agregar la interacción a Chroma
-            self.collection.add(
-                documents=[f"Q: {question}\nA: {answer}"],
-                metadatas=[metadata or {}],
-                ids=[interaction_id]
+            self._ensure_embeddings(list(unique.values()))
+            self.collection.upsert(
+                documents=[item["document"] for item in unique.values()],
+                metadatas=[item["metadata"] for item in unique.values()],
+                embeddings=[item["embedding"] for item in unique.values()],
+                ids=list(unique.keys())
             )
         except Exception as e:
+            # Un error transitorio de Chroma no pierde el historial: vuelven al buffer para el próximo intento
+            with self._buffer_lock:
+                self._buffer = pending + self._buffer
             print(f"Error agregando a memoria: {str(e)}")
     
-    def get_relevant_history(self, query: str, n_results: int = 3) -> List[Dict[str, str]]:
-        """Obtiene el historial relevante basado en la consulta actual"""
+    def _buffered_items(self, query_embedding: List[float], where: Optional[Dict[str, Any]],
+                        n_results: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """Interacciones aún en el buffer más parecidas a la consulta, con su distancia coseno"""
+        with self._buffer_lock:
+            pending = [item for item in self._buffer
+                       if where is None or item["metadata"].get("user_id") == where["user_id"]]
+        if not pending:
+            return []
+        self._ensure_embeddings(pending)
+        query_norm = sum(x * x for x in query_embedding) ** 0.5
+        scored = []
+        for item in pending:
+            vector = item["embedding"]
+            norm = (sum(x * x for x in vector) ** 0.5) * query_norm
+            similarity = sum(x * y for x, y in zip(query_embedding, vector)) / norm if norm else 0.0
+            scored.append((1.0 - similarity, item))
+        scored.sort(key=lambda pair: pair[0])
+        return scored[:n_results]
+    
+    def count(self, user_id: Optional[str] = None) -> int:
+        """Interacciones guardadas del usuario (o de toda la colección sin espacio de nombres), sin leer los documentos"""
+        where = self._where(user_id)
+        try:
+            if where is None:
+                return self.collection.count() + len(self._buffer)
+            with self._buffer_lock:
+                pending = sum(1 for item in self._buffer if item["metadata"].get("user_id") == where["user_id"])
+            return len(self.collection.get(where=where, include=[])["ids"]) + pending
+        except Exception as e:
+            print(f"Error contando memoria: {str(e)}")
+            return 0
+    
+    def get_relevant_items(self, query: str, n_results: int = 3,
+                           user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Interacciones relevantes con su similitud (0-1) y marca de tiempo, de la más a la menos relevante"""
         try:
             if not query:
                 return []
-                
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=min(n_results, self.collection.count())
-            )
             
-            # Formatear los resultados para el modelo
-            relevant_history = []
-            if results and results["documents"] and results["documents"][0]:
-                for doc in results["documents"][0]:  # [0] porque query_texts es una lista
-                    # Separar pregunta y respuesta
-                    q_and_a = doc.split("\nA: ")
-                    if len(q_and_a) == 2:
-                        question = q_and_a[0].replace("Q: ", "")
-                        answer = q_and_a[1]
-                        
-                        relevant_history.extend([
-                            {"role": "user", "content": question},
-                            {"role": "assistant", "content": answer}
-                        ])
+            # Lo que sigue en el buffer se busca en memoria: un flush por búsqueda dejaría lotes de uno
+            where = self._where(user_id)
+            query_embedding = self._embed([query])[0]
+            candidates = self._buffered_items(query_embedding, where, n_results)
             
-            return relevant_history
+            stored = self.collection.count()
+            if stored:
+                start = time.perf_counter()
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=min(n_results, stored),
+                    where=where,
+                    include=["documents", "metadatas", "distances"]
+                )
+                metrics.observe("chroma_query_seconds", time.perf_counter() - start)
+                if results and results["documents"] and results["documents"][0]:
+                    # [0] porque query_embeddings es una lista
+                    seen = {item["id"] for _, item in candidates}
+                    candidates.extend(
+                        (float(distance), {"document": doc, "metadata": metadata})
+                        for item_id, doc, metadata, distance in zip(results["ids"][0], results["documents"][0],
+                                                                    results["metadatas"][0], results["distances"][0])
+                        if item_id not in seen
+                    )
+            candidates.sort(key=lambda pair: pair[0])
+            
+            items = []
+            for distance, item in candidates[:n_results]:
+                q_and_a = self.split_document(item["document"])
+                if q_and_a:
+                    question, answer = q_and_a
+                    items.append({
+                        "question": question,
+                        "answer": answer,
+                        "relevance": max(0.0, 1.0 - distance),  # distancia coseno
+                        "ts": float((item["metadata"] or {}).get("ts", 0))
+                    })
+            return items
         except Exception as e:
             print(f"Error obteniendo historial: {str(e)}")
             return []
     
-    def clear_memory(self) -> None:
-        """Limpia toda la memoria"""
+    def get_relevant_history(self, query: str, n_results: int = 3,
+                             user_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Obtiene el historial relevante basado en la consulta actual"""
+        # Formatear los resultados para el modelo
+        relevant_history = []
+        for item in self.get_relevant_items(query, n_results, user_id):
+            relevant_history.extend([
+                {"role": "user", "content": item["question"]},
+                {"role": "assistant", "content": item["answer"]}
+            ])
+        return relevant_history
+    
+    def clear_memory(self, user_id: Optional[str] = None) -> None:
+        """Limpia la memoria del usuario o, sin espacio de nombres, toda la colección"""
+        where = self._where(user_id)
+        with self._buffer_lock:
+            if where:
+                self._buffer = [item for item in self._buffer
+                                if item["metadata"].get("user_id") != where["user_id"]]
+            else:
+                self._buffer = []
         try:
+            if where:
+                self.collection.delete(where=where)
+                return
             self.client.delete_collection(self.collection.name)
             self.collection = self.client.create_collection(
                 name=self.collection.name,
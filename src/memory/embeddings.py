@@ -0,0 +1,178 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+# Backends soportados y argumentos para SentenceTransformer
+BACKENDS: Dict[str, Dict[str, Any]] = {
+    "torch": {},
+    "onnx": {"backend": "onnx"},
+    # Variante cuantizada int8 publicada junto al modelo en Hugging Face
+    "onnx-int8": {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_quint8_avx2.onnx"}},
+}
+
+
+class EmbeddingService(EmbeddingFunction):
+    """Servicio de embeddings compartido por todo el proceso.
+
+    El modelo se carga una sola vez y de forma perezosa. Los textos repetidos
+    se resuelven desde una caché LRU, y las solicitudes concurrentes se agrupan
+    en micro-lotes: un hilo de trabajo espera hasta ``batch_window_ms`` para
+    juntar textos de varios llamadores y los codifica en una sola llamada.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", backend: str = "torch",
+                 cache_size: int = 4096, batch_window_ms: float = 2.0, max_batch_size: int = 64):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de embeddings no soportado: {backend}")
+
+        self.model_name = model_name
+        self.backend = backend
+        self.cache_size = cache_size
+        self.batch_window_ms = batch_window_ms
+        self.max_batch_size = max_batch_size
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "encoded": 0, "batches": 0}
+
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    @staticmethod
+    def name() -> str:
+        return "embedding_service"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "backend": self.backend}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "EmbeddingService":
+        return EmbeddingService(model_name=config["model_name"], backend=config.get("backend", "torch"))
+
+    @property
+    def model(self):
+        """Modelo de SentenceTransformer, cargado en el primer uso"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    start = time.perf_counter()
+                    self._model = SentenceTransformer(self.model_name, device="cpu", **BACKENDS[self.backend])
+                    self.load_seconds = time.perf_counter() - start
+        return self._model
+
+    def warmup(self) -> float:
+        """Carga el modelo y ejecuta una codificación de prueba; retorna los segundos empleados"""
+        start = time.perf_counter()
+        self._encode(["warmup"])
+        return time.perf_counter() - start
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=self.max_batch_size, convert_to_numpy=True)
+        self.stats["encoded"] += len(texts)
+        self.stats["batches"] += 1
+        return [vector.tolist() for vector in vectors]
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            with self._load_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _batch_loop(self) -> None:
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.perf_counter() + self.batch_window_ms / 1000
+            # Juntar solicitudes hasta llenar el lote o vencer la ventana
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def _encode_batched(self, texts: List[str]) -> List[List[float]]:
+        if self.batch_window_ms <= 0:
+            return self._encode(texts)
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    self.stats["cache_hits"] += 1
+                    results[i] = cached
+                else:
+                    missing.setdefault(text, []).append(i)
+
+        if missing:
+            unique_texts = list(missing.keys())
+            vectors = self._encode_batched(unique_texts)
+            with self._cache_lock:
+                for text, vector in zip(unique_texts, vectors):
+                    for i in missing[text]:
+                        results[i] = vector
+                    self._cache[text] = vector
+                    self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return results
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Instancia única del servicio de embeddings, configurada por variables de entorno"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService(
+                    model_name=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+                    backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+                    cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+                    batch_window_ms=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2"))
+                )
+    return _service
@@ -0,0 +1,295 @@
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Resume una lista de pares (pregunta, respuesta) en un solo texto
+Summarizer = Callable[[List[Tuple[str, str]]], str]
+
+
+@dataclass
+class RetentionPolicy:
+    """Límites de retención por usuario para la memoria persistente"""
+    max_items: int = 500
+    max_age_days: float = 30
+    dedupe_distance: float = 0.05  # distancia coseno bajo la cual dos Q/A se consideran duplicados
+    dedupe_window: int = 200  # interacciones conservadas más recientes con las que se compara cada una
+    summary_chunk: int = 20
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            max_items=int(os.getenv("CHROMA_MAX_ITEMS", "500")),
+            max_age_days=float(os.getenv("CHROMA_MAX_AGE_DAYS", "30")),
+            dedupe_distance=float(os.getenv("CHROMA_DEDUPE_DISTANCE", "0.05")),
+            dedupe_window=int(os.getenv("CHROMA_DEDUPE_WINDOW", "200")),
+            summary_chunk=int(os.getenv("CHROMA_SUMMARY_CHUNK", "20"))
+        )
+
+
+def extractive_summary(pairs: List[Tuple[str, str]]) -> str:
+    """Resumen sin LLM: cada pregunta con la primera línea de su respuesta"""
+    lines = [f"- {question} → {answer.splitlines()[0] if answer else ''}" for question, answer in pairs]
+    return "\n".join(lines)[:2000]
+
+
+def _item_ts(metadata: Dict[str, Any]) -> float:
+    """Marca de tiempo de una interacción (ts numérico o el timestamp en texto de versiones previas)"""
+    if "ts" in metadata:
+        return float(metadata["ts"])
+    try:
+        return datetime.fromisoformat(str(metadata.get("timestamp"))).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class MemoryCompactor:
+    """Aplica la política de retención a una ChromaMemory.
+
+    Por cada usuario elimina lo vencido por antigüedad, descarta Q/A casi
+    duplicados (conservando el más reciente) y, si aún supera ``max_items``,
+    reemplaza las interacciones más antiguas por documentos resumen.
+    """
+
+    def __init__(self, memory, policy: Optional[RetentionPolicy] = None,
+                 summarizer: Optional[Summarizer] = None, page_size: int = 1000):
+        self.memory = memory
+        self.policy = policy or RetentionPolicy()
+        self.summarizer = summarizer or extractive_summary
+        self.page_size = page_size
+        self.last_report: Dict[str, Any] = {}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _snapshot(self, sample_queries: List[str], user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Tamaño de la colección y latencia de búsqueda en la memoria de ``user_id`` (como la usa el agente)"""
+        timings = []
+        for query in sample_queries:
+            start = time.perf_counter()
+            self.memory.get_relevant_history(query, user_id=user_id)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return {
+            "items": self.memory.collection.count(),
+            "index_bytes": _dir_size(self.memory.persist_dir),
+            "retrieval_ms": round(timings[len(timings) // 2] * 1000, 3) if timings else None,
+            "sample_user": user_id
+        }
+
+    def _users(self) -> Tuple[Dict[str, int], List[str]]:
+        """Interacciones por usuario de la colección e IDs sin ``user_id``, paginando solo los metadatos"""
+        users: Dict[str, int] = {}
+        unscoped_ids = []
+        offset = 0
+        while True:
+            page = self.memory.collection.get(include=["metadatas"], limit=self.page_size, offset=offset)
+            ids = page["ids"]
+            if not len(ids):
+                break
+            for item_id, metadata in zip(ids, page["metadatas"]):
+                user_id = (metadata or {}).get("user_id")
+                if user_id:
+                    users[user_id] = users.get(user_id, 0) + 1
+                else:
+                    unscoped_ids.append(item_id)
+            offset += len(ids)
+        return users, unscoped_ids
+
+    def _load_items(self, user_id: str = "", ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Interacciones de un usuario (filtro ``where``) o de una lista de IDs, por páginas"""
+        items = []
+        offset = 0
+        while True:
+            if user_id:
+                page = self.memory.collection.get(
+                    where={"user_id": user_id},
+                    include=["documents", "metadatas", "embeddings"],
+                    limit=self.page_size,
+                    offset=offset
+                )
+            else:
+                page_ids = (ids or [])[offset:offset + self.page_size]
+                if not page_ids:
+                    break
+                page = self.memory.collection.get(ids=page_ids, include=["documents", "metadatas", "embeddings"])
+            page_ids = page["ids"]
+            if not len(page_ids):
+                break
+            for i, item_id in enumerate(page_ids):
+                metadata = page["metadatas"][i] or {}
+                items.append({
+                    "id": item_id,
+                    "document": page["documents"][i],
+                    "metadata": metadata,
+                    "embedding": page["embeddings"][i],
+                    "ts": _item_ts(metadata)
+                })
+            offset += len(page_ids)
+        return items
+
+    def _near_duplicates(self, items: List[Dict[str, Any]]) -> List[str]:
+        """IDs de interacciones casi idénticas a otra más reciente (items ordenados del más nuevo al más viejo).
+
+        Cada interacción se compara solo con las ``dedupe_window`` conservadas
+        más cercanas en el tiempo, así el costo es lineal en el historial.
+        """
+        if len(items) < 2:
+            return []
+        vectors = np.asarray([item["embedding"] for item in items], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        kept: List[int] = []
+        duplicates = []
+        for i in range(len(items)):
+            window = kept[-self.policy.dedupe_window:]
+            if window and float(np.max(vectors[window] @ vectors[i])) >= 1 - self.policy.dedupe_distance:
+                duplicates.append(items[i]["id"])
+            else:
+                kept.append(i)
+        return duplicates
+
+    def _summary_slots(self, alive: int) -> Tuple[int, int]:
+        """Cuántas interacciones recientes conservar y de qué tamaño los bloques a resumir,
+        de modo que lo conservado más los resúmenes no supere ``max_items``"""
+        max_items = max(self.policy.max_items, 1)
+        chunk = max(self.policy.summary_chunk, 1)
+        keep = max_items - 1
+        while keep > 0 and keep + math.ceil((alive - keep) / chunk) > max_items:
+            keep -= 1
+        # Con max_items muy bajo los bloques crecen para no pasarse de los lugares libres
+        chunk = max(chunk, math.ceil((alive - keep) / (max_items - keep)))
+        return keep, chunk
+
+    def _compact_user(self, user_id: str, items: List[Dict[str, Any]], now: float) -> Dict[str, int]:
+        """Vence, deduplica y resume las interacciones de un usuario; retorna los conteos"""
+        max_age_s = self.policy.max_age_days * 86400
+        items.sort(key=lambda item: item["ts"], reverse=True)
+
+        expired, alive = [], []
+        for item in items:
+            if self.policy.max_age_days and now - item["ts"] > max_age_s:
+                expired.append(item["id"])
+            else:
+                alive.append(item)
+
+        duplicates = self._near_duplicates(alive)
+        dup_ids = set(duplicates)
+        alive = [item for item in alive if item["id"] not in dup_ids]
+
+        # Lo que excede max_items se condensa en documentos resumen
+        to_summarize: List[str] = []
+        summaries: List[Dict[str, Any]] = []
+        if len(alive) > self.policy.max_items:
+            keep, chunk_size = self._summary_slots(len(alive))
+            old = alive[keep:]
+            old.reverse()
+            for start in range(0, len(old), chunk_size):
+                chunk = old[start:start + chunk_size]
+                pairs = [pair for pair in (self.memory.split_document(item["document"]) for item in chunk) if pair]
+                summary_meta = {"ts": chunk[-1]["ts"], "summary": True,
+                                "timestamp": str(datetime.fromtimestamp(chunk[-1]["ts"]))}
+                if user_id:
+                    summary_meta["user_id"] = user_id
+                document = f"Q: Resumen de {len(chunk)} consultas anteriores\nA: {self.summarizer(pairs)}"
+                summaries.append({
+                    "id": self.memory._interaction_id(document, user_id),
+                    "document": document,
+                    "metadata": summary_meta
+                })
+                to_summarize.extend(item["id"] for item in chunk)
+
+        removed = expired + duplicates + to_summarize
+        for start in range(0, len(removed), self.page_size):
+            self.memory.collection.delete(ids=removed[start:start + self.page_size])
+        if summaries:
+            self.memory.collection.upsert(
+                ids=[s["id"] for s in summaries],
+                documents=[s["document"] for s in summaries],
+                metadatas=[s["metadata"] for s in summaries]
+            )
+        return {
+            "expired": len(expired),
+            "duplicates": len(duplicates),
+            "summarized": len(to_summarize),
+            "summaries_created": len(summaries)
+        }
+
+    def run_once(self, sample_queries: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Ejecuta una compactación y reporta tamaño y latencia antes/después"""
+        sample_queries = sample_queries or ["tarifa promedio por viaje", "horas más ocupadas"]
+        self.memory.flush()
+        users, unscoped_ids = self._users()
+        # La latencia se mide en la memoria del usuario con más interacciones
+        sample_user = max(users, key=users.get) if users else None
+        before = self._snapshot(sample_queries, sample_user)
+
+        now = time.time()
+        totals = {"expired": 0, "duplicates": 0, "summarized": 0, "summaries_created": 0}
+
+        # Un usuario a la vez: solo sus interacciones (con embeddings) están en memoria
+        for user_id in sorted(users) + ([""] if unscoped_ids else []):
+            items = self._load_items(user_id, unscoped_ids if not user_id else None)
+            for name, count in self._compact_user(user_id, items, now).items():
+                totals[name] += count
+
+        after = self._snapshot(sample_queries, sample_user)
+        self.last_report = {
+            "before": before,
+            "after": after,
+            **totals
+        }
+        return self.last_report
+
+    def _loop(self, interval_seconds: float) -> None:
+        while not self._stop.wait(interval_seconds):
+            try:
+                report = self.run_once()
+                print(f"Compactación de memoria: {report}")
+            except Exception as e:
+                print(f"Error compactando memoria: {str(e)}")
+
+    def start(self, interval_seconds: float) -> None:
+        """Inicia la compactación periódica en un hilo daemon"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval_seconds,),
+                                        name="chroma-compaction", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_compactors: Dict[Tuple[str, str], MemoryCompactor] = {}
+_compactors_lock = threading.Lock()
+
+
+def ensure_background_compaction(memory, policy: RetentionPolicy, interval_seconds: float) -> MemoryCompactor:
+    """Un solo compactador por colección y proceso, aunque haya varias ChromaMemory"""
+    key = (os.path.abspath(memory.persist_dir), memory.collection.name)
+    with _compactors_lock:
+        compactor = _compactors.get(key)
+        if compactor is None:
+            compactor = MemoryCompactor(memory, policy)
+            compactor.start(interval_seconds)
+            _compactors[key] = compactor
+        return compactor
@@ -0,0 +1,116 @@
+"""Contadores e histogramas del agente.
+
+Los valores se guardan en memoria (para el panel de depuración) y, si
+``prometheus_client`` está instalado, también en su registro, que se expone
+con ``start_metrics_server`` (METRICS_PORT).
+"""
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# nombre -> (tipo, descripción, etiquetas)
+DEFINITIONS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "agent_request_seconds": ("histogram", "Duración total de cada solicitud", ("entrypoint",)),
+    "agent_stage_seconds": ("histogram", "Duración de cada etapa del pipeline", ("stage",)),
+    "agent_errors_total": ("counter", "Errores por etapa, incluidos los que se convierten en respuesta", ("stage",)),
+    "llm_calls_total": ("counter", "Llamadas al LLM por resultado", ("outcome",)),
+    "llm_tokens_total": ("counter", "Tokens del LLM (prompt o completion)", ("kind",)),
+    "bq_bytes_processed_total": ("counter", "Bytes procesados por BigQuery", ()),
+    "bq_slot_ms_total": ("counter", "Tiempo de slot consumido en BigQuery (ms)", ()),
+    "cache_requests_total": ("counter", "Consultas a las cachés por resultado", ("cache", "result")),
+    "chroma_query_seconds": ("histogram", "Latencia de las búsquedas en Chroma", ()),
+    "prefetch_queries_total": ("counter", "Consultas especulativas por resultado", ("outcome",)),
+    "prefetch_bytes_total": ("counter", "Bytes estimados de las consultas especulativas ejecutadas", ()),
+    "prefetch_hits_total": ("counter", "Resultados especulativos usados por una consulta real", ()),
+    "prefetch_saved_seconds_total": ("counter", "Tiempo de consulta ahorrado por resultados especulativos", ()),
+}
+
+# Observaciones recientes que se guardan por serie para calcular percentiles en el panel
+_RECENT = 512
+
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Tuple[int, float, Deque[float]]] = {}
+        self._prometheus: Dict[str, Any] = {}
+        try:
+            import prometheus_client
+            for name, (kind, description, labels) in DEFINITIONS.items():
+                cls = prometheus_client.Histogram if kind == "histogram" else prometheus_client.Counter
+                self._prometheus[name] = cls(name, description, labels)
+        except ImportError:
+            pass
+        except ValueError:
+            # Ya registradas en este proceso (p. ej. al recargar el módulo)
+            self._prometheus = {}
+
+    def _prom(self, name: str, labels: Dict[str, str]):
+        metric = self._prometheus.get(name)
+        if metric is None:
+            return None
+        return metric.labels(**labels) if labels else metric
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = _series(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        metric = self._prom(name, labels)
+        if metric is not None:
+            metric.inc(value)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _series(name, labels)
+        with self._lock:
+            count, total, recent = self._histograms.get(key) or (0, 0.0, deque(maxlen=_RECENT))
+            recent.append(value)
+            self._histograms[key] = (count + 1, total + value, recent)
+        metric = self._prom(name, labels)
+        if metric is not None:
+            metric.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Contadores y resumen de histogramas (conteo, promedio, p50, p95)"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (count, total, sorted(recent)) for k, (count, total, recent) in self._histograms.items()}
+        summary = {}
+        for key, (count, total, recent) in histograms.items():
+            summary[key] = {
+                "count": count,
+                "avg": round(total / count, 4),
+                "p50": round(recent[len(recent) // 2], 4),
+                "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 4),
+            }
+        return {"counters": counters, "histograms": summary}
+
+
+metrics = Metrics()
+
+_server_port: Optional[int] = None
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[int]:
+    """Expone /metrics para Prometheus en ``port`` (o METRICS_PORT); una sola vez por proceso"""
+    global _server_port
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port or _server_port is not None:
+        return _server_port
+    try:
+        from prometheus_client import start_http_server
+    except ImportError:
+        print("prometheus_client no está instalado; las métricas solo se ven en el panel de depuración")
+        return None
+    start_http_server(port)
+    _server_port = port
+    return port
@@ -0,0 +1,180 @@
+"""Trazas por solicitud y por etapa del pipeline.
+
+``request_trace`` abre la traza de una pregunta y le asigna un trace id que
+aparece en los logs; ``span`` mide cada etapa (historial, generación de SQL,
+validación, BigQuery, respuesta, escritura en memoria). Si OpenTelemetry
+está instalado cada etapa es además un span suyo; sin un SDK configurado
+la API de OpenTelemetry no hace nada, así que el costo por defecto es un
+par de lecturas de reloj.
+"""
+import logging
+import os
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional
+
+from observability.metrics import metrics
+
+try:
+    from opentelemetry import trace as otel_trace
+    _tracer = otel_trace.get_tracer("taxi-agent")
+except ImportError:
+    otel_trace = None
+    _tracer = None
+
+logger = logging.getLogger("agent")
+
+
+@dataclass
+class RequestTrace:
+    """Duración por etapa y atributos de una solicitud"""
+    trace_id: str
+    entrypoint: str
+    stages: Dict[str, float] = field(default_factory=dict)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+    total_s: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RequestTrace":
+        """Reconstruye una traza recibida de la API (inverso de ``as_dict``)"""
+        total_ms = data.get("total_ms")
+        return cls(
+            trace_id=data["trace_id"],
+            entrypoint=data["entrypoint"],
+            stages={stage: ms / 1000 for stage, ms in data.get("stages_ms", {}).items()},
+            attributes=data.get("attributes", {}),
+            errors=data.get("errors", []),
+            total_s=total_ms / 1000 if total_ms is not None else None,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "entrypoint": self.entrypoint,
+            "total_ms": round(self.total_s * 1000, 1) if self.total_s is not None else None,
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "attributes": self.attributes,
+            "errors": self.errors,
+        }
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("agent_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def current_trace_id() -> str:
+    trace = _current.get()
+    return trace.trace_id if trace else "-"
+
+
+def _otel_span(name: str, attributes: Dict[str, Any]):
+    if _tracer is None:
+        return nullcontext(None)
+    return _tracer.start_as_current_span(name, attributes={k: str(v) for k, v in attributes.items()})
+
+
+def _otel_trace_id(otel_span) -> Optional[str]:
+    if otel_span is None:
+        return None
+    context = otel_span.get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+@contextmanager
+def request_trace(entrypoint: str, **attributes: Any) -> Iterator[RequestTrace]:
+    """Traza de una solicitud; usa el trace id de OpenTelemetry si hay un SDK configurado"""
+    with _otel_span(f"agent.{entrypoint}", attributes) as otel_span:
+        trace = RequestTrace(_otel_trace_id(otel_span) or uuid.uuid4().hex[:16], entrypoint,
+                             attributes=dict(attributes))
+        token = _current.set(trace)
+        start = perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.total_s = perf_counter() - start
+            metrics.observe("agent_request_seconds", trace.total_s, entrypoint=entrypoint)
+            logger.info("%s en %.0f ms: %s", entrypoint, trace.total_s * 1000,
+                        ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in trace.stages.items()))
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Un generador que se cierra desde otro contexto (p. ej. al recolectarlo)
+                _current.set(None)
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[None]:
+    """Mide una etapa del pipeline y la suma a la traza actual"""
+    start = perf_counter()
+    with _otel_span(f"agent.{stage}", attributes) as otel_span:
+        try:
+            yield
+        except Exception as e:
+            record_error(stage, e)
+            if otel_span is not None:
+                otel_span.record_exception(e)
+            raise
+        finally:
+            record_stage(stage, perf_counter() - start)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Suma la duración de una etapa medida fuera de ``span`` (p. ej. entre fragmentos de un stream)"""
+    metrics.observe("agent_stage_seconds", seconds, stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+
+def annotate(**attributes: Any) -> None:
+    """Agrega atributos (bytes procesados, modo de respuesta, ...) a la traza y al span actuales"""
+    trace = _current.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+    if otel_trace is not None:
+        otel_span = otel_trace.get_current_span()
+        for key, value in attributes.items():
+            otel_span.set_attribute(key, str(value))
+
+
+def record_error(stage: str, error: Exception) -> None:
+    """Registra un error aunque después se convierta en un mensaje para el usuario"""
+    # Una excepción que atraviesa varias etapas se registra solo en la primera
+    if getattr(error, "_agent_recorded", False):
+        return
+    try:
+        error._agent_recorded = True
+    except AttributeError:
+        pass
+    metrics.inc("agent_errors_total", stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.errors.append(f"{stage}: {error}")
+    logger.warning("Error en %s: %s", stage, error)
+
+
+class TraceIdFilter(logging.Filter):
+    """Agrega ``trace_id`` a cada registro de log"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """Logs del agente con el trace id de la solicitud (LOG_LEVEL, por defecto INFO)"""
+    if any(isinstance(f, TraceIdFilter) for h in logger.handlers for f in h.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [trace=%(trace_id)s] %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    logger.propagate = False
@@ -0,0 +1,255 @@
+"""API HTTP del agente, para servir con varios procesos detrás del mismo puerto.
+
+Cada worker de uvicorn es un proceso con sus propios recursos (LLM, BigQuery,
+Chroma); lo que debe verse igual desde todos se guarda en SQLite bajo
+``SHARED_STATE_DIR``: la caché de resultados (QUERY_CACHE_PATH), la caché de
+respuestas (RESPONSE_CACHE_PATH) y el historial de cada sesión
+(SESSION_STORE_PATH). La memoria de Chroma se comparte con un servidor de
+Chroma (CHROMA_HOST). La cuota del LLM (LLM_RPM, LLM_TPM) se reparte entre
+los workers.
+
+Endpoints:
+
+- ``POST /chat``: respuesta completa y traza de la solicitud.
+- ``POST /chat/stream``: eventos de ``stream_response`` en NDJSON, más un
+  evento final ``trace``.
+- ``GET /memory``: interacciones en la memoria persistente (``?user_id=`` las de un usuario).
+- ``POST /memory/{user_id}/search``: interacciones relevantes para una pregunta.
+- ``DELETE /memory/{user_id}``: borra la memoria y la sesión del usuario.
+- ``GET /metrics``: métricas del worker que atiende (JSON).
+- ``GET /health``
+
+Todos los endpoints de chat y de memoria requieren ``AGENT_API_KEY`` configurada
+y, en cada solicitud, la clave de servicio (``X-API-Key``) o el token del
+usuario al que se accede (``X-User-Token``, ver ``agent/auth.py``). Con el
+token de un usuario solo se accede a su memoria y a sus sesiones.
+
+Uso (desde ``src``)::
+
+    python -m server --workers 4 --port 8000
+
+``AGENT_RESOURCES_FACTORY=modulo:funcion`` reemplaza los recursos por los que
+retorne esa función (p. ej. backends falsos en benchmark/server_load_test.py).
+"""
+from dotenv import load_dotenv
+import argparse
+import contextvars
+import importlib
+import json
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from agent.auth import api_key, verify_api_key, verify_user_token
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources, ConversationState, get_shared_resources
+from agent.session_store import SessionStore
+from observability.metrics import metrics as process_metrics
+from observability.tracing import configure_logging
+
+# Cargar variables de entorno
+load_dotenv()
+
+_resources: Optional[AgentResources] = None
+_sessions: Optional[SessionStore] = None
+_lock = threading.Lock()
+
+
+def get_resources() -> AgentResources:
+    """Recursos del worker: los compartidos del proceso o los de AGENT_RESOURCES_FACTORY"""
+    global _resources
+    if _resources is None:
+        with _lock:
+            if _resources is None:
+                factory = os.getenv("AGENT_RESOURCES_FACTORY")
+                if factory:
+                    module, _, name = factory.partition(":")
+                    _resources = getattr(importlib.import_module(module), name)()
+                else:
+                    _resources = get_shared_resources()
+    return _resources
+
+
+def get_sessions() -> SessionStore:
+    global _sessions
+    if _sessions is None:
+        with _lock:
+            if _sessions is None:
+                _sessions = SessionStore.from_env()
+    return _sessions
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cada worker carga clientes y modelos antes de recibir tráfico
+    configure_logging()
+    get_resources()
+    if not os.getenv("AGENT_RESOURCES_FACTORY") and os.getenv("EMBEDDING_WARMUP", "1") == "1":
+        from memory.embeddings import get_embedding_service
+        get_embedding_service().warmup()
+    yield
+
+
+app = FastAPI(title="Agente de taxis NY", lifespan=lifespan)
+
+
+class ChatRequest(BaseModel):
+    question: str
+    user_id: Optional[str] = None
+    # Sesión de la memoria a corto plazo; por defecto la del usuario
+    session_id: Optional[str] = None
+    bypass_cache: bool = False
+
+
+class SearchRequest(BaseModel):
+    query: str
+    n_results: int = 3
+
+
+def authorize(user_id: Optional[str], x_api_key: Optional[str], x_user_token: Optional[str]) -> None:
+    """Clave de servicio, o token que corresponde a ``user_id``; si no, 401"""
+    if not api_key():
+        raise HTTPException(status_code=503, detail="La API requiere AGENT_API_KEY")
+    if verify_api_key(x_api_key) or verify_user_token(user_id, x_user_token):
+        return
+    raise HTTPException(status_code=401, detail="Credenciales inválidas para este usuario")
+
+
+def _session_key(request: ChatRequest) -> Optional[str]:
+    # Las sesiones de un usuario quedan bajo su user_id: un session_id ajeno no da acceso a otra conversación
+    if request.user_id and request.session_id:
+        return f"{request.user_id}:{request.session_id}"
+    return request.session_id or request.user_id
+
+
+def _agent(request: ChatRequest) -> GeminiAgent:
+    """Agente liviano para la solicitud, con el historial de la sesión desde el almacén compartido"""
+    state = ConversationState(user_id=request.user_id)
+    key = _session_key(request)
+    if key:
+        state.history = get_sessions().load(key)
+    return GeminiAgent(resources=get_resources(), state=state)
+
+
+def _save_session(request: ChatRequest, agent: GeminiAgent) -> None:
+    key = _session_key(request)
+    if key:
+        get_sessions().save(key, agent.conversation_history)
+
+
+@app.get("/health")
+def health() -> Dict[str, Any]:
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.post("/chat")
+def chat(request: ChatRequest, x_api_key: Optional[str] = Header(None),
+         x_user_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    authorize(request.user_id, x_api_key, x_user_token)
+    agent = _agent(request)
+    answer = agent.get_response(request.question, bypass_cache=request.bypass_cache)
+    _save_session(request, agent)
+    return {"answer": answer, "trace": agent.last_trace.as_dict() if agent.last_trace else None}
+
+
+def _stream_lines(request: ChatRequest) -> Iterator[str]:
+    agent = _agent(request)
+    events = agent.stream_response(request.question, bypass_cache=request.bypass_cache)
+    # Starlette avanza el generador en hilos distintos; la traza vive en un contexto propio
+    context = contextvars.copy_context()
+    while True:
+        event = context.run(next, events, None)
+        if event is None:
+            break
+        yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    # La sesión se guarda solo si el cliente consumió el stream completo
+    _save_session(request, agent)
+    if agent.last_trace is not None:
+        trace = {"type": "trace", "trace": agent.last_trace.as_dict()}
+        yield json.dumps(trace, ensure_ascii=False, default=str) + "\n"
+
+
+@app.post("/chat/stream")
+def chat_stream(request: ChatRequest, x_api_key: Optional[str] = Header(None),
+                x_user_token: Optional[str] = Header(None)) -> StreamingResponse:
+    authorize(request.user_id, x_api_key, x_user_token)
+    return StreamingResponse(_stream_lines(request), media_type="application/x-ndjson")
+
+
+@app.get("/memory")
+def memory_count(user_id: Optional[str] = None, x_api_key: Optional[str] = Header(None),
+                 x_user_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    # Sin user_id es el total de la colección: solo con la clave de servicio
+    authorize(user_id, x_api_key, x_user_token)
+    return {"count": get_resources().memory.count(user_id)}
+
+
+@app.post("/memory/{user_id}/search")
+def memory_search(user_id: str, request: SearchRequest, x_api_key: Optional[str] = Header(None),
+                  x_user_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    authorize(user_id, x_api_key, x_user_token)
+    memory = get_resources().memory
+    if hasattr(memory, "get_relevant_items"):
+        items = memory.get_relevant_items(request.query, n_results=request.n_results, user_id=user_id)
+    else:
+        items = memory.get_relevant_history(request.query, n_results=request.n_results, user_id=user_id)
+    return {"user_id": user_id, "items": items}
+
+
+@app.delete("/memory/{user_id}")
+def memory_clear(user_id: str, x_api_key: Optional[str] = Header(None),
+                 x_user_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    authorize(user_id, x_api_key, x_user_token)
+    GeminiAgent(resources=get_resources(), state=ConversationState(user_id=user_id)).clear_history()
+    # La sesión por defecto del usuario y las suyas con session_id (guardadas como "user_id:session_id")
+    get_sessions().delete(user_id)
+    get_sessions().delete_prefix(f"{user_id}:")
+    return {"user_id": user_id, "cleared": True}
+
+
+@app.get("/metrics")
+def worker_metrics() -> Dict[str, Any]:
+    snapshot = process_metrics.snapshot()
+    prefetcher = getattr(get_resources(), "prefetcher", None)
+    if prefetcher is not None:
+        snapshot["prefetch"] = prefetcher.report()
+    return {"pid": os.getpid(), **snapshot}
+
+
+def configure_shared_state(workers: int) -> None:
+    """Rutas de SQLite compartidas y cuota del LLM por worker; los workers heredan el entorno"""
+    shared_dir = os.getenv("SHARED_STATE_DIR", "./data/shared")
+    os.environ.setdefault("QUERY_CACHE_PATH", os.path.join(shared_dir, "query_cache.db"))
+    os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(shared_dir, "response_cache.db"))
+    os.environ.setdefault("SESSION_STORE_PATH", os.path.join(shared_dir, "sessions.db"))
+    if workers > 1:
+        for name in ("LLM_RPM", "LLM_TPM"):
+            if os.getenv(name):
+                os.environ[name] = str(max(1, int(float(os.environ[name]) / workers)))
+        if not os.getenv("CHROMA_HOST"):
+            print("Aviso: con varios workers la memoria de Chroma debería usar un servidor compartido (CHROMA_HOST)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP del agente")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")))
+    args = parser.parse_args()
+
+    import uvicorn
+
+    configure_shared_state(args.workers)
+    # Un worker ocupado puede tardar en responder el ping del supervisor; con el
+    # valor por defecto (5 s) uvicorn lo reinicia y corta las solicitudes en curso
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers, log_level="warning",
+                timeout_worker_healthcheck=int(os.getenv("API_WORKER_HEALTHCHECK_TIMEOUT", "30")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos se importan desde src (``from agent...``, ``from data...``), igual que en la app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(tmp_path, monkeypatch):
+    """Catálogo de esquema y almacenes compartidos en un directorio temporal"""
+    monkeypatch.setenv("SCHEMA_CACHE_PATH", str(tmp_path / "schema_catalog.json"))
+    for name in ("QUERY_CACHE_PATH", "RESPONSE_CACHE_PATH", "SESSION_STORE_PATH",
+                 "SPECULATIVE_PREFETCH", "BQ_USE_ROLLUPS", "AGENT_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
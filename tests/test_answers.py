@@ -0,0 +1,112 @@
+from typing import Iterator, List
+
+import pyarrow as pa
+import pytest
+
+from agent.answers import render_template, summarize_result
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources
+from benchmark.answer_bench import SHAPES, run_shape
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+from data.results import QueryResult
+
+FARES = QueryResult.from_pylist([
+    {"dia": "lunes", "tarifa_promedio": 12.5},
+    {"dia": "martes", "tarifa_promedio": 9.75},
+    {"dia": "sábado", "tarifa_promedio": 15.0},
+])
+
+
+def test_template_reports_maximum_when_asked():
+    answer = render_template(FARES, question="¿Qué día tiene la tarifa promedio más alta?")
+    assert answer.startswith("📊 Dia con mayor tarifa promedio: sábado")
+
+
+def test_template_reports_minimum_when_asked():
+    answer = render_template(FARES, question="¿Qué día tiene la tarifa promedio más baja?")
+    assert answer.startswith("📊 Dia con menor tarifa promedio: martes")
+
+
+def test_template_follows_order_by_when_question_is_neutral():
+    sql = "SELECT dia, AVG(fare_amount) AS tarifa_promedio FROM t GROUP BY dia ORDER BY tarifa_promedio ASC LIMIT 3"
+    answer = render_template(FARES, question="Tarifa promedio por día", sql=sql)
+    assert answer.startswith("📊 Dia con menor tarifa promedio: martes")
+
+
+def test_template_defers_to_llm_when_direction_is_unclear():
+    sql = "SELECT dia, AVG(fare_amount) AS tarifa_promedio FROM t GROUP BY dia ORDER BY dia"
+    assert render_template(FARES, question="Tarifa promedio por día", sql=sql) is None
+    assert render_template(FARES, question="Tarifa promedio por día") is None
+
+
+@pytest.mark.parametrize("shape, adaptive_mode, adaptive_calls", [
+    ("escalar", "template", 1),
+    ("tabla_corta", "template", 1),
+    ("por_hora", "compact", 2),
+    ("detalle", "compact", 2),
+])
+def test_llm_calls_and_prompt_tokens_per_path(monkeypatch, shape, adaptive_mode, adaptive_calls):
+    # run_shape fija ANSWER_MODE y ANSWER_MEASURE_SAVINGS; monkeypatch los restaura al terminar
+    monkeypatch.setenv("ANSWER_MODE", "llm")
+    monkeypatch.setenv("ANSWER_MEASURE_SAVINGS", "1")
+    full = run_shape(SHAPES[shape], "llm")
+    adaptive = run_shape(SHAPES[shape], "adaptive")
+
+    assert full["answer_mode"] == "full" and full["llm_calls"] == 2 and full["tokens_saved"] == 0
+    assert adaptive["answer_mode"] == adaptive_mode and adaptive["llm_calls"] == adaptive_calls
+    # Plantilla: solo la llamada de SQL; compacto: la interpretación cuesta menos que el prompt completo
+    assert adaptive["llm_prompt_tokens_total"] < full["llm_prompt_tokens_total"]
+    assert adaptive["prompt_tokens"] < full["prompt_tokens"]
+    if adaptive_mode == "template":
+        assert adaptive["prompt_tokens"] == 0
+    assert adaptive["tokens_saved"] == full["prompt_tokens"] - adaptive["prompt_tokens"]
+
+
+HOURLY = pa.schema([("hora", pa.int64()), ("total_viajes", pa.int64()), ("tarifa_promedio", pa.float64())])
+
+
+def _hourly_batches(read: List[int], batches: int = 50, rows_per_batch: int = 100) -> Iterator[pa.RecordBatch]:
+    for i in range(batches):
+        read.append(i)
+        yield pa.RecordBatch.from_pydict({
+            "hora": [j % 24 for j in range(rows_per_batch)],
+            "total_viajes": list(range(i * rows_per_batch, (i + 1) * rows_per_batch)),
+            "tarifa_promedio": [12.5] * rows_per_batch,
+        }, schema=HOURLY)
+
+
+def test_template_check_uses_metadata_and_schema_before_reading():
+    read = []
+    assert render_template(QueryResult(_hourly_batches(read), HOURLY, 5000), question="¿Cuál es mayor?") is None
+    assert read == []
+    # Tres columnas solo admiten una fila: basta con leer hasta la segunda
+    assert render_template(QueryResult(_hourly_batches(read), HOURLY), question="¿Cuál es mayor?") is None
+    assert read == [0]
+
+
+def test_summary_reads_a_bounded_number_of_rows():
+    read = []
+    summary = summarize_result(QueryResult(_hourly_batches(read), HOURLY, 5000), max_rows=250)
+    assert len(read) == 3
+    assert summary.startswith("Filas: 5,000 (rangos sobre las primeras 250)")
+    assert "total_viajes (int64): mín 0, máx 249" in summary
+
+    read = []
+    summary = summarize_result(QueryResult(_hourly_batches(read), HOURLY), max_rows=250)
+    assert len(read) == 3 and summary.startswith("Filas: más de 250")
+
+    summary = summarize_result(QueryResult(_hourly_batches([], batches=2), HOURLY), max_rows=250)
+    assert summary.startswith("Filas: 200\n")
+
+
+def test_full_prompt_is_only_built_when_needed(monkeypatch):
+    monkeypatch.setenv("ANSWER_MODE", "adaptive")
+    monkeypatch.delenv("ANSWER_MEASURE_SAVINGS", raising=False)
+    llm = FakeLLM(latency=0)
+    resources = AgentResources(llm=llm, bq_client=FakeBigQueryClient(latency=0, rows=SHAPES["por_hora"]),
+                               memory=FakeMemory(0))
+    agent = GeminiAgent(resources=resources, use_cache=False)
+    monkeypatch.setattr(agent, "_interpretation_messages", lambda *args: pytest.fail("prompt completo armado"))
+    agent.get_response("¿Cuál tiene más viajes?")
+    assert agent.last_answer_metrics == {"answer_mode": "compact", "prompt_tokens": 144, "tokens_saved": 0}
+    assert llm.calls == 2
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+from agent.async_agent import AsyncGeminiAgent, AsyncScheduler
+from agent.context import ContextBuilder
+from agent.resources import AgentResources
+from agent.response_cache import ResponseCache
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+
+class SignalingMemory(FakeMemory):
+    """Memoria que avisa cuando empieza la búsqueda"""
+
+    def __init__(self):
+        super().__init__(latency=0.0)
+        self.started = threading.Event()
+
+    def get_relevant_history(self, query, n_results=3, user_id=None):
+        self.started.set()
+        return super().get_relevant_history(query, n_results, user_id)
+
+
+class WaitingContextBuilder(ContextBuilder):
+    """Arma la parte fija del prompt esperando a que la búsqueda en la memoria ya haya empezado"""
+
+    def __init__(self, memory: SignalingMemory):
+        super().__init__()
+        self.memory = memory
+        self.overlapped = []
+
+    def prepare(self, system_prompt, recent_history):
+        self.overlapped.append(self.memory.started.wait(timeout=2))
+        return super().prepare(system_prompt, recent_history)
+
+
+def make_agent(memory=None, **llm_kwargs) -> AsyncGeminiAgent:
+    memory = memory or FakeMemory(latency=0.0)
+    resources = AgentResources(llm=FakeLLM(latency=0.0, **llm_kwargs), bq_client=FakeBigQueryClient(latency=0.0),
+                               memory=memory, response_cache=ResponseCache())
+    return AsyncGeminiAgent(resources=resources, use_cache=False,
+                            scheduler=AsyncScheduler(max_concurrency=10, max_workers=4))
+
+
+def test_memory_lookup_overlaps_prompt_assembly():
+    memory = SignalingMemory()
+    agent = make_agent(memory)
+    agent.context_builder = WaitingContextBuilder(memory)
+
+    answer = asyncio.run(agent.aget_response("¿Cuál es la tarifa promedio por hora?", session_id="s1"))
+    assert answer.startswith("📊")
+    assert agent.context_builder.overlapped == [True]
+
+
+def test_answer_plan_runs_off_the_event_loop():
+    agent = make_agent()
+    threads = []
+    make_plan = agent._make_plan
+
+    def recording_plan(*args):
+        threads.append(threading.current_thread().name)
+        return make_plan(*args)
+    agent._make_plan = recording_plan
+
+    asyncio.run(agent.aget_response("¿Cuál es la tarifa promedio por hora?", session_id="s1"))
+    assert len(threads) == 1 and threads[0].startswith("agent-io")
+
+
+def test_concurrent_sessions_keep_their_own_metrics():
+    agent = make_agent()
+    questions = {f"s{i}": f"¿Cuál es la tarifa promedio por hora? #{i}" for i in range(8)}
+
+    async def run_all():
+        await asyncio.gather(*(agent.aget_response(q, session_id=s) for s, q in questions.items()))
+    asyncio.run(run_all())
+
+    trace_ids = set()
+    for session_id in questions:
+        call = agent.session_metrics[session_id]
+        assert call["trace"].attributes["session_id"] == session_id
+        assert call["context"]["context_tokens"] > 0
+        assert call["answer"]["answer_mode"] in ("template", "compact", "full")
+        trace_ids.add(call["trace"].trace_id)
+    assert len(trace_ids) == len(questions)
+
+
+def test_sessions_are_bounded_and_expire():
+    agent = make_agent()
+    agent.max_sessions = 2
+
+    async def ask(session_id):
+        await agent.aget_response(f"¿Cuál es la tarifa promedio por hora? {session_id}", session_id=session_id)
+    for session_id in ("a", "b", "c"):
+        asyncio.run(ask(session_id))
+    # La sesión menos reciente sale junto con sus métricas
+    assert list(agent.sessions) == ["b", "c"]
+    assert set(agent.session_metrics) == {"b", "c"}
+
+    agent.session_ttl = 0
+    asyncio.run(ask("d"))
+    assert list(agent.sessions) == ["d"] and set(agent.session_metrics) == {"d"}
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from agent.chat_agent import SQL_EXAMPLES
+from data.backends import EXTRACTED_AT_KEY, DuckDBBackend
+
+TABLE_REF = "bench-project.bench_dataset.taxi_trips"
+LAST_7_DAYS = f"""SELECT COUNT(*) AS total_viajes FROM `{TABLE_REF}`
+WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def write_trips(path: str, start: datetime, end: datetime, extracted_at: datetime = None) -> str:
+    """Un viaje por hora entre ``start`` y ``end``"""
+    hours = int((end - start).total_seconds() // 3600)
+    times = [start + timedelta(hours=h) for h in range(hours + 1)]
+    table = pa.table({"pickup_datetime": pa.array(times, pa.timestamp("us")),
+                      "fare_amount": [10.0] * len(times)})
+    if extracted_at is not None:
+        table = table.replace_schema_metadata({EXTRACTED_AT_KEY: extracted_at.isoformat().encode()})
+    pq.write_table(table, path)
+    return path
+
+
+def test_fresh_extract_answers_recent_window(tmp_path):
+    now = _now()
+    backend = DuckDBBackend(write_trips(str(tmp_path / "trips.parquet"), now - timedelta(days=10), now), TABLE_REF)
+    assert backend.can_answer(LAST_7_DAYS)
+
+
+def test_stale_extract_leaves_recent_window_to_bigquery(tmp_path):
+    now = _now()
+    path = write_trips(str(tmp_path / "trips.parquet"), now - timedelta(days=10), now - timedelta(days=3))
+    backend = DuckDBBackend(path, TABLE_REF)
+    assert backend.coverage_end <= now - timedelta(days=3)
+    assert not backend.can_answer(LAST_7_DAYS)
+
+    # Una ventana que termina antes del extracto sí se responde localmente
+    closed = LAST_7_DAYS + f" AND pickup_datetime < '{(now - timedelta(days=4)).date()}'"
+    assert backend.can_answer(closed)
+
+
+def test_extract_time_from_metadata(tmp_path):
+    now = _now()
+    # Sin viajes en las últimas horas, pero el extracto se tomó recién: está al día
+    path = write_trips(str(tmp_path / "trips.parquet"), now - timedelta(days=10), now - timedelta(hours=5),
+                       extracted_at=now)
+    backend = DuckDBBackend(path, TABLE_REF)
+    assert backend.coverage_end == now
+    assert backend.can_answer(LAST_7_DAYS)
+
+
+def test_or_on_the_time_column_goes_to_bigquery(tmp_path):
+    now = _now()
+    backend = DuckDBBackend(write_trips(str(tmp_path / "trips.parquet"), now - timedelta(days=10), now), TABLE_REF)
+    # (últimos 7 días) OR (cualquier viaje en efectivo) también lee viajes fuera del extracto
+    assert not backend.can_answer(LAST_7_DAYS + " OR fare_amount > 5")
+    assert not backend.can_answer(LAST_7_DAYS.replace("WHERE ", "WHERE NOT ("))
+    # Un OR que no toca la columna de tiempo no amplía la ventana
+    assert backend.can_answer(LAST_7_DAYS + " AND (fare_amount > 5 OR fare_amount < 1)")
+    assert not backend.can_answer(f"SELECT COUNT(*) FROM (SELECT * FROM `{TABLE_REF}` "
+                                  f"WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 1 DAY))")
+
+
+DAYS = {1: "Lunes", 2: "Martes", 3: "Miércoles", 4: "Jueves", 5: "Viernes", 6: "Sábado", 7: "Domingo"}
+
+
+@pytest.fixture
+def trips(tmp_path):
+    """Cuatro viajes conocidos: tres en los últimos días y uno de hace 40 días"""
+    base = datetime.combine(_now().date(), datetime.min.time()) - timedelta(days=3)
+    pickups = [base + timedelta(hours=8, minutes=30), base + timedelta(days=1, hours=8, minutes=10),
+               base + timedelta(days=1, hours=17, minutes=45), base - timedelta(days=40) + timedelta(hours=17)]
+    table = pa.table({
+        "pickup_datetime": pa.array(pickups, pa.timestamp("us")),
+        "dropoff_datetime": pa.array([p + timedelta(minutes=20) for p in pickups], pa.timestamp("us")),
+        "trip_distance": [2.0, 4.0, 6.0, 120.0],
+        "fare_amount": [10.0, 20.0, 30.0, 40.0],
+        "tip_amount": [1.0, 2.0, 3.0, 4.0],
+        "total_amount": [11.0, 22.0, 33.0, 44.0],
+    })
+    path = str(tmp_path / "trips.parquet")
+    pq.write_table(table, path)
+    return DuckDBBackend(path, TABLE_REF, complete=True), pickups
+
+
+def example_sql(name: str) -> str:
+    return SQL_EXAMPLES[name].split("```sql")[1].split("```")[0].format(table_ref=TABLE_REF)
+
+
+def rows(backend, sql):
+    return [tuple(row.values()) for row in backend.query(sql).to_pylist()]
+
+
+def test_hour_example_with_relative_date_filter(trips):
+    backend, _ = trips
+    # El viaje de hace 40 días queda fuera del filtro de 7 días
+    assert rows(backend, example_sql("hora")) == [(8, 2, 15.0, 1.5), (17, 1, 30.0, 3.0)]
+
+
+def test_day_of_week_example(trips):
+    backend, pickups = trips
+    expected = {}
+    for pickup, distance, total in zip(pickups, [2.0, 4.0, 6.0, 120.0], [11.0, 22.0, 33.0, 44.0]):
+        expected.setdefault(pickup.isoweekday() % 7, []).append((distance, total))
+    # BigQuery: DAYOFWEEK 1 = Domingo; el orden es por ese número
+    assert rows(backend, example_sql("dia")) == [
+        (DAYS[dow or 7], len(values), round(sum(d for d, _ in values) / len(values), 2),
+         round(sum(t for _, t in values) / len(values), 2))
+        for dow, values in sorted(expected.items())
+    ]
+
+
+def test_distance_example_filters_and_orders(trips):
+    backend, pickups = trips
+    assert rows(backend, example_sql("distancia")) == [
+        (6.0, 30.0, pickups[2], 17), (4.0, 20.0, pickups[1], 8), (2.0, 10.0, pickups[0], 8)]
+
+
+def test_date_trunc_and_date_filters(trips):
+    backend, pickups = trips
+    by_month = rows(backend, f"""SELECT DATE_TRUNC(DATE(pickup_datetime), MONTH) AS mes, COUNT(*) AS viajes
+FROM `{TABLE_REF}` GROUP BY mes ORDER BY mes""")
+    months = {}
+    for pickup in pickups:
+        months[pickup.date().replace(day=1)] = months.get(pickup.date().replace(day=1), 0) + 1
+    assert [(getattr(m, "date", lambda: m)(), n) for m, n in by_month] == sorted(months.items())
+
+    recent = rows(backend, f"""SELECT COUNT(*) AS viajes,
+    ROUND(AVG(TIMESTAMP_DIFF(dropoff_datetime, pickup_datetime, MINUTE)), 1) AS minutos
+FROM `{TABLE_REF}` WHERE DATE(pickup_datetime) >= DATE_SUB(CURRENT_DATE(), INTERVAL 5 DAY)
+    AND pickup_datetime < TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 1 HOUR)""")
+    assert recent == [(3, 20.0)]
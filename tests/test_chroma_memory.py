@@ -0,0 +1,54 @@
+from benchmark.memory_bench import HashEmbeddingFunction
+from memory.chroma_memory import ChromaMemory
+
+
+def make_memory(tmp_path, batch_size=4):
+    return ChromaMemory(persist_dir=str(tmp_path / "chroma"), embedding_function=HashEmbeddingFunction(),
+                        batch_size=batch_size, user_id="ana")
+
+
+def count_upserts(memory):
+    calls = []
+    upsert = memory.collection.upsert
+
+    def recording(**kwargs):
+        calls.append(len(kwargs["ids"]))
+        return upsert(**kwargs)
+    memory.collection.upsert = recording
+    return calls
+
+
+def test_search_reads_the_buffer_without_flushing(tmp_path):
+    memory = make_memory(tmp_path)
+    calls = count_upserts(memory)
+    # Conversación: cada turno agrega y luego busca
+    for i in range(4):
+        memory.add_interaction(f"pregunta {i}", f"respuesta {i}")
+        found = memory.get_relevant_items("pregunta", n_results=10)
+        assert {item["question"] for item in found} == {f"pregunta {j}" for j in range(i + 1)}
+    # Un solo upsert con el lote completo
+    assert calls == [4]
+    assert len(memory.get_relevant_items("pregunta", n_results=10)) == 4
+
+
+def test_buffer_is_scoped_to_the_user(tmp_path):
+    memory = make_memory(tmp_path)
+    memory.add_interaction("tarifa de luis", "12 USD", user_id="luis")
+    assert memory.get_relevant_items("tarifa", user_id="ana") == []
+    assert [item["question"] for item in memory.get_relevant_items("tarifa", user_id="luis")] == ["tarifa de luis"]
+
+
+def test_failed_flush_keeps_pending_items(tmp_path):
+    memory = make_memory(tmp_path, batch_size=100)
+    memory.add_interaction("pregunta", "respuesta")
+    upsert = memory.collection.upsert
+
+    def failing(**kwargs):
+        raise ConnectionError("Chroma no disponible")
+    memory.collection.upsert = failing
+    memory.flush()
+    assert memory.count() == 1
+
+    memory.collection.upsert = upsert
+    memory.flush()
+    assert memory.collection.count() == 1 and not memory._buffer
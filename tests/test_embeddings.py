@@ -0,0 +1,101 @@
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import memory.embeddings as embeddings
+from memory.embeddings import EmbeddingService
+
+LOAD_SECONDS = 0.2
+
+
+class FakeSentenceTransformer:
+    """Modelo de prueba: tarda LOAD_SECONDS en cargar y registra cada llamada a encode"""
+
+    loads = []
+
+    def __init__(self, model_name, device=None, **kwargs):
+        time.sleep(LOAD_SECONDS)
+        self.loads.append((model_name, kwargs))
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.batches.append(list(texts))
+        time.sleep(0.005)
+        return np.asarray([[float(len(text)), 1.0] for text in texts])
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    FakeSentenceTransformer.loads = []
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=FakeSentenceTransformer))
+    monkeypatch.setattr(embeddings, "_service", None)
+
+
+@pytest.mark.parametrize("backend, kwargs", [
+    ("torch", {}),
+    ("onnx", {"backend": "onnx"}),
+    ("onnx-int8", {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_quint8_avx2.onnx"}}),
+])
+def test_model_loads_lazily_once_per_backend(backend, kwargs):
+    service = EmbeddingService(backend=backend, batch_window_ms=0)
+    assert FakeSentenceTransformer.loads == []
+
+    cold_start = service.warmup()
+    start = time.perf_counter()
+    service(["¿Cuál es la tarifa promedio?"])
+    encode_latency = time.perf_counter() - start
+
+    # El arranque en frío paga la carga; las consultas siguientes solo codifican
+    assert cold_start >= LOAD_SECONDS and service.load_seconds >= LOAD_SECONDS
+    assert encode_latency < LOAD_SECONDS / 2
+    assert FakeSentenceTransformer.loads == [("all-MiniLM-L6-v2", kwargs)]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        EmbeddingService(backend="tpu")
+
+
+def test_process_wide_service_is_shared():
+    assert embeddings.get_embedding_service() is embeddings.get_embedding_service()
+    embeddings.get_embedding_service()(["hola"])
+    embeddings.get_embedding_service()(["chao"])
+    assert len(FakeSentenceTransformer.loads) == 1
+
+
+def test_repeated_texts_come_from_the_cache():
+    service = EmbeddingService(batch_window_ms=0, cache_size=2)
+    first = service(["a", "bb", "a"])
+    # Chroma puede envolver los vectores en arrays de numpy
+    assert list(first[0]) == list(first[2])
+    assert list(service(["bb"])[0]) == list(first[1])
+    assert service.stats["encoded"] == 2 and service.stats["cache_hits"] == 1
+    service(["ccc"])
+    # LRU de 2 entradas: "a" salió y se vuelve a codificar
+    service(["a"])
+    assert service.stats["encoded"] == 4
+
+
+def test_concurrent_requests_are_micro_batched():
+    service = EmbeddingService(batch_window_ms=50)
+    service.warmup()
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def encode(i):
+        barrier.wait()
+        results[i] = list(service([f"pregunta {i}"])[0])
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results[i] == [float(len(f"pregunta {i}")), 1.0] for i in range(8))
+    # Ocho solicitudes concurrentes en bastante menos de ocho llamadas al modelo (más la del warmup)
+    assert len(service.model.batches) - 1 < 8
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from benchmark.engine_bench import TABLE_REF, write_extract
+from data.backends import DuckDBBackend
+from data.bigquery_client import BigQueryClient
+from data.prefetch import Prefetcher, follow_up_variants
+from data.query_cache import QueryCache
+
+BY_HOUR = f"""SELECT EXTRACT(HOUR FROM pickup_datetime) AS hora, ROUND(AVG(tip_amount), 2) AS propina_promedio
+FROM `{TABLE_REF}` GROUP BY hora ORDER BY hora"""
+
+
+class CountingBackend(DuckDBBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executed = []
+
+    def query(self, sql):
+        self.executed.append(sql)
+        return super().query(sql)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for name, value in {"BQ_PROJECT_ID": "bench-project", "BQ_DATASET_ID": "bench_dataset",
+                        "BQ_TABLE_ID": "taxi_trips"}.items():
+        monkeypatch.setenv(name, value)
+    path = str(tmp_path / "taxi.parquet")
+    write_extract(path, 5000, 7)
+    client = BigQueryClient(cache=QueryCache(), backend=CountingBackend(path, TABLE_REF, complete=True))
+    client.prefetcher = Prefetcher(client, workers=2)
+    yield client
+    client.prefetcher.executor.shutdown(wait=True)
+
+
+def wait_idle(prefetcher, timeout=30):
+    deadline = time.time() + timeout
+    while prefetcher.pending() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_prefetched_duckdb_result_is_claimed_without_running_again(client):
+    client.query_data(BY_HOUR)
+    wait_idle(client.prefetcher)
+    report = client.prefetcher.report()
+    assert report["executed"] > 0 and report["not_cached"] == 0
+
+    # Un seguimiento (otra métrica) ya está en la caché: no vuelve al motor
+    follow_up = next(v for v in follow_up_variants(BY_HOUR) if "fare_amount" in v)
+    executed = len(client.backend.executed)
+    result = client.query_data(follow_up)
+    assert len(client.backend.executed) == executed
+    assert result.num_rows == 24
+    assert client.prefetcher.report()["hits"] == 1
+
+
+def test_uncached_prefetch_is_not_marked_ready(client, monkeypatch):
+    # Si el resultado no cabe en la caché, la variante no queda como lista y se cuenta aparte
+    client.cache_max_rows = 0
+    client.query_data(BY_HOUR)
+    wait_idle(client.prefetcher)
+    report = client.prefetcher.report()
+    assert report["executed"] == 0 and report["not_cached"] > 0
+    assert not client.prefetcher._ready
@@ -0,0 +1,99 @@
+from typing import Iterator, List
+
+import pyarrow as pa
+import pytest
+
+from data.bigquery_client import BigQueryClient
+from data.query_cache import QueryCache
+from data.results import QueryResult
+
+QUERY = "SELECT fare_amount FROM bench-project.bench_dataset.taxi_trips"
+
+
+class CountingBatches:
+    """Lotes de una columna que registran cuántos se leyeron"""
+
+    def __init__(self, batches: int, rows_per_batch: int = 100):
+        self.batches = batches
+        self.rows_per_batch = rows_per_batch
+        self.read = 0
+
+    def __iter__(self) -> Iterator[pa.RecordBatch]:
+        for i in range(self.batches):
+            self.read += 1
+            values = [float(i * self.rows_per_batch + j) for j in range(self.rows_per_batch)]
+            yield pa.RecordBatch.from_pydict({"fare_amount": values})
+
+
+class StubBackend:
+    name = "bigquery"
+
+    def __init__(self, batches: CountingBatches, total_rows=None):
+        self.batches = batches
+        self.total_rows = total_rows
+
+    def query(self, sql: str) -> QueryResult:
+        return QueryResult(self.batches, total_rows=self.total_rows)
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    for name, value in {"BQ_PROJECT_ID": "bench-project", "BQ_DATASET_ID": "bench_dataset",
+                        "BQ_TABLE_ID": "taxi_trips", "QUERY_CACHE_MAX_ROWS": "500"}.items():
+        monkeypatch.setenv(name, value)
+
+    def make(backend: StubBackend) -> BigQueryClient:
+        return BigQueryClient(cache=QueryCache(), backend=backend)
+    return make
+
+
+def test_large_result_is_cached_only_after_it_is_read(make_client):
+    batches = CountingBatches(batches=50)
+    client = make_client(StubBackend(batches, total_rows=5000))
+
+    result = client.query_data(QUERY)
+    assert result.preview(5)[0] == {"fare_amount": "$0.00"}
+    # Guardarlo en la caché no lee el resto del stream
+    assert batches.read == 1
+    assert not client.cache.contains(QUERY)
+
+    assert len(result.to_pylist()) == 5000
+    assert client.cache.contains(QUERY)
+
+
+def test_result_without_row_count_is_read_only_up_to_the_cache_limit(make_client):
+    batches = CountingBatches(batches=50)
+    client = make_client(StubBackend(batches))
+
+    client.query_data(QUERY).preview(5)
+    # Sin total en los metadatos (DuckDB) se leen a lo más QUERY_CACHE_MAX_ROWS + 1 filas
+    assert batches.read == 6
+    assert not client.cache.contains(QUERY)
+
+
+def test_small_result_without_row_count_is_cached_immediately(make_client):
+    client = make_client(StubBackend(CountingBatches(batches=3)))
+
+    client.query_data(QUERY)
+    assert client.cache.contains(QUERY)
+
+
+def test_small_result_is_cached_immediately(make_client):
+    batches = CountingBatches(batches=3)
+    client = make_client(StubBackend(batches, total_rows=300))
+
+    client.query_data(QUERY)
+    assert client.cache.contains(QUERY)
+    assert client.query_data(QUERY).to_pylist()[-1] == {"fare_amount": 299.0}
+
+
+def test_row_count_uses_metadata_without_reading_batches():
+    batches = CountingBatches(batches=50)
+    result = QueryResult(batches, total_rows=5000)
+    assert result.row_count == 5000
+    assert batches.read == 1
+
+    unknown = QueryResult(CountingBatches(batches=2))
+    assert unknown.row_count is None
+    unknown.to_pylist()
+    assert unknown.row_count == 200
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import Counter
+
+from agent.rate_limiter import PRIORITY_FOLLOWUP, PRIORITY_NEW, RateLimitedLLM, RateLimiter
+
+
+class SlowLLM:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        time.sleep(self.latency)
+        return "📊 42"
+
+
+def _run(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_identical_prompts_in_flight_are_coalesced_and_counted():
+    limiter = RateLimiter()
+    llm = SlowLLM(latency=0.3)
+    client = RateLimitedLLM(llm, limiter)
+    messages = [{"role": "user", "content": "¿Tarifa promedio?"}]
+    barrier = threading.Barrier(20)
+    results = []
+
+    def ask():
+        barrier.wait()
+        results.append(client.invoke(messages))
+    _run([ask] * 20)
+
+    assert llm.calls == 1 and results == ["📊 42"] * 20
+    assert limiter.stats["coalesced"] == 19 and limiter.stats["granted"] == 1
+
+
+def test_queued_requests_wait_for_their_turn_without_polling():
+    # Un cupo cada 0,5 s y sin ráfaga: cada solicitud en cola espera a la anterior
+    limiter = RateLimiter(rpm=120, burst_seconds=0.5)
+    limiter.acquire()
+    checks = Counter()
+    try_acquire = limiter._try_acquire
+
+    def counting(ticket, tokens):
+        checks[ticket] += 1
+        return try_acquire(ticket, tokens)
+    limiter._try_acquire = counting
+
+    granted = []
+
+    def request(priority, name, delay=0.0):
+        def run():
+            time.sleep(delay)
+            limiter.acquire(priority=priority)
+            granted.append((name, time.monotonic()))
+        return run
+    start = time.monotonic()
+    _run([request(PRIORITY_NEW, "nueva"), request(PRIORITY_NEW, "segunda", 0.05),
+          request(PRIORITY_FOLLOWUP, "seguimiento", 0.1)])
+
+    # El seguimiento llega último pero pasa antes que las que esperaban turno
+    assert [name for name, _ in granted] in (["nueva", "seguimiento", "segunda"],
+                                             ["seguimiento", "nueva", "segunda"])
+    assert granted[-1][1] - start < 2.0
+    # Sondeando cada 50 ms la última habría revisado la cola ~20 veces; esperando el aviso, unas pocas
+    assert max(checks.values()) <= 5
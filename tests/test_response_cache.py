@@ -0,0 +1,152 @@
+import json
+import pickle
+import sqlite3
+import time
+from typing import Dict, List
+
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources, ConversationState
+from agent.response_cache import ResponseCache
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+
+FARE_SQL = """SELECT EXTRACT(HOUR FROM pickup_datetime) as hora, ROUND(AVG(fare_amount), 2) as tarifa_promedio
+FROM bench-project.bench_dataset.taxi_trips GROUP BY hora ORDER BY hora"""
+
+VOLATILE_SQL = """SELECT ROUND(AVG(fare_amount), 2) as tarifa_promedio
+FROM bench-project.bench_dataset.taxi_trips
+WHERE pickup_datetime >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)"""
+
+
+class StubLLM(FakeLLM):
+    """LLM sin latencia cuya respuesta depende de la última pregunta, para distinguir respuestas en caché"""
+
+    def __init__(self):
+        super().__init__(latency=0.0, sql=FARE_SQL)
+        self.answers: List[str] = []
+
+    def _reply(self, messages: List[Dict[str, str]]) -> str:
+        reply = super()._reply(messages)
+        if reply == self.answer:
+            reply = f"📊 Respuesta {self.calls}\n📝 Generada por el LLM de prueba"
+            self.answers.append(reply)
+        return reply
+
+
+def word_embedding(texts: List[str]) -> List[List[float]]:
+    """Embedding de bolsa de palabras sobre un vocabulario fijo"""
+    vocabulary = ["tarifa", "promedio", "hora", "propina", "distancia", "dia", "semana"]
+    return [[float(word in text.split()) for word in vocabulary] for text in texts]
+
+
+def make_resources(response_cache: ResponseCache = None):
+    llm, bq_client = StubLLM(), FakeBigQueryClient(latency=0.0)
+    resources = AgentResources(llm=llm, bq_client=bq_client, memory=FakeMemory(latency=0.0),
+                               response_cache=response_cache if response_cache is not None else ResponseCache())
+    # La consulta de estadísticas del catálogo de esquema no cuenta
+    bq_client.queries = 0
+    return resources, llm, bq_client
+
+
+def make_agent(resources, user_id: str) -> GeminiAgent:
+    agent = GeminiAgent(resources=resources, state=ConversationState(user_id=user_id))
+    # Siempre con el LLM: las plantillas evitarían la segunda llamada y la prueba no vería la diferencia
+    agent.answer_mode = "llm"
+    return agent
+
+
+def test_cache_hit_skips_llm_and_bigquery():
+    resources, llm, bq_client = make_resources()
+    first = make_agent(resources, "u1").get_response("¿Cuál es la tarifa promedio por hora?")
+    assert llm.calls == 2 and bq_client.queries == 1
+
+    # Otra conversación sin historial: misma pregunta (con otro formato) desde la caché exacta
+    second = make_agent(resources, "u2").get_response("cual es la TARIFA promedio por hora")
+    assert second == first
+    assert llm.calls == 2 and bq_client.queries == 1
+
+
+def test_semantic_hit_skips_llm_and_bigquery():
+    resources, llm, bq_client = make_resources(ResponseCache(embedding_function=word_embedding,
+                                                             similarity_threshold=0.9))
+    first = make_agent(resources, "u1").get_response("¿Cuál es la tarifa promedio por hora?")
+    second = make_agent(resources, "u2").get_response("Tarifa promedio en cada hora")
+    assert second == first
+    assert llm.calls == 2 and bq_client.queries == 1
+    assert resources.response_cache.stats["semantic_hits"] == 1
+
+
+def test_follow_up_is_not_shared_between_conversations():
+    resources, llm, bq_client = make_resources()
+    u1, u3 = make_agent(resources, "u1"), make_agent(resources, "u3")
+
+    u1.get_response("¿Cuál es la tarifa promedio por hora?")
+    u1_follow_up = u1.get_response("¿y por día de la semana?")
+    u3.get_response("¿Cuál es la distancia promedio?")
+    calls, queries = llm.calls, bq_client.queries
+
+    # Mismo seguimiento con otra conversación previa: se genera de nuevo
+    u3_follow_up = u3.get_response("¿y por día de la semana?")
+    assert u3_follow_up != u1_follow_up
+    assert llm.calls == calls + 2 and bq_client.queries == queries + 1
+
+
+def test_follow_up_hits_within_same_context():
+    resources, llm, bq_client = make_resources()
+    for user in ("u1", "u1"):
+        agent = make_agent(resources, user)
+        agent.get_response("¿Cuál es la tarifa promedio por hora?")
+        agent.get_response("¿y por día de la semana?")
+    # Segunda conversación idéntica del mismo usuario: ambas respuestas desde la caché
+    assert llm.calls == 4 and bq_client.queries == 2
+
+
+def test_volatile_answer_uses_short_ttl(tmp_path):
+    cache = ResponseCache(ttl_seconds=3600, volatile_ttl=60, disk_path=str(tmp_path / "responses.db"))
+    cache.put("¿Tarifa de la última semana?", sql=VOLATILE_SQL, answer="📊 $12")
+    cache.put("¿Tarifa por hora?", sql=FARE_SQL, answer="📊 $13")
+
+    volatile = cache.get("¿Tarifa de la última semana?")
+    assert volatile is not None and volatile.ttl_seconds == 60
+
+    # Pasado el TTL corto la respuesta volátil vence; la estable sigue vigente
+    for entry in cache._entries.values():
+        entry.created_at -= 120
+    assert cache.get("¿Tarifa de la última semana?") is None
+    assert cache.get("¿Tarifa por hora?") is not None
+
+    # Las respuestas volátiles no se comparten por disco con otros procesos
+    other = ResponseCache(disk_path=str(tmp_path / "responses.db"))
+    assert other.get("¿Tarifa por hora?") is not None
+    assert other.get("¿Tarifa de la última semana?") is None
+
+
+def test_disk_tier_stores_json(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(embedding_function=word_embedding, disk_path=path)
+    cache.put("¿Tarifa promedio por hora?", sql=FARE_SQL, answer="📊 $13", scope="ana")
+
+    with sqlite3.connect(path) as conn:
+        payload = conn.execute("SELECT payload FROM response_cache").fetchone()[0]
+        # Una fila con otro formato (p. ej. pickle de una versión anterior) no se deserializa
+        conn.execute("INSERT INTO response_cache VALUES ('viejo', ?, ?)", (time.time(), pickle.dumps({"a": 1})))
+    stored = json.loads(payload)
+    assert stored["answer"] == "📊 $13" and stored["scope"] == "ana" and stored["embedding"]
+
+    other = ResponseCache(embedding_function=word_embedding, disk_path=path)
+    entry = other.get("tarifa promedio por hora", scope="ana")
+    assert entry is not None and entry.sql == FARE_SQL and entry.embedding == stored["embedding"]
+    assert "viejo" not in other._entries
+
+
+def test_expired_entries_are_dropped_lazily():
+    cache = ResponseCache(ttl_seconds=60)
+    cache.put("¿Tarifa por hora?", sql=FARE_SQL, answer="📊 $13")
+    cache.put("¿Propina por día?", sql=FARE_SQL, answer="📊 $2", scope="ana")
+    for entry in cache._entries.values():
+        entry.created_at -= 120
+
+    # Buscar otra pregunta no recorre la caché entera
+    assert cache.get("¿Distancia promedio?") is None
+    assert len(cache) == 2
+    assert cache.get("¿Tarifa por hora?") is None
+    assert list(cache._entries) == ["ana:propina por dia"]
@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from memory.chroma_memory import ChromaMemory
+from memory.retention import MemoryCompactor, RetentionPolicy
+
+
+class HashEmbedding(EmbeddingFunction):
+    """Vector pseudoaleatorio por texto: documentos distintos no quedan como duplicados"""
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def name() -> str:
+        return "hash_embedding"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbedding()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return [np.random.default_rng(int(hashlib.sha1(text.encode()).hexdigest()[:8], 16))
+                .standard_normal(32).astype(np.float32) for text in input]
+
+
+def make_memory(tmp_path, per_user):
+    memory = ChromaMemory(persist_dir=str(tmp_path / "chroma"), embedding_function=HashEmbedding())
+    now = time.time()
+    for user_id, count in per_user.items():
+        documents = [f"Q: pregunta {i} de {user_id}\nA: respuesta {i}" for i in range(count)]
+        metadatas = [{"ts": now - i, "user_id": user_id} for i in range(count)] if user_id else \
+            [{"ts": now - i} for i in range(count)]
+        memory.collection.add(ids=[memory._interaction_id(d, user_id) for d in documents],
+                              documents=documents, metadatas=metadatas)
+    return memory
+
+
+def user_count(memory, user_id):
+    return len(memory.collection.get(where={"user_id": user_id}, include=[])["ids"])
+
+
+def test_compaction_keeps_each_user_within_max_items(tmp_path):
+    memory = make_memory(tmp_path, {"ana": 100, "luis": 8})
+    policy = RetentionPolicy(max_items=10, max_age_days=0, summary_chunk=20)
+    report = MemoryCompactor(memory, policy, page_size=7).run_once(["tarifa"])
+
+    assert user_count(memory, "ana") <= 10
+    assert user_count(memory, "luis") == 8
+    summaries = memory.collection.get(where={"summary": True}, include=["metadatas"])
+    assert {m["user_id"] for m in summaries["metadatas"]} == {"ana"}
+    assert report["summarized"] + (10 - report["summaries_created"]) == 100
+
+
+def test_compaction_caps_summaries_when_max_items_is_small(tmp_path):
+    memory = make_memory(tmp_path, {"ana": 50, "": 6})
+    policy = RetentionPolicy(max_items=2, max_age_days=0, summary_chunk=5)
+    MemoryCompactor(memory, policy).run_once(["tarifa"])
+
+    assert user_count(memory, "ana") <= 2
+    # Las interacciones sin user_id también se compactan como un grupo propio
+    assert memory.collection.count() - user_count(memory, "ana") <= 2
+
+
+def test_count_is_per_user(tmp_path):
+    memory = make_memory(tmp_path, {"ana": 5, "luis": 3})
+    memory.batch_size = 100
+    memory.add_interaction("¿tarifa?", "10 USD", user_id="ana")
+    assert memory.count("ana") == 6
+    assert memory.count("luis") == 3
+    assert memory.count() == 9
+
+
+def test_snapshot_and_dedupe_are_scoped(tmp_path):
+    memory = make_memory(tmp_path, {"ana": 30, "luis": 3})
+    compactor = MemoryCompactor(memory, RetentionPolicy(max_items=100, max_age_days=0, dedupe_window=5))
+    report = compactor.run_once(["tarifa"])
+    assert report["before"]["sample_user"] == "ana"
+
+    # Un duplicado exacto solo se detecta dentro de la ventana de comparación
+    vectors = np.eye(8, dtype=np.float32)
+    items = [{"id": f"i{i}", "embedding": vectors[i % 8]} for i in range(8)] + [{"id": "dup", "embedding": vectors[0]}]
+    assert compactor._near_duplicates(items) == []
+    compactor.policy.dedupe_window = 8
+    assert compactor._near_duplicates(items) == ["dup"]
@@ -0,0 +1,47 @@
+import duckdb
+import pytest
+
+from benchmark.rollup_bench import QUERIES, ROLLUP, SOURCE, load
+from data.rollups import RollupRewriter
+
+ROWS = 500000
+
+
+@pytest.fixture(scope="module")
+def con():
+    con = duckdb.connect()
+    load(con, ROWS)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def rewriter():
+    return RollupRewriter(SOURCE, ROLLUP)
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_rewritten_queries_match_the_raw_table(con, rewriter, sql):
+    rewritten = rewriter.rewrite(sql)
+    assert rewritten is not None and ROLLUP in rewritten
+    raw = con.execute(sql).fetchall()
+    assert raw
+    assert con.execute(rewritten.replace("`", "")).fetchall() == raw
+
+
+def test_rollup_scans_far_fewer_rows(con):
+    rollup_rows = con.execute(f"SELECT COUNT(*) FROM {ROLLUP}").fetchone()[0]
+    # fecha × hora × tipo de pago: a lo sumo 4 filas por hora del rango, sin importar cuántos viajes haya
+    assert rollup_rows * 20 < ROWS
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT pickup_datetime, fare_amount FROM {SOURCE} LIMIT 10",
+    f"SELECT AVG(passenger_count) FROM {SOURCE}",
+    f"SELECT payment_type, COUNT(*) FROM {SOURCE} WHERE fare_amount > 10 GROUP BY payment_type",
+    f"SELECT COUNT(DISTINCT payment_type) FROM {SOURCE}",
+    f"SELECT payment_type, SUM(tip_amount) OVER (PARTITION BY payment_type) FROM {SOURCE}",
+    f"SELECT COUNT(*) FROM {SOURCE} WHERE pickup_datetime > (SELECT MIN(pickup_datetime) FROM {SOURCE})",
+])
+def test_queries_the_rollup_cannot_answer_are_left_alone(rewriter, sql):
+    assert rewriter.rewrite(sql) is None
@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from agent.auth import user_token
+
+KEY = "test-key"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_API_KEY", KEY)
+    monkeypatch.setenv("AGENT_RESOURCES_FACTORY", "benchmark.fakes:fake_resources")
+    monkeypatch.setenv("FAKE_LLM_LATENCY", "0")
+    monkeypatch.setenv("FAKE_BQ_LATENCY", "0")
+    monkeypatch.setenv("SESSION_STORE_PATH", str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(server, "_resources", None)
+    monkeypatch.setattr(server, "_sessions", None)
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def test_memory_endpoints_require_credentials(client):
+    assert client.post("/memory/ana/search", json={"query": "tarifa"}).status_code == 401
+    assert client.delete("/memory/ana").status_code == 401
+    assert client.delete("/memory/ana", headers={"X-API-Key": "otra"}).status_code == 401
+    assert client.delete("/memory/ana", headers={"X-API-Key": KEY}).status_code == 200
+
+
+def test_user_token_only_opens_its_own_namespace(client):
+    headers = {"X-User-Token": user_token("ana", KEY)}
+    assert client.post("/memory/ana/search", json={"query": "tarifa"}, headers=headers).status_code == 200
+    assert client.post("/memory/luis/search", json={"query": "tarifa"}, headers=headers).status_code == 401
+    assert client.delete("/memory/luis", headers=headers).status_code == 401
+    assert client.post("/chat", json={"question": "¿Tarifa promedio?", "user_id": "luis"},
+                       headers=headers).status_code == 401
+    # Sin user_id el token de un usuario no alcanza: haría falta la clave de servicio
+    assert client.post("/chat", json={"question": "¿Tarifa promedio?"}, headers=headers).status_code == 401
+
+
+def test_chat_sessions_are_scoped_to_the_user(client):
+    ana = {"X-User-Token": user_token("ana", KEY)}
+    response = client.post("/chat", json={"question": "¿Tarifa promedio?", "user_id": "ana", "session_id": "s1"},
+                           headers=ana)
+    assert response.status_code == 200
+    assert server.get_sessions().load("ana:s1")
+    assert server.get_sessions().load("s1") == []
+
+
+def test_endpoints_refuse_without_configured_key(client, monkeypatch):
+    monkeypatch.delenv("AGENT_API_KEY")
+    assert client.delete("/memory/ana", headers={"X-API-Key": KEY}).status_code == 503
+
+
+def test_memory_count_requires_credentials(client):
+    assert client.get("/memory").status_code == 401
+    # El total de la colección solo con la clave de servicio; el token alcanza para el propio conteo
+    assert client.get("/memory", headers={"X-User-Token": user_token("ana", KEY)}).status_code == 401
+    assert client.get("/memory", params={"user_id": "ana"},
+                      headers={"X-User-Token": user_token("ana", KEY)}).json() == {"count": 0}
+    assert client.get("/memory", headers={"X-API-Key": KEY}).status_code == 200
+
+
+def test_clear_removes_all_of_the_users_sessions(client):
+    ana = {"X-User-Token": user_token("ana", KEY)}
+    for session_id in (None, "s1", "s2"):
+        client.post("/chat", json={"question": "¿Tarifa promedio?", "user_id": "ana", "session_id": session_id},
+                    headers=ana)
+    client.post("/chat", json={"question": "¿Tarifa promedio?", "user_id": "anab", "session_id": "s1"},
+                headers={"X-API-Key": KEY})
+
+    assert client.delete("/memory/ana", headers=ana).status_code == 200
+    sessions = server.get_sessions()
+    assert sessions.load("ana") == [] and sessions.load("ana:s1") == [] and sessions.load("ana:s2") == []
+    assert sessions.load("anab:s1")
+    # El _ del prefijo no es comodín: borrar "an_b" no toca las sesiones de "anab"
+    assert client.delete("/memory/an_b", headers={"X-API-Key": KEY}).status_code == 200
+    assert sessions.load("anab:s1")
+
+
+def test_non_ascii_credentials_are_rejected(client):
+    headers = {"X-API-Key": "clé".encode("utf-8"), "X-User-Token": "tokén".encode("utf-8")}
+    assert client.delete("/memory/ana", headers=headers).status_code == 401
@@ -0,0 +1,49 @@
+import tracemalloc
+
+from agent.chat_agent import GeminiAgent
+from agent.resources import AgentResources, ConversationState
+from benchmark.fakes import FakeBigQueryClient, FakeLLM, FakeMemory
+from benchmark.session_bench import _rss_mb, run
+
+
+def _resources() -> AgentResources:
+    return AgentResources(llm=FakeLLM(latency=0), bq_client=FakeBigQueryClient(latency=0), memory=FakeMemory(0))
+
+
+def test_sessions_share_the_process_resources():
+    resources = _resources()
+    first = GeminiAgent(resources=resources, state=ConversationState(user_id="a"))
+    second = GeminiAgent(resources=resources, state=ConversationState(user_id="b"))
+    assert first.llm is second.llm and first.bq_client is second.bq_client
+    assert first.persistent_memory is second.persistent_memory
+    assert first.conversation_history is not second.conversation_history
+
+
+def test_session_cost_is_small_and_constant():
+    resources = _resources()
+    GeminiAgent(resources=resources, state=ConversationState(user_id="warmup"))
+
+    def create(count, offset):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        sessions = [GeminiAgent(resources=resources, state=ConversationState(user_id=f"user-{offset + i}"))
+                    for i in range(count)]
+        allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+        tracemalloc.stop()
+        return sessions, allocated / count
+
+    _, small_bytes = create(100, 0)
+    sessions, large_bytes = create(1000, 100)
+    # Una sesión es solo estado de conversación: unos pocos KB, sin crecer con la cantidad de sesiones
+    assert large_bytes < 16 * 1024
+    assert large_bytes < small_bytes * 2
+    assert len(sessions) == 1000
+
+
+def test_session_bench_reports_flat_rss():
+    rss_before = _rss_mb()
+    report = run([10, 1000])
+    assert [row["sessions"] for row in report] == [10, 1000]
+    assert all(row["create_ms_per_session"] < 5 for row in report)
+    # Mil sesiones caben en pocos MB de RSS (cada una recargaba los clientes y el modelo antes)
+    assert report[-1]["rss_mb"] - rss_before < 50